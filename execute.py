@@ -1,14 +1,101 @@
 #!/usr/bin/env python
 import argparse
+import sys
 
+from graphclone.graph.models import CloneSizeError
+from graphclone.main import CloneBounds
+from graphclone.main import InputOptions
+from graphclone.main import OutputOptions
 from graphclone.main import process
+from graphclone.utils.formats import DEFAULT_FORMAT
+from graphclone.utils.formats import FORMATS
+from graphclone.utils.formats import get_format
+from graphclone.utils.json_backends import AUTO_BACKEND
+from graphclone.utils.json_backends import BACKEND_NAMES
+from graphclone.utils.json_backends import PREFERRED_BACKENDS
+from graphclone.utils.stats import Stats
+
+
+def positive_int(text):
+  value = int(text)
+  if value < 1:
+    raise argparse.ArgumentTypeError('{} is not a positive number'.format(text))
+  return value
 
 
 if __name__ == '__main__':
   parser = argparse.ArgumentParser(description='Clone an entity in the entity graph.')
-  parser.add_argument('input_file', help='input file containing valid json')
-  parser.add_argument('entity_id', type=int, help='entity to be cloned with its related entities')
+  parser.add_argument('input_file', help='input file (json by default, see --format)')
+  parser.add_argument('entity_id', type=int, nargs='+',
+                      help='entity to be cloned with its related entities '
+                           '(several ids are cloned in one pass over the same input)')
+  parser.add_argument('--compact', action='store_true',
+                      help='keep the graph in compact (array-backed) form, uses less memory')
+  parser.add_argument('--stream-input', action='store_true',
+                      help='parse input incrementally instead of loading the whole json first')
+  parser.add_argument('--stats', '--profile', nargs='?', const='-', metavar='FILE',
+                      help='report time and memory of every stage, and graph/clone sizes, '
+                           'as json to FILE (to stderr if FILE is omitted)')
+  parser.add_argument('--workers', type=int, default=1, metavar='N',
+                      help='resolve and build links, and encode json output, in N worker processes '
+                           '(implies --compact)')
+  parser.add_argument('--input', action='append', default=[], metavar='FILE', dest='extra_input_files',
+                      help='another input file added to the same graph, e.g. an edge list '
+                           '(can be repeated)')
+  parser.add_argument('--format', choices=sorted(FORMATS), dest='input_format',
+                      help='format of input files (chosen by file extension by default)')
+  parser.add_argument('--output-format', choices=sorted(FORMATS), default=DEFAULT_FORMAT,
+                      help='format of the output (default: json)')
+  parser.add_argument('--patch', action='append', default=[], metavar='FILE', dest='patch_files',
+                      help='json file with entities and links added to or removed from the input, '
+                           'applied before cloning (can be repeated); a snapshot input is then '
+                           'rebuilt into a full graph first, which can be slower than parsing json')
+  parser.add_argument('--max-depth', type=int, metavar='N',
+                      help='only clone entities at most N links away from the cloned entity '
+                           '(this and the other bounds rebuild a snapshot input into a full graph)')
+  parser.add_argument('--max-entities', type=int, metavar='N',
+                      help='fail without output if a clone would copy more than N entities')
+  parser.add_argument('--name-pattern', metavar='REGEX',
+                      help='only clone (and traverse) entities whose name matches REGEX')
+  parser.add_argument('--description-pattern', metavar='REGEX',
+                      help='only clone (and traverse) entities whose description matches REGEX')
+  parser.add_argument('--dry-run', action='store_true',
+                      help='clone nothing, output json with the number of entities and links '
+                           'the clones would add instead')
+  parser.add_argument('--sample', type=positive_int, metavar='N', dest='sample_size',
+                      help='with --dry-run, stop counting after links of N entities of every '
+                           'clone (the counts are only lower bounds then, "lower_bound" is true)')
+  parser.add_argument('--json-backend', choices=BACKEND_NAMES, default=AUTO_BACKEND,
+                      help='json parser for the input (default: the fastest one installed '
+                           'of {})'.format(', '.join(PREFERRED_BACKENDS)))
   args = parser.parse_args()
 
-  output = process(args.input_file, args.entity_id)
-  print(output)
+  stats = Stats() if args.stats else None
+
+  # output is written to stdout while it is encoded
+  output_format = get_format(args.output_format)
+  output_file = sys.stdout.buffer if output_format.binary and not args.dry_run else sys.stdout
+  input_options = InputOptions(
+    input_format=args.input_format, extra_input_files=args.extra_input_files,
+    stream_input=args.stream_input, json_backend=args.json_backend,
+    patch_files=args.patch_files)
+  bounds = CloneBounds(
+    max_depth=args.max_depth, max_entities=args.max_entities,
+    name_pattern=args.name_pattern, description_pattern=args.description_pattern)
+  output_options = OutputOptions(output_format=args.output_format, output_file=output_file)
+  try:
+    process(args.input_file, args.entity_id, compact=args.compact, workers=args.workers,
+            input_options=input_options, bounds=bounds, output_options=output_options,
+            dry_run=args.dry_run, sample_size=args.sample_size, stats=stats)
+  except CloneSizeError as e:
+    sys.exit('error: {}'.format(e))
+  if output_format.name == DEFAULT_FORMAT or args.dry_run:
+    sys.stdout.write('\n')
+
+  if stats is not None:
+    stats.close()
+    if args.stats == '-':
+      stats.write(sys.stderr)
+    else:
+      with open(args.stats, 'w') as file:
+        stats.write(file)
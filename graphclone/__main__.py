@@ -0,0 +1,79 @@
+"""
+Command line entry point for long-running and maintenance commands
+(one-off clones are done with execute.py).
+
+  python -m graphclone serve --socket /tmp/graphclone.sock big=big.json
+  python -m graphclone snapshot big.json big.snapshot
+"""
+import argparse
+import asyncio
+import sys
+
+from graphclone.graph.models import CompactGraph
+from graphclone.graph.parallel import build_compact_graph
+from graphclone.graph.snapshot import write_snapshot
+from graphclone.server import CloneServer
+from graphclone.utils.formats import FORMATS
+from graphclone.utils.formats import read_records
+
+
+def serve(args):
+  server = CloneServer()
+  for graph_spec in args.graphs:
+    name, separator, input_file = graph_spec.partition('=')
+    if not separator:
+      raise SystemExit('graphs have to be given as name=input_file: {}'.format(graph_spec))
+    graph = server.load(name, input_file, reachability_index=args.reachability_index)
+    sys.stderr.write('loaded {} ({} entities)\n'.format(name, graph.get_entity_count()))
+
+  try:
+    asyncio.run(server.serve(socket_path=args.socket, host=args.host, port=args.port))
+  except KeyboardInterrupt:
+    pass
+
+
+def snapshot(args):
+  # links are sorted, so the snapshot can be used with and without sorting
+  records = read_records(args.input_file, args.format)
+  if args.workers > 1:
+    graph = build_compact_graph(records, sort_links=True, workers=args.workers)
+  else:
+    graph = CompactGraph.from_records(records, sort_links=True)
+  write_snapshot(graph, args.snapshot_file)
+  sys.stderr.write('wrote {} ({} entities, {} links)\n'.format(
+    args.snapshot_file, graph.get_entity_count(), graph.get_link_count()))
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(prog='python -m graphclone')
+  commands = parser.add_subparsers(dest='command', metavar='command')
+  commands.required = True
+
+  serve_parser = commands.add_parser(
+    'serve', help='keep graphs in memory and serve clone requests (see graphclone.server)')
+  serve_parser.add_argument('graphs', nargs='+', metavar='name=input_file',
+                            help='graph to load and the name to serve it as')
+  address = serve_parser.add_mutually_exclusive_group(required=True)
+  address.add_argument('--socket', help='path of the Unix socket to listen on')
+  address.add_argument('--port', type=int, help='TCP port to listen on')
+  serve_parser.add_argument('--host', default='127.0.0.1', help='TCP host to listen on')
+  serve_parser.add_argument('--reachability-index', action='store_true',
+                            help='cache traversals of cloned entities (faster repeated clones, more memory)')
+  serve_parser.set_defaults(run=serve)
+
+  snapshot_parser = commands.add_parser(
+    'snapshot', help='write a binary snapshot of a json input (loaded much faster, see graphclone.graph.snapshot)')
+  snapshot_parser.add_argument('input_file', help='input file (json by default, see --format)')
+  snapshot_parser.add_argument('--format', choices=sorted(FORMATS),
+                               help='format of the input file (chosen by file extension by default)')
+  snapshot_parser.add_argument('snapshot_file', help='snapshot file to write')
+  snapshot_parser.add_argument('--workers', type=int, default=1, metavar='N',
+                               help='resolve and build links in N worker processes')
+  snapshot_parser.set_defaults(run=snapshot)
+
+  args = parser.parse_args(argv)
+  args.run(args)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,7 @@
+"""
+Benchmarks for parsing, building, cloning and serializing graphs.
+
+Run with:
+
+  python -m graphclone.benchmarks --help
+"""
@@ -0,0 +1,3 @@
+from graphclone.benchmarks.run import main
+
+main()
@@ -0,0 +1,121 @@
+"""
+Seeded generators of synthetic input graphs.
+
+Every generator takes the number of entities and a seed, and yields
+(section, record) pairs (see Graph.from_records()):
+all entities first (with ids 1..size), then all links. Entity 1 is
+always a good root to clone from.
+"""
+import json
+import random
+
+
+def _entities(size):
+  for entity_id in range(1, size + 1):
+    record = {'entity_id': entity_id, 'name': 'Entity{}'.format(entity_id)}
+    if entity_id % 10 == 0:
+      record['description'] = 'Description of entity {}'.format(entity_id)
+    yield 'entities', record
+
+
+def _link(from_id, to_id):
+  return 'links', {'from': from_id, 'to': to_id}
+
+
+def chain(size, seed=0):
+  """ 1 -> 2 -> ... -> size """
+  for record in _entities(size):
+    yield record
+  for entity_id in range(1, size):
+    yield _link(entity_id, entity_id + 1)
+
+
+def fan_out(size, seed=0):
+  """ 1 -> every other entity """
+  for record in _entities(size):
+    yield record
+  for entity_id in range(2, size + 1):
+    yield _link(1, entity_id)
+
+
+def dense_dag(size, seed=0, degree=8):
+  """
+  Chain 1 -> 2 -> ... -> size, plus up to degree - 1 links
+  from every entity to random entities with bigger ids.
+  """
+  rng = random.Random(seed)
+  for record in _entities(size):
+    yield record
+  for entity_id in range(1, size):
+    yield _link(entity_id, entity_id + 1)
+    for _ in range(degree - 1):
+      yield _link(entity_id, rng.randint(entity_id + 1, size))
+
+
+def cyclic(size, seed=0, back_links=2):
+  """
+  Chain 1 -> 2 -> ... -> size, plus back_links links
+  from every entity to random entities with smaller ids
+  (so most entities are in one big cycle).
+  """
+  rng = random.Random(seed)
+  for record in _entities(size):
+    yield record
+  for entity_id in range(1, size):
+    yield _link(entity_id, entity_id + 1)
+  for entity_id in range(2, size + 1):
+    for _ in range(back_links):
+      yield _link(entity_id, rng.randint(1, entity_id - 1))
+
+
+def power_law(size, seed=0, links_per_entity=2):
+  """
+  Preferential attachment: every new entity gets links from
+  links_per_entity existing entities, chosen proportionally to
+  the number of links they already have (so a few entities
+  become hubs with huge fan-outs).
+  """
+  rng = random.Random(seed)
+  for record in _entities(size):
+    yield record
+  # every entity appears here once, plus once per link it has
+  targets = [1]
+  for entity_id in range(2, size + 1):
+    for from_id in set(rng.choice(targets) for _ in range(links_per_entity)):
+      yield _link(from_id, entity_id)
+      targets.append(from_id)
+    targets.append(entity_id)
+
+
+GENERATORS = {
+  'chain': chain,
+  'fan_out': fan_out,
+  'dense_dag': dense_dag,
+  'cyclic': cyclic,
+  'power_law': power_law,
+}
+
+
+def write_input_file(records, file):
+  """
+  Writes (section, record) pairs, entities first, to file
+  as a compact input json (without building it in memory).
+  Returns numbers of written entities and links.
+  """
+  counts = {'entities': 0, 'links': 0}
+  file.write('{"entities": [')
+  section = 'entities'
+  separator = ''
+  for record_section, record in records:
+    if record_section != section:
+      file.write('], "links": [')
+      section = record_section
+      separator = ''
+    file.write(separator)
+    file.write(json.dumps(record))
+    separator = ', '
+    counts[section] += 1
+  if section == 'entities':
+    file.write('], "links": [')
+  file.write(']}')
+  return counts['entities'], counts['links']
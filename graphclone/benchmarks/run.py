@@ -0,0 +1,150 @@
+"""
+Times the stages of cloning (parse, build, clone, to_dict, dumps)
+on generated graphs and prints the results as json.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from graphclone.benchmarks.generators import GENERATORS
+from graphclone.benchmarks.generators import write_input_file
+from graphclone.graph.models import CompactGraph
+from graphclone.graph.models import Graph
+from graphclone.utils.parser import from_json_file
+
+try:
+  import resource
+except ImportError:
+  # not available on Windows, max_rss is not reported there
+  resource = None
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+
+# id of the entity cloned in every generated graph
+ROOT_ENTITY_ID = 1
+
+
+def measure(stages, stage, trace_memory, function, *args, **kwargs):
+  """
+  Calls function, recording its wall time (and, if trace_memory is
+  set, peak memory allocated while it ran and memory it allocated
+  that is still used when it returns) in stages[stage].
+  Returns what function returned.
+  """
+  gc.collect()
+  if trace_memory:
+    tracemalloc.start()
+  start = time.perf_counter()
+  result = function(*args, **kwargs)
+  stages[stage] = {'seconds': time.perf_counter() - start}
+  if trace_memory:
+    current, peak = tracemalloc.get_traced_memory()
+    stages[stage]['peak_bytes'] = peak
+    stages[stage]['allocated_bytes'] = current
+    tracemalloc.stop()
+  return result
+
+
+def run_benchmark(input_file, graph_class=Graph, trace_memory=False):
+  """
+  Runs all stages on input_file and returns their measurements.
+  """
+  stages = {}
+  json_dict = measure(stages, 'parse', trace_memory, from_json_file, input_file)
+  # built the way process() builds it
+  build_options = {} if graph_class is CompactGraph else {'track_predecessors': False}
+  graph = measure(stages, 'build', trace_memory, graph_class.from_dict, json_dict,
+                  sort_links=True, **build_options)
+  del json_dict
+  if trace_memory and graph.get_entity_count():
+    stages['build']['bytes_per_entity'] = (
+      stages['build']['allocated_bytes'] / graph.get_entity_count())
+  measure(stages, 'clone', trace_memory, graph.clone, ROOT_ENTITY_ID)
+  output_dict = measure(stages, 'to_dict', trace_memory, graph.to_dict)
+  measure(stages, 'dumps', trace_memory, json.dumps, output_dict, indent=4, sort_keys=True)
+  return stages
+
+
+def get_commit():
+  """ Gets current git commit of the repository (None if unknown). """
+  try:
+    output = subprocess.check_output(
+      ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(__file__),
+      stderr=subprocess.DEVNULL)
+  except (OSError, subprocess.CalledProcessError):
+    return None
+  return output.decode().strip()
+
+
+def get_max_rss():
+  """ Gets peak resident memory of the process in bytes (None if unknown). """
+  if resource is None:
+    return None
+  max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # bytes on macOS, kilobytes elsewhere
+  return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Benchmark cloning on generated graphs.')
+  parser.add_argument('--generators', default=','.join(sorted(GENERATORS)),
+                      help='comma separated generators (default: all of {})'.format(
+                        ', '.join(sorted(GENERATORS))))
+  parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES),
+                      help='comma separated numbers of entities')
+  parser.add_argument('--seed', type=int, default=0, help='seed of the generators')
+  parser.add_argument('--compact', action='store_true', help='benchmark CompactGraph instead of Graph')
+  parser.add_argument('--trace-memory', action='store_true',
+                      help='record peak memory of every stage (tracemalloc, makes stages slower)')
+  parser.add_argument('--output', help='file to write results to (stdout by default)')
+  args = parser.parse_args(argv)
+
+  generator_names = [name for name in args.generators.split(',') if name]
+  for name in generator_names:
+    if name not in GENERATORS:
+      parser.error('unknown generator: {}'.format(name))
+  sizes = [int(size) for size in args.sizes.split(',') if size]
+  graph_class = CompactGraph if args.compact else Graph
+
+  results = []
+  with tempfile.TemporaryDirectory() as directory:
+    for name in generator_names:
+      for size in sizes:
+        input_file = os.path.join(directory, '{}_{}.json'.format(name, size))
+        with open(input_file, 'w') as file:
+          entities, links = write_input_file(GENERATORS[name](size, seed=args.seed), file)
+        stages = run_benchmark(input_file, graph_class, args.trace_memory)
+        os.remove(input_file)
+        results.append({
+          'generator': name,
+          'size': size,
+          'entities': entities,
+          'links': links,
+          'stages': stages,
+        })
+
+  report = {
+    'commit': get_commit(),
+    'python': platform.python_version(),
+    'graph': graph_class.__name__,
+    'seed': args.seed,
+    'max_rss_bytes': get_max_rss(),
+    'results': results,
+  }
+  if args.output:
+    with open(args.output, 'w') as file:
+      json.dump(report, file, indent=2)
+  else:
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+  main()
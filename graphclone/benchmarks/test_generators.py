@@ -0,0 +1,54 @@
+import io
+import json
+from unittest import TestCase
+
+from graphclone.benchmarks.generators import GENERATORS
+from graphclone.benchmarks.generators import write_input_file
+from graphclone.graph.models import Graph
+
+
+class TestGenerators(TestCase):
+
+  def test_generators_are_seeded(self):
+    for name, generator in GENERATORS.items():
+      self.assertListEqual(
+        list(generator(50, seed=1)), list(generator(50, seed=1)), name)
+
+  def test_generators_create_requested_number_of_entities(self):
+    for name, generator in GENERATORS.items():
+      graph = Graph.from_records(generator(50))
+      self.assertEqual(len(graph.entities), 50, name)
+
+  def test_generators_link_existing_entities(self):
+    for name, generator in GENERATORS.items():
+      for section, record in generator(50):
+        if section == 'links':
+          self.assertTrue(1 <= record['from'] <= 50, name)
+          self.assertTrue(1 <= record['to'] <= 50, name)
+
+
+class TestWriteInputFile(TestCase):
+
+  def test_write_input_file(self):
+    records = list(GENERATORS['cyclic'](20))
+    file = io.StringIO()
+
+    entities, links = write_input_file(iter(records), file)
+
+    json_dict = json.loads(file.getvalue())
+    self.assertEqual(entities, 20)
+    self.assertEqual(links, len(json_dict['links']))
+    self.assertListEqual(
+      [('entities', e) for e in json_dict['entities']] +
+      [('links', l) for l in json_dict['links']],
+      records)
+
+  def test_write_input_file_when_there_are_no_links(self):
+    file = io.StringIO()
+
+    write_input_file(iter([('entities', {'entity_id': 1, 'name': 'E1'})]), file)
+
+    self.assertDictEqual(json.loads(file.getvalue()), {
+      'entities': [{'entity_id': 1, 'name': 'E1'}],
+      'links': [],
+    })
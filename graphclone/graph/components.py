@@ -0,0 +1,123 @@
+"""
+Strongly connected components, found with an iterative version of
+Tarjan's algorithm (an explicit stack instead of recursion, so the
+depth of a graph is limited only by memory).
+
+Components are found in one depth-first traversal, which also gives
+the visiting order clones number their copies in, so a clone can be
+made from the components with the same ids (see Condensation).
+"""
+
+
+class Condensation(object):
+  """
+  Entities reachable from a root entity in depth-first visiting order
+  (root first), split into strongly connected components.
+
+  Components are lists of positions in entities (ascending), in
+  topological order of the condensation: a component only links to
+  itself and to components after it, so the first one holds the root.
+  """
+
+  def __init__(self, entities, components):
+    self.entities = entities
+    self.components = components
+
+  def __len__(self):
+    return len(self.entities)
+
+  def get_component_entities(self):
+    """
+    Gets components as lists of entities.
+    """
+    entities = self.entities
+    return [[entities[position] for position in component]
+            for component in self.components]
+
+
+def find_components(roots, get_successors, get_index, buffer):
+  """
+  Finds strongly connected components of nodes reachable from roots.
+  Returns (nodes in depth-first visiting order, components as lists
+  of positions in that order, depth of the deepest traversal).
+  Components are in reverse topological order (every component is
+  found after the components it links to).
+
+  :param roots:
+    nodes to start traversals from (in order), nodes visited
+    by an earlier traversal are skipped
+  :param get_successors:
+    function returning successors of a node
+  :param get_index:
+    function returning dense index of a node, or None if nodes
+    are dense indexes themselves
+  :param buffer:
+    started TraversalBuffer for the dense indexes, positions
+    of visited nodes are left in it
+  """
+  stamps = buffer.stamps
+  positions = buffer.positions
+  epoch = buffer.epoch
+
+  order = []
+  # lowest position reachable through the subtree of a
+  # position (by links to nodes on the component stack)
+  low = []
+  on_stack = []
+  component_stack = []
+  components = []
+  depth = 0
+
+  for root in roots:
+    index = root if get_index is None else get_index(root)
+    if stamps[index] == epoch:
+      continue
+    stamps[index] = epoch
+    positions[index] = len(order)
+    low.append(len(order))
+    on_stack.append(True)
+    component_stack.append(len(order))
+    order.append(root)
+
+    # each stack item holds position of a visited node and
+    # an iterator over its successors that are still to be visited
+    stack = [(len(order) - 1, iter(get_successors(root)))]
+    depth = max(depth, 1)
+    while stack:
+      position, successors = stack[-1]
+      for successor in successors:
+        index = successor if get_index is None else get_index(successor)
+        if stamps[index] != epoch:
+          stamps[index] = epoch
+          positions[index] = len(order)
+          low.append(len(order))
+          on_stack.append(True)
+          component_stack.append(len(order))
+          stack.append((len(order), iter(get_successors(successor))))
+          order.append(successor)
+          if len(stack) > depth:
+            depth = len(stack)
+          break
+        successor_position = positions[index]
+        if on_stack[successor_position] and successor_position < low[position]:
+          low[position] = successor_position
+      else:
+        # all successors have been visited
+        stack.pop()
+        if low[position] == position:
+          # position is the first node of a component,
+          # the rest of the component is above it
+          start = len(component_stack) - 1
+          while component_stack[start] != position:
+            start -= 1
+          component = component_stack[start:]
+          del component_stack[start:]
+          for member in component:
+            on_stack[member] = False
+          components.append(component)
+        elif stack:
+          parent = stack[-1][0]
+          if low[position] < low[parent]:
+            low[parent] = low[position]
+
+  return order, components, depth
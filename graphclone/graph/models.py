@@ -1,35 +1,300 @@
 import numbers
+import sys
+from array import array
+from bisect import bisect_left
+from collections import ChainMap
+from itertools import chain
+from itertools import islice
+from operator import attrgetter
+
+from graphclone.graph.components import Condensation
+from graphclone.graph.components import find_components
+from graphclone.graph.reachability import ReachabilityIndex
+from graphclone.graph.traversal import TraversalBufferPool
+
+try:
+  import numpy
+except ImportError:
+  # CompactGraph falls back to copying entities one by one
+  numpy = None
+
+def _iter_dict_records(json_dict):
+  """
+  Yields (section, record) pairs for entities and links
+  of a dictionary in the input format.
+  """
+  for section in ('entities', 'links'):
+    records = json_dict.get(section)
+    for record in records if isinstance(records, list) else []:
+      yield section, record
+
+
+def _add_records(graph, records):
+  """
+  Adds entities and links to the graph from (section, record) pairs,
+  where section is 'entities' or 'links' and record is a dictionary
+  in the input format. Pairs with other sections are ignored.
+
+  Records can come in any order: a link is added as soon as both
+  of its entities exist, the others are kept (as id pairs) until
+  all records are read. Links to unknown entities are dropped.
+  """
+  pending_links = []
+  for section, record in records:
+    if section == 'entities':
+      graph.add_entity_record(record)
+    elif section == 'links':
+      from_id = record['from']
+      to_id = record['to']
+      if graph.has_entity(from_id) and graph.has_entity(to_id):
+        graph.link_entities_by_id(from_id, to_id)
+      else:
+        pending_links.append((from_id, to_id))
+
+  for from_id, to_id in pending_links:
+    graph.link_entities_by_id(from_id, to_id)
+
+
+def _to_dict(graph):
+  """
+  Creates a dictionary in the input format from a graph
+  providing iter_entities() and iter_links().
+  """
+  json_dict = {
+    'entities': [],
+    'links': [],
+  }
+
+  for entity_id, name, description in graph.iter_entities():
+    entity_dict = {
+      'entity_id': entity_id,
+      'name': name,
+    }
+    if description is not None:
+      entity_dict['description'] = description
+    json_dict['entities'].append(entity_dict)
+
+  for from_id, to_id in graph.iter_links():
+    json_dict['links'].append({
+      'from': from_id,
+      'to': to_id
+    })
+
+  return json_dict
+
+
+def _iter_graph_records(graph):
+  """
+  Yields (section, record) pairs for entities and links of
+  a graph providing iter_entities() and iter_links().
+  """
+  for entity_id, name, description in graph.iter_entities():
+    record = {'entity_id': entity_id, 'name': name}
+    if description is not None:
+      record['description'] = description
+    yield 'entities', record
+  for from_id, to_id in graph.iter_links():
+    yield 'links', {'from': from_id, 'to': to_id}
+
+
+def _take(values, indexes):
+  """
+  Gets values of an int64 array at indexes (an int64 numpy array).
+  Arrays of graphs loaded from a snapshot provide take() themselves.
+  """
+  take = getattr(values, 'take', None)
+  if take is not None:
+    return take(indexes)
+  return numpy.frombuffer(values, dtype=numpy.int64)[indexes]
+
+
+def _build_csr(count, sources, targets, sort_key=None):
+  """
+  Builds CSR offsets/targets arrays for links between dense indexes
+  (sources in 0..count-1), dropping duplicates and sorting rows
+  with sort_key if it's given.
+  """
+  offsets = array('q', bytes(8 * (count + 1)))
+  for source in sources:
+    offsets[source + 1] += 1
+  for i in range(count):
+    offsets[i + 1] += offsets[i]
+
+  grouped = array('q', bytes(8 * len(sources)))
+  positions = offsets[:-1]
+  for source, target in zip(sources, targets):
+    grouped[positions[source]] = target
+    positions[source] += 1
+
+  # second pass drops duplicate links and sorts rows
+  row_offsets = array('q', [0])
+  row_targets = array('q')
+  for i in range(count):
+    row = grouped[offsets[i]:offsets[i + 1]]
+    if len(row) > 1:
+      row = set(row)
+      if sort_key is not None:
+        row = sorted(row, key=sort_key)
+    row_targets.extend(row)
+    row_offsets.append(len(row_targets))
+
+  return row_offsets, row_targets
+
+
+_get_id = attrgetter('id')
+_get_index = attrgetter('index')
+
+
+def _get_patch_records(patch, section):
+  records = patch.get(section)
+  return records if isinstance(records, list) else []
+
+
+class CloneSizeError(ValueError):
+  """
+  Raised when a clone would copy more entities than allowed
+  (nothing is copied then).
+  """
+
+
+def _get_size_error(root_entity, max_entities):
+  return CloneSizeError('clone of {} would copy more than {} entities'.format(
+    root_entity.id, max_entities))
+
+
+class CloneSize(object):
+  """
+  Size of a clone, counted without copying anything
+  (see Graph.estimate_clone()).
+  """
+
+  def __init__(self, entities, links, predecessor_links, lower_bound=False):
+    """
+    :param entities:
+      number of entities the clone copies
+    :param links:
+      number of links between the copies
+    :param predecessor_links:
+      number of links from predecessors of the root to its copy
+    :param lower_bound:
+      True for sampled traversals that stopped early: entities
+      and links are then lower bounds (entities found so far and
+      links of the entities that were counted), the clone can
+      be any larger
+    """
+    self.entities = entities
+    self.links = links
+    self.predecessor_links = predecessor_links
+    self.lower_bound = lower_bound
+
+  def __repr__(self):
+    return 'CloneSize(entities={}, links={}, predecessor_links={}, lower_bound={})'.format(
+      self.entities, self.links, self.predecessor_links, self.lower_bound)
+
+  def to_dict(self):
+    return {
+      'entities': self.entities,
+      'links': self.links,
+      'predecessor_links': self.predecessor_links,
+      'lower_bound': self.lower_bound,
+    }
+
+
+def _get_clone_size(found, counted, links, predecessor_links):
+  """
+  Gets CloneSize of a traversal that found entities and
+  counted links of some of them (all of them if it finished).
+  """
+  return CloneSize(found, links, predecessor_links, lower_bound=counted != found)
+
+
+# shared by entities without successors/predecessors,
+# replaced with a set when the first one is added
+_NO_ENTITIES = frozenset()
+
 
 class Entity(object):
   """
   Class that represents entities/vertices in the graph
+
+  Sorted successors/predecessors are cached until links are added,
+  so successors and predecessors should only be changed with
+  add_successor() and add_predecessor().
+
+  Entities have no __dict__ and share an empty frozenset until
+  they get successors/predecessors, since graphs hold millions
+  of them (and most have no successors or no predecessors).
   """
 
+  __slots__ = ('id', 'name', 'description', 'successors', 'predecessors',
+               'index', 'sorted_successors', 'sorted_predecessors')
+
   def __init__(self, id, name, description=None):
     self.id = id
     self.name = name
     self.description = description
-    self.successors = set()
-    self.predecessors = set()
+    self.successors = _NO_ENTITIES
+    self.predecessors = _NO_ENTITIES
+    # dense index in the graph the entity is added to
+    # (see Graph.add_entity()), None until then
+    self.index = None
+    # successors/predecessors sorted by id, None until needed
+    self.sorted_successors = None
+    self.sorted_predecessors = None
 
   def __repr__(self):
     return "Entity[{}, {}]".format(self.id, self.name)
 
   def get_sorted_successors(self, get_sorted=False):
-    return sorted(self.successors, key=lambda e: e.id)
+    """
+    Gets successors sorted by id (the returned
+    list is cached, it shouldn't be changed).
+    """
+    if self.sorted_successors is None:
+      if not self.successors:
+        # not cached, leaves would all get a list
+        return ()
+      self.sorted_successors = sorted(self.successors, key=_get_id)
+    return self.sorted_successors
   
   def add_successor(self, successor):
-    if successor is None:
+    if successor is None or successor in self.successors:
       return
+    if self.successors is _NO_ENTITIES:
+      self.successors = set()
     self.successors.add(successor)
+    self.sorted_successors = _add_sorted(self.sorted_successors, successor)
 
   def get_sorted_predecessors(self, get_sorted=False):
-    return sorted(self.predecessors, key=lambda e: e.id)
+    """
+    Gets predecessors sorted by id (the returned
+    list is cached, it shouldn't be changed).
+    """
+    if self.sorted_predecessors is None:
+      if not self.predecessors:
+        return ()
+      self.sorted_predecessors = sorted(self.predecessors, key=_get_id)
+    return self.sorted_predecessors
   
   def add_predecessor(self, predecessor):
-    if predecessor is None:
+    if predecessor is None or predecessor in self.predecessors:
       return
+    if self.predecessors is _NO_ENTITIES:
+      self.predecessors = set()
     self.predecessors.add(predecessor)
+    self.sorted_predecessors = _add_sorted(self.sorted_predecessors, predecessor)
+
+  def remove_successor(self, successor):
+    if successor not in self.successors:
+      return
+    self.successors.remove(successor)
+    self.sorted_successors = None
+
+  def remove_predecessor(self, predecessor):
+    if predecessor not in self.predecessors:
+      return
+    self.predecessors.remove(predecessor)
+    self.sorted_predecessors = None
 
   def copy(self, cloned_id):
     """
@@ -42,24 +307,66 @@ class Entity(object):
       description=self.description
     )
 
+def _add_sorted(sorted_entities, entity):
+  """
+  Adds entity to a cached list of entities sorted by id. Entities
+  with bigger ids (e.g. copies) are appended, otherwise the cache
+  is dropped (None is returned) and sorted again when needed.
+  """
+  if sorted_entities is None:
+    return None
+  if sorted_entities and sorted_entities[-1].id >= entity.id:
+    return None
+  sorted_entities.append(entity)
+  return sorted_entities
+
+
 class Graph(object):
   """
   Graph representation. 
   Contains a map/dictionary of all entities 
   (stored as entity_id -> entity pairs).
+
+  Entities also get dense indexes (0..N-1, in the order they are
+  added), so traversals can mark visited entities by index instead
+  of hashing ids: they stamp them with the epoch of a buffer taken
+  from traversal_buffers (see TraversalBufferPool), which is reused
+  without clearing it. An entity should only be added to one
+  graph; an entity replacing another with the same id takes over
+  its index.
   """
 
-  def __init__(self, sort_links=False):
+  def __init__(self, sort_links=False, track_predecessors=True):
     """
     :param sort_links: 
       Sorts links (successors/predecessors) 
       by entity id when cloning or converting the graph
       to a dictionary.
+    :param track_predecessors:
+      if set to False, entities don't get predecessors and
+      get_predecessors_for() looks for them through the graph
+      (less memory for graphs cloned once or a few times,
+      see enable_predecessor_tracking())
     """
     self.entities = {}
+    # dense index -> entity
+    self.entities_by_index = []
+    # entity ids in ascending order, None until needed
+    self.sorted_entity_ids = None
     # used when copying/cloning entities into the graph
     self.next_entity_id = 1
     self.sort_links = True
+    # see enable_reachability_index()
+    self.reachability_index = None
+    # if set to True, clones copy strongly connected components
+    # as blocks (see copy_condensation())
+    self.copy_by_components = False
+    # deepest depth-first traversal so far (number of entities
+    # on the traversal stack), reported by process() stats
+    self.max_traversal_depth = 0
+    # visited marks and positions reused by traversals
+    self.traversal_buffers = TraversalBufferPool()
+    self.track_predecessors = track_predecessors
 
   def add_entity(self, entity):
     """
@@ -71,10 +378,73 @@ class Graph(object):
     if entity is None:
       return
     
+    old_entity = self.entities.get(entity.id)
+    if old_entity is not None and self.reachability_index is not None:
+      self.reachability_index.invalidate(entity.id)
+    if old_entity is not None and old_entity.index is not None:
+      entity.index = old_entity.index
+      self.entities_by_index[entity.index] = entity
+    else:
+      entity.index = len(self.entities_by_index)
+      self.entities_by_index.append(entity)
+    if old_entity is None:
+      self._add_sorted_entity_id(entity.id)
     self.entities[entity.id] = entity
     if entity.id >= self.next_entity_id:
         self.next_entity_id = entity.id + 1
 
+  def remove_entity(self, entity_id):
+    """
+    Removes entity with the given id together with its links
+    (from and to it). Returns the removed entity (None if
+    there is no such entity).
+
+    The dense index of the entity is not reused.
+    """
+    entity = self.entities.pop(entity_id, None)
+    if entity is None:
+      return None
+    if self.reachability_index is not None:
+      # plans containing the entity also contain its predecessors
+      self.reachability_index.invalidate(entity_id)
+    for successor in entity.successors:
+      successor.remove_predecessor(entity)
+    for predecessor in list(self.get_predecessors_for(entity)):
+      predecessor.remove_successor(entity)
+    entity.successors = _NO_ENTITIES
+    entity.predecessors = _NO_ENTITIES
+    entity.sorted_successors = None
+    entity.sorted_predecessors = None
+
+    index = entity.index
+    if (index is not None and index < len(self.entities_by_index)
+        and self.entities_by_index[index] is entity):
+      self.entities_by_index[index] = None
+    ids = self.sorted_entity_ids
+    if ids is not None:
+      del ids[bisect_left(ids, entity_id)]
+    if entity_id + 1 == self.next_entity_id:
+      # the same as if the graph was created without the entity
+      self.next_entity_id = max(self.entities, default=0) + 1
+    return entity
+
+  def _add_sorted_entity_id(self, entity_id):
+    ids = self.sorted_entity_ids
+    if ids is None:
+      return
+    # ids of copies are bigger than all others
+    if ids and ids[-1] >= entity_id:
+      self.sorted_entity_ids = None
+    else:
+      ids.append(entity_id)
+
+  def get_index_count(self):
+    """
+    Gets number of dense indexes given to entities
+    (every entity index is smaller than it).
+    """
+    return len(self.entities_by_index)
+
   def copy_and_add_entity(self, original_entity):
     """
     Copies original_entity and adds the copy to the graph.
@@ -94,39 +464,550 @@ class Graph(object):
     """
     if from_entity is None or to_entity is None:
       return
+    if (self.reachability_index is not None
+        and to_entity not in from_entity.successors):
+      self.reachability_index.invalidate(from_entity.id)
     from_entity.add_successor(to_entity)
-    to_entity.add_predecessor(from_entity)
+    if self.track_predecessors:
+      to_entity.add_predecessor(from_entity)
+
+  def unlink_entities_by_id(self, from_id, to_id):
+    from_entity = self.entities.get(from_id)
+    to_entity = self.entities.get(to_id)
+    self.unlink_entities(from_entity, to_entity)
+
+  def unlink_entities(self, from_entity, to_entity):
+    """
+    Removes link between entities (if there is one).
+    """
+    if from_entity is None or to_entity not in from_entity.successors:
+      return
+    if self.reachability_index is not None:
+      self.reachability_index.invalidate(from_entity.id)
+    from_entity.remove_successor(to_entity)
+    to_entity.remove_predecessor(from_entity)
+
+  def apply_patch(self, patch):
+    """
+    Applies changes of the input to the graph, so it becomes the
+    same as a graph created from the changed input. patch is a
+    dictionary with (all optional):
+
+      "removed_links"     links to remove ({"from": id, "to": id})
+      "removed_entities"  ids of entities to remove (with their links)
+      "entities"          entities to add, in the input format;
+                          entities with existing ids get the new name
+                          and description and keep their links
+      "links"             links to add, in the input format
+
+    applied in this order. Unknown ids are ignored. Plans of the
+    reachability index that the changes don't touch are kept, so
+    clones of roots whose subgraphs didn't change only copy them.
+
+    An OverlayGraph can only be patched without removals and
+    changes of its base entities (see OverlayGraph.apply_patch()).
+    """
+    for record in _get_patch_records(patch, 'removed_links'):
+      self.unlink_entities_by_id(record['from'], record['to'])
+
+    removed_ids = _get_patch_records(patch, 'removed_entities')
+    if removed_ids and not self.track_predecessors:
+      # removing entities needs their predecessors
+      self.enable_predecessor_tracking()
+    for entity_id in removed_ids:
+      self.remove_entity(entity_id)
+
+    records = []
+    for record in _get_patch_records(patch, 'entities'):
+      entity = self.entities.get(record['entity_id'])
+      if entity is None:
+        records.append(('entities', record))
+      else:
+        entity.name = record['name']
+        entity.description = record.get('description')
+    records.extend(('links', record) for record in _get_patch_records(patch, 'links'))
+    _add_records(self, records)
+
+  def enable_predecessor_tracking(self):
+    """
+    Gives every entity its predecessors (if the graph was created
+    without tracking them) and keeps them from now on, so
+    get_predecessors_for() doesn't go through the whole graph.
+    """
+    if self.track_predecessors:
+      return
+    for entity in self.entities.values():
+      for successor in entity.successors:
+        successor.add_predecessor(entity)
+    self.track_predecessors = True
+
+  def enable_reachability_index(self):
+    """
+    Makes clone() and clone_many() cache what they traverse in
+    a ReachabilityIndex, so repeated clones of the same root only
+    copy entities. Returns the index (can be used to build plans
+    upfront and to get its size and build time).
+    """
+    if self.reachability_index is None:
+      self.reachability_index = ReachabilityIndex(self)
+    return self.reachability_index
+
+  def disable_reachability_index(self):
+    self.reachability_index = None
   
-  def clone(self, entity_id):
+  def clone(self, entity_id, max_depth=None, max_entities=None, entity_filter=None):
     """
     Clones an entity and all related entities (in place).
+
+    The clone can be bounded (see get_bounded_entities()), copying
+    only the part of the related entities within the bounds (and
+    links between them). If it would copy more than max_entities
+    entities, CloneSizeError is raised and the graph is unchanged.
     """
     root_entity = self.entities.get(entity_id)
     if root_entity is None:
       return
     
-    new_subgraph_root_entity = self.copy_subgraph(root_entity, {})
+    if max_depth is not None or max_entities is not None or entity_filter is not None:
+      order = self.get_bounded_entities(root_entity, max_depth, max_entities, entity_filter)
+      new_subgraph_root_entity = self._copy_bounded(order)
+    else:
+      plan = self._get_plan(root_entity)
+      if plan is not None:
+        new_subgraph_root_entity = self.copy_plan(plan)
+      elif self.copy_by_components:
+        new_subgraph_root_entity = self.copy_condensation(self.get_condensation(root_entity))
+      else:
+        new_subgraph_root_entity = self.copy_subgraph(root_entity)
     
     for predecessor in self.get_predecessors_for(root_entity):
-      predecessor.add_successor(new_subgraph_root_entity)
+      self._link_to_copy(predecessor, new_subgraph_root_entity)
 
-  def copy_subgraph(self, root_entity, visited_entities):
+  def _get_plan(self, root_entity):
+    """
+    Gets clone plan of root_entity from the reachability index (None
+    if there is no index, or the root is not an entity of the graph
+    the index belongs to, e.g. a copy made in an overlay).
+    """
+    index = self.reachability_index
+    if index is None or index.graph.entities.get(root_entity.id) is not root_entity:
+      return None
+    return index.get_plan(root_entity)
 
-    if root_entity.id in visited_entities:
-      # stop recursion and return cloned version of the entity
-      return visited_entities[root_entity.id]
-    
-    new_entity = self.copy_and_add_entity(root_entity)
-    visited_entities[root_entity.id] = new_entity
+  def _link_to_copy(self, predecessor, new_root_entity):
+    """
+    Adds root copy to successors of a root predecessor
+    (and the predecessor to predecessors of the copy, so
+    later clones of the copy link the predecessor too).
+    """
+    if self.reachability_index is not None:
+      self.reachability_index.invalidate(predecessor.id)
+    predecessor.add_successor(new_root_entity)
+    if self.track_predecessors:
+      new_root_entity.add_predecessor(predecessor)
 
-    for successor in self.get_successors_for(root_entity):
-      # call recursively
-      new_linked = self.copy_subgraph(successor, visited_entities)
-      self.link_entities(new_entity, new_linked)
-    
-    # all successors have been visited,
-    # stop recursion and return entity
-    return new_entity
+  def copy_plan(self, plan):
+    """
+    Copies entities of a ClonePlan and links the copies.
+    Returns copy of the root.
+    """
+    copies = [self.copy_and_add_entity(entity) for entity in plan.entities]
+    links = plan.links
+    for i in range(0, len(links), 2):
+      self.link_entities(copies[links[i]], copies[links[i + 1]])
+    return copies[0]
+
+  def copy_subgraph(self, root_entity):
+    """
+    Copies root_entity and every entity reachable from it.
+
+    Entities are visited depth-first (successors in the order
+    given by get_successors_for) and copies get ids in visiting
+    order. An explicit stack is used instead of recursion, so
+    the depth of the subgraph is limited only by memory.
+    """
+    with self.traversal_buffers.get(self.get_index_count()) as buffer:
+      # visited entities are stamped with the epoch and get the
+      # position of their copy in copies; copies made here are
+      # never visited, so they don't need a stamp
+      stamps = buffer.stamps
+      positions = buffer.positions
+      epoch = buffer.epoch
+
+      new_root_entity = self.copy_and_add_entity(root_entity)
+      stamps[root_entity.index] = epoch
+      positions[root_entity.index] = 0
+      copies = [new_root_entity]
+
+      # each stack item holds a copied entity and an iterator over
+      # successors of its original that are still to be visited
+      stack = [(new_root_entity, iter(self.get_successors_for(root_entity)))]
+      depth = 1
+      while stack:
+        new_entity, successors = stack[-1]
+        for successor in successors:
+          index = successor.index
+          if stamps[index] != epoch:
+            new_linked = self.copy_and_add_entity(successor)
+            stamps[index] = epoch
+            positions[index] = len(copies)
+            copies.append(new_linked)
+            self.link_entities(new_entity, new_linked)
+            # descend; the rest of the successors are visited
+            # once the new entity is done
+            stack.append((new_linked, iter(self.get_successors_for(successor))))
+            if len(stack) > depth:
+              depth = len(stack)
+            break
+          self.link_entities(new_entity, copies[positions[index]])
+        else:
+          # all successors have been visited
+          stack.pop()
+
+    self.max_traversal_depth = max(self.max_traversal_depth, depth)
+    return new_root_entity
+
+  def clone_many(self, entity_ids, max_depth=None, max_entities=None, entity_filter=None):
+    """
+    Clones several entities and all their related entities (in place).
+
+    Every clone is made from the graph as it was before the call,
+    so copies made for one entity never become part of the clone of
+    another. Copies get consecutive ids in the order of entity_ids
+    (cloning a single entity is the same as calling clone()).
+
+    The traversal of a root is reused when its id is repeated.
+    Roots whose subgraphs overlap are traversed separately, only
+    sorting of the shared entities' successors is not done again
+    (entities keep their sorted successors).
+
+    Bounds are the same as for clone(), max_entities limiting all
+    copies made by the call.
+
+    Predecessors of the roots are needed, so for several ids
+    predecessor tracking is enabled (see enable_predecessor_tracking())
+    instead of going through the graph for every root.
+    """
+    entity_ids = list(entity_ids)
+    if len(entity_ids) > 1:
+      self.enable_predecessor_tracking()
+    if max_depth is not None or max_entities is not None or entity_filter is not None:
+      self._clone_many_bounded(entity_ids, max_depth, max_entities, entity_filter)
+      return
+
+    orders = {}
+    new_links = []
+    for entity_id in entity_ids:
+      root_entity = self.entities.get(entity_id)
+      if root_entity is None:
+        continue
+
+      plan = self._get_plan(root_entity)
+      if plan is not None:
+        new_root_entity = self.copy_plan(plan)
+      elif self.copy_by_components:
+        condensation = orders.get(entity_id)
+        if condensation is None:
+          condensation = self.get_condensation(root_entity)
+          orders[entity_id] = condensation
+        new_root_entity = self.copy_condensation(condensation)
+      else:
+        order = orders.get(entity_id)
+        if order is None:
+          order = self.get_reachable_entities(root_entity)
+          orders[entity_id] = order
+        new_root_entity = self.copy_entities(order)
+
+      # linking predecessors to the copy is left for the end,
+      # otherwise the copy would be reachable by later clones
+      for predecessor in self.get_predecessors_for(root_entity):
+        new_links.append((predecessor, new_root_entity))
+
+    for predecessor, new_root_entity in new_links:
+      self._link_to_copy(predecessor, new_root_entity)
+
+  def _clone_many_bounded(self, entity_ids, max_depth, max_entities, entity_filter):
+    # all traversals are done before copying, so nothing
+    # is copied if the clones are too big together
+    roots = []
+    orders = {}
+    entity_count = 0
+    for entity_id in entity_ids:
+      root_entity = self.entities.get(entity_id)
+      if root_entity is None:
+        continue
+      order = orders.get(entity_id)
+      if order is None:
+        limit = None if max_entities is None else max_entities - entity_count
+        try:
+          order = self.get_bounded_entities(root_entity, max_depth, limit, entity_filter)
+        except CloneSizeError:
+          raise CloneSizeError('clones would copy more than {} entities'.format(max_entities))
+        orders[entity_id] = order
+      entity_count += len(order)
+      if max_entities is not None and entity_count > max_entities:
+        raise CloneSizeError('clones would copy more than {} entities'.format(max_entities))
+      roots.append((root_entity, order))
+
+    new_links = []
+    for root_entity, order in roots:
+      new_root_entity = self._copy_bounded(order)
+      for predecessor in self.get_predecessors_for(root_entity):
+        new_links.append((predecessor, new_root_entity))
+
+    for predecessor, new_root_entity in new_links:
+      self._link_to_copy(predecessor, new_root_entity)
+
+  def get_bounded_entities(self, root_entity, max_depth=None, max_entities=None,
+                           entity_filter=None):
+    """
+    Gets entities a bounded clone of root_entity copies, in the
+    order they are copied (depth-first, root first, the same as
+    get_reachable_entities() for the entities within the bounds).
+
+    :param max_depth:
+      only entities at most max_depth links away from root_entity
+      (by the shortest path) are copied
+    :param max_entities:
+      if more entities would be copied, CloneSizeError is raised
+      (as soon as the traversal finds one more)
+    :param entity_filter:
+      function taking an entity; entities (other than the root)
+      it returns False for are not copied or traversed through
+    """
+    get_successors = self.get_successors_for
+    if entity_filter is not None:
+      accepted = {}
+
+      def get_successors(entity):
+        successors = []
+        for successor in self.get_successors_for(entity):
+          is_accepted = accepted.get(successor)
+          if is_accepted is None:
+            is_accepted = accepted[successor] = bool(entity_filter(successor))
+          if is_accepted:
+            successors.append(successor)
+        return successors
+
+    if max_depth is not None:
+      within = self._get_entities_within(root_entity, max_depth, max_entities, get_successors)
+      get_any_successors = get_successors
+
+      def get_successors(entity):
+        return [successor for successor in get_any_successors(entity) if successor in within]
+
+    return self.get_reachable_entities(root_entity, get_successors, max_entities)
+
+  def _get_entities_within(self, root_entity, max_depth, max_entities, get_successors):
+    """
+    Gets set of entities at most max_depth links away from
+    root_entity (breadth-first, see get_bounded_entities()).
+    """
+    within = set([root_entity])
+    frontier = [root_entity]
+    for _ in range(max_depth):
+      next_frontier = []
+      for entity in frontier:
+        for successor in get_successors(entity):
+          if successor not in within:
+            within.add(successor)
+            next_frontier.append(successor)
+            if max_entities is not None and len(within) > max_entities:
+              raise _get_size_error(root_entity, max_entities)
+      if not next_frontier:
+        break
+      frontier = next_frontier
+    return within
+
+  def _copy_bounded(self, order):
+    """
+    Copies entities in order and links between them
+    (links to entities not in order are left out).
+    """
+    members = set(order)
+    return self.copy_entities(order, lambda entity: [
+      successor for successor in self.get_successors_for(entity) if successor in members])
+
+  def get_reachable_entities(self, root_entity, get_successors=None, max_entities=None):
+    """
+    Gets entities reachable from root_entity
+    in depth-first visiting order (root first).
+
+    :param get_successors:
+      function returning successors of an entity
+      (get_successors_for by default)
+    :param max_entities:
+      if more entities are reachable, CloneSizeError is
+      raised as soon as the traversal finds one more
+    """
+    if get_successors is None:
+      get_successors = self.get_successors_for
+    limit = sys.maxsize if max_entities is None else max_entities
+    if limit < 1:
+      raise _get_size_error(root_entity, max_entities)
+
+    order = [root_entity]
+    with self.traversal_buffers.get(self.get_index_count()) as buffer:
+      stamps = buffer.stamps
+      epoch = buffer.epoch
+      stamps[root_entity.index] = epoch
+      stack = [iter(get_successors(root_entity))]
+      depth = 1
+      while stack:
+        for successor in stack[-1]:
+          if stamps[successor.index] != epoch:
+            stamps[successor.index] = epoch
+            order.append(successor)
+            if len(order) > limit:
+              raise _get_size_error(root_entity, max_entities)
+            stack.append(iter(get_successors(successor)))
+            if len(stack) > depth:
+              depth = len(stack)
+            break
+        else:
+          stack.pop()
+
+    self.max_traversal_depth = max(self.max_traversal_depth, depth)
+    return order
+
+  def copy_entities(self, order, get_successors=None):
+    """
+    Copies entities in order (numbering the copies in that order)
+    and links the copies the same way the originals are linked.
+    Every successor of an entity in order has to be in order too.
+
+    Returns copy of the first entity.
+    """
+    if get_successors is None:
+      get_successors = self.get_successors_for
+
+    copies = [self.copy_and_add_entity(entity) for entity in order]
+    with self.traversal_buffers.get(self.get_index_count()) as buffer:
+      # dense index of original entity -> position in order
+      positions = buffer.positions
+      for position, entity in enumerate(order):
+        positions[entity.index] = position
+      for entity, new_entity in zip(order, copies):
+        for successor in get_successors(entity):
+          self.link_entities(new_entity, copies[positions[successor.index]])
+    return copies[0]
+
+  def get_condensation(self, root_entity):
+    """
+    Gets Condensation of entities reachable from root_entity:
+    the entities in the same order as get_reachable_entities(),
+    split into strongly connected components.
+    """
+    with self.traversal_buffers.get(self.get_index_count()) as buffer:
+      order, components, depth = find_components(
+        [root_entity], self.get_successors_for, _get_index, buffer)
+
+    self.max_traversal_depth = max(self.max_traversal_depth, depth)
+    components.reverse()
+    return Condensation(order, components)
+
+  def copy_condensation(self, condensation):
+    """
+    Copies entities of a Condensation (numbering the copies in
+    visiting order, so the ids are the same as with copy_subgraph())
+    and links the copies component by component, in topological
+    order of the components. Returns copy of the root.
+    """
+    entities = condensation.entities
+    copies = [self.copy_and_add_entity(entity) for entity in entities]
+    with self.traversal_buffers.get(self.get_index_count()) as buffer:
+      # dense index of original entity -> position in entities
+      positions = buffer.positions
+      for position, entity in enumerate(entities):
+        positions[entity.index] = position
+      for component in condensation.components:
+        for position in component:
+          new_entity = copies[position]
+          for successor in self.get_successors_for(entities[position]):
+            self.link_entities(new_entity, copies[positions[successor.index]])
+    return copies[0]
+
+  def get_strongly_connected_components(self):
+    """
+    Gets strongly connected components of the graph as lists of
+    entities (in depth-first visiting order), in topological order
+    of the components (a component only links to itself and to
+    components after it). Traversals start from entities in the
+    order of get_entity_ids().
+    """
+    entities = self.entities
+    roots = (entities[entity_id] for entity_id in self.get_entity_ids())
+    with self.traversal_buffers.get(self.get_index_count()) as buffer:
+      order, components, depth = find_components(
+        roots, self.get_successors_for, _get_index, buffer)
+
+    self.max_traversal_depth = max(self.max_traversal_depth, depth)
+    components.reverse()
+    return Condensation(order, components).get_component_entities()
+
+  def estimate_clone(self, entity_id, max_depth=None, entity_filter=None, sample_size=None):
+    """
+    Counts entities and links clone() would add, without copying
+    anything (None if there is no such entity). Entities are only
+    marked in a traversal buffer, so this is much cheaper than
+    cloning, and the graph is unchanged.
+
+    :param max_depth, entity_filter:
+      bounds of the clone (see get_bounded_entities())
+    :param sample_size:
+      if set, counting stops after links of sample_size entities
+      have been counted, and the counts are only lower bounds
+      (see CloneSize); at least 1, can not be combined with bounds
+    """
+    if sample_size is not None and sample_size < 1:
+      raise ValueError('sample size must be at least 1')
+    root_entity = self.entities.get(entity_id)
+    if root_entity is None:
+      return None
+    bounded = max_depth is not None or entity_filter is not None
+    if bounded and sample_size is not None:
+      raise ValueError('bounded clones can not be sampled')
+    predecessor_links = len(self.get_predecessors_for(root_entity))
+
+    if bounded:
+      order = self.get_bounded_entities(root_entity, max_depth, None, entity_filter)
+      members = set(order)
+      links = sum(1 for entity in order
+                  for successor in self._get_unsorted_successors(entity)
+                  if successor in members)
+      return CloneSize(len(order), links, predecessor_links)
+
+    # plans are used when there already is one (but not built)
+    index = self.reachability_index
+    if index is not None and index.graph.entities.get(entity_id) is root_entity:
+      plan = index.plans.get(entity_id)
+      if plan is not None:
+        return CloneSize(len(plan), len(plan.links) // 2, predecessor_links)
+
+    limit = -1 if sample_size is None else sample_size
+    found = 1
+    counted = 0
+    links = 0
+    with self.traversal_buffers.get(self.get_index_count()) as buffer:
+      stamps = buffer.stamps
+      epoch = buffer.epoch
+      stamps[root_entity.index] = epoch
+      # found entities whose links are not counted yet
+      stack = [root_entity]
+      while stack and counted != limit:
+        successors = self._get_unsorted_successors(stack.pop())
+        counted += 1
+        links += len(successors)
+        for successor in successors:
+          if stamps[successor.index] != epoch:
+            stamps[successor.index] = epoch
+            found += 1
+            stack.append(successor)
+    return _get_clone_size(found, counted, links, predecessor_links)
+
+  def _get_unsorted_successors(self, entity):
+    # successors of the graph are a set (sorting isn't needed to count them)
+    return entity.successors
 
   def get_successors_for(self, entity):
     """
@@ -142,64 +1023,970 @@ class Graph(object):
     Gets entity predecessors 
     (sorted or not, depending on sort_links flag)
     """
+    if not self.track_predecessors:
+      return self.find_predecessors(entity)
     return (entity.get_sorted_predecessors() 
             if self.sort_links 
             else entity.predecessors)
+
+  def find_predecessors(self, entity):
+    """
+    Finds entity predecessors by looking through successors
+    of all entities (sorted or not, depending on sort_links flag).
+    """
+    predecessors = [other for other in self.entities.values()
+                    if entity in other.successors]
+    if self.sort_links:
+      predecessors.sort(key=_get_id)
+    return predecessors
   
+  def has_entity(self, entity_id):
+    return entity_id in self.entities
+
+  def get_entity_count(self):
+    return len(self.entities)
+
+  def get_link_count(self):
+    return sum(len(entity.successors) for entity in self.entities.values())
+
+  def add_entity_record(self, record):
+    """
+    Adds entity described by a dictionary in the input format.
+    """
+    self.add_entity(Entity(record['entity_id'], record['name'], record.get('description')))
+
   @staticmethod
-  def from_dict(json_dict={}, sort_links=False):
+  def from_dict(json_dict={}, sort_links=False, track_predecessors=True):
     """
     Parses dictionary containing entities and links,
     and creates a Graph object.
     """
-    entities = json_dict.get('entities')
-    links = json_dict.get('links')
+    return Graph.from_records(_iter_dict_records(json_dict), sort_links, track_predecessors)
 
-    graph = Graph(sort_links)
-    
-    for e in entities if isinstance(entities, list) else []:
-      entity = Entity(e['entity_id'], e['name'], e.get('description'))
-      graph.add_entity(entity)
-    
-    for link in links if isinstance(links, list) else []:
-      graph.link_entities_by_id(link['from'], link['to'])
-    
+  @staticmethod
+  def from_graph(graph, sort_links=False, track_predecessors=True):
+    """
+    Creates a Graph object with entities and links of a graph
+    providing iter_entities() and iter_links() (e.g. a CompactGraph
+    loaded from a snapshot, so it can be patched).
+    """
+    return Graph.from_records(_iter_graph_records(graph), sort_links, track_predecessors)
+
+  @staticmethod
+  def from_records(records, sort_links=False, track_predecessors=True):
+    """
+    Creates a Graph object from (section, record) pairs
+    (see _add_records()), e.g. the ones yielded by
+    graphclone.utils.parser.iter_json_records().
+    """
+    graph = Graph(sort_links, track_predecessors)
+    _add_records(graph, records)
     return graph
 
   def to_dict(self):
     """
     Creates a dictionary from Graph object
     """
-    
-    json_dict = {
-      'entities': [],
-      'links': [],
-    }
+    return _to_dict(self)
 
-    for entity_id in self.get_entity_ids():
+  def iter_entities(self, start=0, stop=None):
+    """
+    Yields (entity_id, name, description) for every entity
+    (sorted or not, depending on sort_links flag)
+
+    :param start, stop:
+      if given, only entities at positions start..stop-1
+      of that order are yielded
+    """
+    for entity_id in self._get_entity_ids_between(start, stop):
+      entity = self.entities[entity_id]
+      yield entity.id, entity.name, entity.description
+
+  def iter_links(self, start=0, stop=None):
+    """
+    Yields (from_id, to_id) for every link, grouped by
+    the entity they start from (sorted or not, depending
+    on sort_links flag)
+
+    :param start, stop:
+      if given, only links of entities at positions
+      start..stop-1 (see iter_entities()) are yielded
+    """
+    for entity_id in self._get_entity_ids_between(start, stop):
       entity = self.entities[entity_id]
-      entity_dict = {
-        'entity_id': entity.id,
-        'name': entity.name,
-      }
-      if entity.description is not None:
-        entity_dict['description'] = entity.description
-      
-      json_dict['entities'].append(entity_dict)
-      
       for successor in self.get_successors_for(entity):
-        json_dict['links'].append({
-          'from': entity.id,
-          'to': successor.id
-        })
-    
-    return json_dict
+        yield entity.id, successor.id
+
+  def _get_entity_ids_between(self, start, stop):
+    """
+    Gets entity ids at positions start..stop-1 of get_entity_ids()
+    (sorted ids are sliced, ids before start are not walked).
+    """
+    entity_ids = self.get_entity_ids()
+    if isinstance(entity_ids, list):
+      return entity_ids[start:stop]
+    # keys of a graph without sorted links
+    return islice(entity_ids, start, stop)
   
   def get_entity_ids(self):
     """
     Gets entity ids 
     (sorted or not, depending on sort_links flag)
+
+    Sorted ids are cached (and kept up to date by add_entity()),
+    the returned list shouldn't be changed.
     """
-    return (sorted(self.entities.keys()) 
-            if self.sort_links 
-            else self.entities.keys())
+    if not self.sort_links:
+      return self.entities.keys()
+    if self.sorted_entity_ids is None:
+      self.sorted_entity_ids = sorted(self.entities.keys())
+    return self.sorted_entity_ids
+
+
+class OverlayGraph(Graph):
+  """
+  Graph layered over a base Graph, which is never changed.
+
+  Entities added to the overlay (e.g. by cloning) are stored in the
+  overlay, and links added to entities of the base are kept in
+  per-entity lists of the overlay instead of in the base entities.
+  Lookups, traversals, to_dict() etc. see the base and the overlay
+  merged, so cloning repeatedly from the same base costs memory
+  proportional to the cloned subgraphs only, and several overlays
+  can share (and be used concurrently on) one base.
+
+  The base must not be changed while overlays over it are used.
+  Entities and links can only be added: removing them, or changing
+  entities of the base, raises TypeError (patches doing that are
+  applied to the base instead).
+  """
+
+  def __init__(self, base):
+    """
+    :param base:
+      Graph (or another OverlayGraph) to layer over
+    """
+    Graph.__init__(self, base.sort_links)
+    self.base = base
+    self.sort_links = base.sort_links
+    self.next_entity_id = base.next_entity_id
+    # overlay entities are looked up first, writes go to the overlay
+    self.entities = ChainMap({}, base.entities)
+    # overlay entities are indexed after the base ones
+    self.first_index = base.get_index_count()
+    # overlays of the same base reuse its traversal buffers
+    self.traversal_buffers = base.traversal_buffers
+    # entity of the base -> entities added to its successors/predecessors
+    self.extra_successors = {}
+    self.extra_predecessors = {}
+    # traversals of the base can be reused until links
+    # to base entities are added to the overlay
+    self.reachability_index = base.reachability_index
+
+  def get_index_count(self):
+    return self.first_index + len(self.entities_by_index)
+
+  def get_overlay_entities(self):
+    """
+    Gets entities added to the overlay (entity_id -> entity).
+    """
+    return self.entities.maps[0]
+
+  def is_base_entity(self, entity):
+    """
+    Checks if entity comes from the base (anything not added to
+    the overlay, including entities replaced in the base).
+    """
+    return self.get_overlay_entities().get(entity.id) is not entity
+
+  def add_entity(self, entity):
+    """
+    Adds entity to the overlay. Entities of the base with the
+    same id are replaced in the overlay only.
+    """
+    if entity is None:
+      return
+    old_entity = self.entities.get(entity.id)
+    if entity.id in self.base.entities:
+      # plans of the base may contain the replaced entity
+      self.reachability_index = None
+    if old_entity is not None and old_entity.index is not None:
+      entity.index = old_entity.index
+      if entity.index >= self.first_index:
+        self.entities_by_index[entity.index - self.first_index] = entity
+    else:
+      entity.index = self.first_index + len(self.entities_by_index)
+      self.entities_by_index.append(entity)
+    if old_entity is None:
+      self._add_sorted_entity_id(entity.id)
+    self.entities[entity.id] = entity
+    if entity.id >= self.next_entity_id:
+      self.next_entity_id = entity.id + 1
+
+  def link_entities(self, from_entity, to_entity):
+    """
+    Links entities within the graph (links to or from
+    base entities are stored in the overlay).
+    """
+    if from_entity is None or to_entity is None:
+      return
+    if self.is_base_entity(from_entity):
+      self._add_extra_link(self.extra_successors, from_entity, to_entity,
+                           self.base.get_successors_for)
+    else:
+      from_entity.add_successor(to_entity)
+    if self.is_base_entity(to_entity):
+      self._add_extra_link(self.extra_predecessors, to_entity, from_entity,
+                           self.base.get_predecessors_for)
+    else:
+      to_entity.add_predecessor(from_entity)
+
+  def apply_patch(self, patch):
+    """
+    Applies a patch without removals (see Graph.apply_patch()).
+    Entities added to the overlay can be changed, entities of the
+    base are shared with other overlays, so changing them raises
+    TypeError (before anything is changed).
+    """
+    for record in _get_patch_records(patch, 'entities'):
+      entity = self.entities.get(record['entity_id'])
+      if entity is not None and self.is_base_entity(entity):
+        raise TypeError('entities of the base graph can not be changed in an '
+                        'OverlayGraph, change them in its base graph')
+    Graph.apply_patch(self, patch)
+
+  def remove_entity(self, entity_id):
+    raise TypeError('entities can not be removed from an OverlayGraph, '
+                    'remove them from its base graph')
+
+  def unlink_entities(self, from_entity, to_entity):
+    raise TypeError('links can not be removed from an OverlayGraph, '
+                    'remove them from its base graph')
+
+  def _link_to_copy(self, predecessor, new_root_entity):
+    if self.is_base_entity(predecessor):
+      self._add_extra_link(self.extra_successors, predecessor, new_root_entity,
+                           self.base.get_successors_for)
+    else:
+      predecessor.add_successor(new_root_entity)
+    # the copy is an entity of the overlay
+    new_root_entity.add_predecessor(predecessor)
+
+  def _add_extra_link(self, extra_links, entity, linked_entity, get_base_links):
+    links = extra_links.setdefault(entity, [])
+    if linked_entity in links or linked_entity in get_base_links(entity):
+      return
+    links.append(linked_entity)
+    # traversals of the base no longer match the overlay
+    self.reachability_index = None
+
+  def get_successors_for(self, entity):
+    """
+    Gets entity successors, including the ones added in the overlay
+    (sorted or not, depending on sort_links flag)
+    """
+    if not self.is_base_entity(entity):
+      return Graph.get_successors_for(self, entity)
+    return self._merge_links(self.base.get_successors_for(entity),
+                             self.extra_successors.get(entity))
+
+  def _get_unsorted_successors(self, entity):
+    if not self.is_base_entity(entity):
+      return entity.successors
+    base_links = self.base._get_unsorted_successors(entity)
+    extra_links = self.extra_successors.get(entity)
+    if not extra_links:
+      return base_links
+    return list(base_links) + extra_links
+
+  def get_predecessors_for(self, entity):
+    """
+    Gets entity predecessors, including the ones added in the overlay
+    (sorted or not, depending on sort_links flag)
+    """
+    if not self.is_base_entity(entity):
+      return Graph.get_predecessors_for(self, entity)
+    return self._merge_links(self.base.get_predecessors_for(entity),
+                             self.extra_predecessors.get(entity))
+
+  def _merge_links(self, base_links, extra_links):
+    if not extra_links:
+      return base_links
+    links = list(base_links) + extra_links
+    if self.sort_links:
+      links.sort(key=lambda e: e.id)
+    return links
+
+  def get_entity_ids(self):
+    if self.sort_links and self.sorted_entity_ids is None:
+      # ids sorted in the base usually only need
+      # the (bigger) ids of copies appended
+      base_ids = self.base.get_entity_ids()
+      overlay_ids = sorted(entity_id for entity_id in self.get_overlay_entities()
+                           if entity_id not in self.base.entities)
+      if base_ids and overlay_ids and base_ids[-1] >= overlay_ids[0]:
+        self.sorted_entity_ids = sorted(self.entities.keys())
+      else:
+        self.sorted_entity_ids = list(base_ids) + overlay_ids
+    return Graph.get_entity_ids(self)
+
+  def get_link_count(self):
+    return self.base.get_link_count() + sum(
+      len(entity.successors) for entity in self.get_overlay_entities().values()
+    ) + sum(len(links) for links in self.extra_successors.values())
+
+
+class CompactGraph(object):
+  """
+  Array-backed graph representation.
+
+  Entities are addressed by a dense index (0..N-1). Entity ids are
+  stored in an integer array, names and descriptions as references
+  into an interned string table, and links as CSR (offsets/targets)
+  arrays for both directions. Links added after the arrays have
+  been built are kept in small per-entity overflow lists.
+
+  Has the same from_dict/clone/to_dict contract as Graph, but
+  entity ids have to be integers.
+  """
+
+  # smallest clone copied with array operations when numpy is used
+  numpy_min_copies = 64
+
+  def __init__(self, sort_links=False):
+    """
+    :param sort_links:
+      Sorts links (successors/predecessors)
+      by entity id when cloning or converting the graph
+      to a dictionary. Links are always sorted, the same as
+      the ones of a Graph, so both give the same output.
+    """
+    # Graph always sorts links (whatever sort_links is),
+    # rows are sorted when the CSR arrays are built to match
+    self.sort_links = True
+    # copy entities with numpy when it's installed
+    self.use_numpy = numpy is not None
+    # used when copying/cloning entities into the graph
+    self.next_entity_id = 1
+    # deepest depth-first traversal so far (number of entities
+    # on the traversal stack), reported by process() stats
+    self.max_traversal_depth = 0
+    # visited marks and positions reused by traversals
+    self.traversal_buffers = TraversalBufferPool()
+
+    # entity_id -> dense index
+    self.index_of = {}
+    self.ids = array('q')
+    # dense indexes sorted by entity id, None until needed
+    # (extended when entities with bigger ids are added)
+    self.sorted_indexes = None
+    self.name_refs = array('q')
+    # -1 is used for entities without description
+    self.description_refs = array('q')
+
+    # interned names and descriptions
+    self.strings = []
+    self.string_refs = {}
+
+    self.successor_offsets = array('q', [0])
+    self.successor_targets = array('q')
+    self.predecessor_offsets = array('q', [0])
+    self.predecessor_targets = array('q')
+    # links added after the CSR arrays were built,
+    # stored as dense index -> list of dense indexes
+    self.extra_successors = {}
+    self.extra_predecessors = {}
+
+    # links waiting for the CSR arrays to be built
+    self._pending_sources = array('q')
+    self._pending_targets = array('q')
+    # mmap the arrays and strings are read from, when the graph
+    # is loaded from a snapshot (see graphclone.graph.snapshot)
+    self.mapped = None
+
+  def __len__(self):
+    return len(self.ids)
+
+  def get_entity_count(self):
+    return len(self.ids)
+
+  def get_link_count(self):
+    self.build_links()
+    return len(self.successor_targets) + sum(
+      len(row) for row in self.extra_successors.values())
+
+  def intern(self, string):
+    """
+    Gets reference of string in the string table
+    (adding it to the table if needed).
+
+    For a graph loaded from a snapshot only strings added since
+    loading are looked up, so a string of the snapshot is added again.
+    """
+    if string is None:
+      return -1
+    ref = self.string_refs.get(string)
+    if ref is None:
+      ref = len(self.strings)
+      self.strings.append(string)
+      self.string_refs[string] = ref
+    return ref
+
+  def get_string(self, ref):
+    """
+    Gets string from the string table (None for -1).
+    """
+    return self.strings[ref] if ref != -1 else None
+
+  def add_entity(self, entity_id, name, description=None):
+    """
+    Adds entity to the graph and returns its dense index.
+    Links should be created explicitly (by calling link_entities_by_id()).
+
+    If the same id already exists, the old entity is replaced
+    (its links are kept).
+    """
+    index = self.index_of.get(entity_id)
+    if index is not None:
+      self.name_refs[index] = self.intern(name)
+      self.description_refs[index] = self.intern(description)
+      return index
+
+    index = len(self.ids)
+    self.index_of[entity_id] = index
+    self.ids.append(entity_id)
+    self.name_refs.append(self.intern(name))
+    self.description_refs.append(self.intern(description))
+    # rows of new entities are empty until the arrays are rebuilt
+    self.successor_offsets.append(self.successor_offsets[-1])
+    self.predecessor_offsets.append(self.predecessor_offsets[-1])
+    if entity_id >= self.next_entity_id:
+      self.next_entity_id = entity_id + 1
+    return index
+
+  def link_entities_by_id(self, from_id, to_id):
+    """
+    Links entities within the graph.
+    Links to or from unknown entities are ignored.
+    """
+    from_index = self.index_of.get(from_id)
+    to_index = self.index_of.get(to_id)
+    if from_index is None or to_index is None:
+      return
+    self._pending_sources.append(from_index)
+    self._pending_targets.append(to_index)
+
+  def build_links(self):
+    """
+    Moves pending links into the link arrays.
+
+    Pending links are turned into CSR arrays when the graph has
+    no links yet (the usual case right after loading), otherwise
+    they are added to the overflow lists.
+    """
+    if not self._pending_sources:
+      return
+
+    sources = self._pending_sources
+    targets = self._pending_targets
+    self._pending_sources = array('q')
+    self._pending_targets = array('q')
+
+    if not self.successor_targets and not self.extra_successors:
+      count = len(self.ids)
+      sort_key = self.ids.__getitem__ if self.sort_links else None
+      self.successor_offsets, self.successor_targets = _build_csr(
+        count, sources, targets, sort_key)
+      self.predecessor_offsets, self.predecessor_targets = _build_csr(
+        count, targets, sources, sort_key)
+      return
+
+    for source, target in zip(sources, targets):
+      if target in self.get_successor_indexes(source):
+        continue
+      self.extra_successors.setdefault(source, []).append(target)
+      self.extra_predecessors.setdefault(target, []).append(source)
+
+  def _get_row(self, offsets, targets, extra, index):
+    row = targets[offsets[index]:offsets[index + 1]]
+    extra_row = extra.get(index)
+    if extra_row is None:
+      return row
+    row = row.tolist() + extra_row
+    if self.sort_links:
+      row.sort(key=self.ids.__getitem__)
+    return row
+
+  def get_successor_indexes(self, index):
+    """
+    Gets dense indexes of entity successors
+    (sorted by id or not, depending on sort_links flag)
+    """
+    return self._get_row(self.successor_offsets, self.successor_targets,
+                         self.extra_successors, index)
+
+  def get_predecessor_indexes(self, index):
+    """
+    Gets dense indexes of entity predecessors
+    (sorted by id or not, depending on sort_links flag)
+    """
+    return self._get_row(self.predecessor_offsets, self.predecessor_targets,
+                         self.extra_predecessors, index)
+
+  def clone(self, entity_id):
+    """
+    Clones an entity and all related entities (in place).
+
+    Copies get the same ids as with Graph.clone: reachable entities
+    are numbered depth-first, starting from next_entity_id.
+    """
+    root = self.index_of.get(entity_id)
+    if root is None:
+      return
+
+    self.build_links()
+    order = self.get_reachable_indexes(root)
+    root_predecessors = self.get_predecessor_indexes(root)
+    self._append_copies(order, root_predecessors)
+    self._link_to_copy(root_predecessors, len(self.ids) - len(order))
+
+  def clone_many(self, entity_ids):
+    """
+    Clones several entities and all their related entities (in place),
+    the same way Graph.clone_many does.
+    """
+    self.build_links()
+
+    orders = {}
+    new_links = {}
+    for entity_id in entity_ids:
+      root = self.index_of.get(entity_id)
+      if root is None:
+        continue
+
+      order = orders.get(entity_id)
+      if order is None:
+        order = self.get_reachable_indexes(root)
+        orders[entity_id] = order
+      root_predecessors = self._get_root_predecessors(root, new_links)
+      new_root = len(self.ids)
+      self._append_copies(order, root_predecessors)
+      new_links[new_root] = root_predecessors
+
+    for new_root, root_predecessors in new_links.items():
+      self._link_to_copy(root_predecessors, new_root)
+
+  def _get_root_predecessors(self, root, new_links):
+    """
+    Gets predecessors a clone of root links to its copy.
+
+    :param new_links:
+      copy of a root -> its root predecessors, for clones made
+      by the same clone_many() call; the predecessors are only
+      linked to the copies at the end (as with Graph), so a copy
+      cloned again doesn't get them
+    """
+    root_predecessors = self.get_predecessor_indexes(root)
+    linked_later = new_links.get(root)
+    if linked_later:
+      root_predecessors = [predecessor for predecessor in root_predecessors
+                           if predecessor not in linked_later]
+    return root_predecessors
+
+  def estimate_clone(self, entity_id, sample_size=None):
+    """
+    Counts entities and links clone() would add, without copying
+    anything (see Graph.estimate_clone()).
+    """
+    if sample_size is not None and sample_size < 1:
+      raise ValueError('sample size must be at least 1')
+    root = self.index_of.get(entity_id)
+    if root is None:
+      return None
+
+    self.build_links()
+    offsets = self.successor_offsets
+    targets = self.successor_targets
+    extra = self.extra_successors
+    predecessor_links = len(self.get_predecessor_indexes(root))
+
+    limit = -1 if sample_size is None else sample_size
+    found = 1
+    counted = 0
+    links = 0
+    with self.traversal_buffers.get(len(self.ids)) as buffer:
+      stamps = buffer.stamps
+      epoch = buffer.epoch
+      stamps[root] = epoch
+      stack = [root]
+      while stack and counted != limit:
+        index = stack.pop()
+        counted += 1
+        start = offsets[index]
+        end = offsets[index + 1]
+        successors = targets[start:end]
+        extra_row = extra.get(index)
+        if extra_row:
+          successors = chain(successors, extra_row)
+          links += len(extra_row)
+        links += end - start
+        for successor in successors:
+          if stamps[successor] != epoch:
+            stamps[successor] = epoch
+            found += 1
+            stack.append(successor)
+    return _get_clone_size(found, counted, links, predecessor_links)
+
+  def get_strongly_connected_components(self):
+    """
+    Gets strongly connected components of the graph as lists of
+    dense indexes, the same way Graph.get_strongly_connected_components()
+    does.
+    """
+    self.build_links()
+    with self.traversal_buffers.get(len(self.ids)) as buffer:
+      order, components, depth = find_components(
+        self.get_entity_indexes(), self.get_successor_indexes, None, buffer)
+
+    self.max_traversal_depth = max(self.max_traversal_depth, depth)
+    components.reverse()
+    return [[order[position] for position in component] for component in components]
+
+  def get_reachable_indexes(self, root):
+    """
+    Gets dense indexes of entities reachable from root
+    in depth-first visiting order (root first).
+    """
+    order, depth = self.get_reachable_indexes_from([root])
+    self.max_traversal_depth = max(self.max_traversal_depth, depth)
+    return order
+
+  def get_reachable_indexes_from(self, starts, excluded=None):
+    """
+    Gets dense indexes of entities reachable from starts, in
+    depth-first visiting order (every start is visited in turn,
+    unless it was reached from an earlier one), and the depth of
+    the deepest traversal.
+
+    :param excluded:
+      dense index of an entity that is treated as already visited
+      (not included, and not traversed through)
+    """
+    order = []
+    depth = 0
+    with self.traversal_buffers.get(len(self.ids)) as buffer:
+      stamps = buffer.stamps
+      epoch = buffer.epoch
+      if excluded is not None:
+        stamps[excluded] = epoch
+      for start in starts:
+        if stamps[start] == epoch:
+          continue
+        stamps[start] = epoch
+        order.append(start)
+        # each stack item holds a row of successors
+        # and the position of the next one to visit
+        stack = [[self.get_successor_indexes(start), 0]]
+        if depth < 1:
+          depth = 1
+        while stack:
+          item = stack[-1]
+          row = item[0]
+          position = item[1]
+          while position < len(row):
+            successor = row[position]
+            position += 1
+            if stamps[successor] != epoch:
+              stamps[successor] = epoch
+              order.append(successor)
+              item[1] = position
+              stack.append([self.get_successor_indexes(successor), 0])
+              if len(stack) > depth:
+                depth = len(stack)
+              break
+          else:
+            stack.pop()
+    return order, depth
+
+  def _append_copies(self, order, root_predecessors):
+    """
+    Appends copies of entities in order (root first),
+    together with the links between them.
+    Root copy gets root_predecessors as predecessors, but
+    successors of root_predecessors are left unchanged
+    (see _link_to_copy()).
+    """
+    if self.use_numpy and len(order) >= self.numpy_min_copies:
+      self._append_copies_numpy(order, root_predecessors)
+      return
+
+    first_index = len(self.ids)
+    first_id = self.next_entity_id
+    root = order[0]
+
+    with self.traversal_buffers.get(first_index) as buffer:
+      # original index -> copy index, for the stamped (cloned) ones
+      stamps = buffer.stamps
+      clone_of = buffer.positions
+      epoch = buffer.epoch
+      for i, index in enumerate(order):
+        stamps[index] = epoch
+        clone_of[index] = first_index + i
+
+      for i, index in enumerate(order):
+        new_index = first_index + i
+        self.index_of[first_id + i] = new_index
+        self.ids.append(first_id + i)
+        self.name_refs.append(self.name_refs[index])
+        self.description_refs.append(self.description_refs[index])
+
+        # copies are numbered in index order,
+        # so sorting by index is sorting by id
+        successors = [clone_of[s] for s in self.get_successor_indexes(index)]
+        if self.sort_links:
+          successors.sort()
+        self.successor_targets.extend(successors)
+        self.successor_offsets.append(len(self.successor_targets))
+
+        predecessors = [clone_of[p] for p in self.get_predecessor_indexes(index)
+                        if stamps[p] == epoch]
+        if index == root:
+          predecessors.extend(root_predecessors)
+          if self.sort_links:
+            # copies are not in the ids array yet
+            predecessors.sort(key=lambda p: (
+              self.ids[p] if p < first_index else first_id + p - first_index))
+        elif self.sort_links:
+          predecessors.sort()
+        self.predecessor_targets.extend(predecessors)
+        self.predecessor_offsets.append(len(self.predecessor_targets))
+
+    self.next_entity_id = first_id + len(order)
+
+  def _append_copies_numpy(self, order, root_predecessors):
+    """
+    Same as _append_copies(), but copies are numbered and links
+    remapped with array operations instead of per entity.
+    """
+    first_index = len(self.ids)
+    first_id = self.next_entity_id
+    count = len(order)
+    order = numpy.array(order, dtype=numpy.int64)
+    new_indexes = numpy.arange(first_index, first_index + count, dtype=numpy.int64)
+    if count * 8 >= first_index:
+      # original index -> copy index (-1 if not cloned)
+      copy_indexes = numpy.full(first_index, -1, dtype=numpy.int64)
+      copy_indexes[order] = new_indexes
+
+      def clone_of(indexes):
+        return copy_indexes[indexes]
+
+      def is_cloned(indexes):
+        return copy_indexes[indexes] >= 0
+    else:
+      # small clone of a big graph, search in sorted order instead
+      order_positions = numpy.argsort(order)
+      sorted_order = order[order_positions]
+
+      def clone_of(indexes):
+        return new_indexes[order_positions[numpy.searchsorted(sorted_order, indexes)]]
+
+      def is_cloned(indexes):
+        positions = numpy.minimum(numpy.searchsorted(sorted_order, indexes), count - 1)
+        return sorted_order[positions] == indexes
+
+    def get_sort_keys(indexes):
+      # copies are not in the ids array yet
+      keys = _take(self.ids, numpy.minimum(indexes, first_index - 1))
+      is_copy = indexes >= first_index
+      keys[is_copy] = first_id + indexes[is_copy] - first_index
+      return keys
+
+    name_refs = _take(self.name_refs, order)
+    description_refs = _take(self.description_refs, order)
+
+    successor_rows, successors = self._get_rows_numpy(
+      self.successor_offsets, self.successor_targets, self.extra_successors, order)
+    successors = clone_of(successors)
+
+    predecessor_rows, predecessors = self._get_rows_numpy(
+      self.predecessor_offsets, self.predecessor_targets, self.extra_predecessors, order)
+    internal = is_cloned(predecessors)
+    predecessor_rows = predecessor_rows[internal]
+    predecessors = clone_of(predecessors[internal])
+    if len(root_predecessors):
+      predecessor_rows = numpy.concatenate(
+        [predecessor_rows, numpy.zeros(len(root_predecessors), dtype=numpy.int64)])
+      predecessors = numpy.concatenate(
+        [predecessors, numpy.array(root_predecessors, dtype=numpy.int64)])
+
+    # group links by row, keeping (or sorting by id) the order within a row
+    if self.sort_links:
+      successor_order = numpy.lexsort((successors, successor_rows))
+      predecessor_order = numpy.lexsort((get_sort_keys(predecessors), predecessor_rows))
+    else:
+      successor_order = numpy.argsort(successor_rows, kind='stable')
+      predecessor_order = numpy.argsort(predecessor_rows, kind='stable')
+    successors = successors[successor_order]
+    predecessors = predecessors[predecessor_order]
+    successor_offsets = self.successor_offsets[-1] + numpy.cumsum(
+      numpy.bincount(successor_rows, minlength=count))
+    predecessor_offsets = self.predecessor_offsets[-1] + numpy.cumsum(
+      numpy.bincount(predecessor_rows, minlength=count))
+
+    self.ids.frombytes(numpy.arange(first_id, first_id + count, dtype=numpy.int64).tobytes())
+    self.name_refs.frombytes(name_refs.tobytes())
+    self.description_refs.frombytes(description_refs.tobytes())
+    self.successor_targets.frombytes(successors.astype(numpy.int64).tobytes())
+    self.successor_offsets.frombytes(successor_offsets.astype(numpy.int64).tobytes())
+    self.predecessor_targets.frombytes(predecessors.astype(numpy.int64).tobytes())
+    self.predecessor_offsets.frombytes(predecessor_offsets.astype(numpy.int64).tobytes())
+    self.index_of.update(zip(range(first_id, first_id + count),
+                             range(first_index, first_index + count)))
+    self.next_entity_id = first_id + count
+
+  def _get_rows_numpy(self, offsets, targets, extra, indexes):
+    """
+    Gets links of entities at indexes (an int64 numpy array) as two
+    arrays: positions of the entities in indexes and link targets.
+    Links from the CSR arrays come before the overflow ones.
+    """
+    starts = _take(offsets, indexes)
+    counts = _take(offsets, indexes + 1) - starts
+    total = int(counts.sum())
+    rows = numpy.repeat(numpy.arange(len(indexes), dtype=numpy.int64), counts)
+    positions = (numpy.arange(total, dtype=numpy.int64)
+                 + numpy.repeat(starts - (numpy.cumsum(counts) - counts), counts))
+    row_targets = _take(targets, positions)
+
+    if extra:
+      extra_rows = []
+      extra_targets = []
+      for row, index in enumerate(indexes.tolist()):
+        extra_row = extra.get(index)
+        if extra_row:
+          extra_rows.extend([row] * len(extra_row))
+          extra_targets.extend(extra_row)
+      if extra_rows:
+        rows = numpy.concatenate([rows, numpy.array(extra_rows, dtype=numpy.int64)])
+        row_targets = numpy.concatenate(
+          [row_targets, numpy.array(extra_targets, dtype=numpy.int64)])
+
+    return rows, row_targets
+
+  def _link_to_copy(self, root_predecessors, new_root):
+    """
+    Adds root copy to successors of root predecessors.
+    """
+    for predecessor in root_predecessors:
+      self.extra_successors.setdefault(predecessor, []).append(new_root)
+
+  def has_entity(self, entity_id):
+    return entity_id in self.index_of
+
+  def add_entity_record(self, record):
+    """
+    Adds entity described by a dictionary in the input format.
+    """
+    self.add_entity(record['entity_id'], record['name'], record.get('description'))
+
+  @staticmethod
+  def from_dict(json_dict={}, sort_links=False):
+    """
+    Parses dictionary containing entities and links,
+    and creates a CompactGraph object.
+    """
+    return CompactGraph.from_records(_iter_dict_records(json_dict), sort_links)
+
+  @staticmethod
+  def from_records(records, sort_links=False):
+    """
+    Creates a CompactGraph object from (section, record) pairs
+    (see _add_records()), e.g. the ones yielded by
+    graphclone.utils.parser.iter_json_records().
+    """
+    graph = CompactGraph(sort_links)
+    _add_records(graph, records)
+    graph.build_links()
+    return graph
+
+  def to_dict(self):
+    """
+    Creates a dictionary from CompactGraph object
+    """
+    return _to_dict(self)
+
+  def iter_entities(self, start=0, stop=None):
+    """
+    Yields (entity_id, name, description) for every entity
+    (sorted or not, depending on sort_links flag)
+
+    :param start, stop:
+      if given, only entities at positions start..stop-1
+      of that order are yielded
+    """
+    self.build_links()
+    ids = self.ids
+    indexes = self.get_entity_indexes()
+    for position in range(start, len(indexes) if stop is None else min(stop, len(indexes))):
+      index = indexes[position]
+      yield (ids[index],
+             self.get_string(self.name_refs[index]),
+             self.get_string(self.description_refs[index]))
+
+  def iter_links(self, start=0, stop=None):
+    """
+    Yields (from_id, to_id) for every link, grouped by
+    the entity they start from (sorted or not, depending
+    on sort_links flag)
+
+    :param start, stop:
+      if given, only links of entities at positions
+      start..stop-1 (see iter_entities()) are yielded
+    """
+    self.build_links()
+    ids = self.ids
+    indexes = self.get_entity_indexes()
+    for position in range(start, len(indexes) if stop is None else min(stop, len(indexes))):
+      index = indexes[position]
+      from_id = ids[index]
+      for successor in self.get_successor_indexes(index):
+        yield from_id, ids[successor]
+
+  def get_entity_indexes(self):
+    """
+    Gets dense indexes of all entities
+    (sorted by id or not, depending on sort_links flag)
+
+    Sorted indexes are cached, the returned
+    array shouldn't be changed.
+    """
+    count = len(self.ids)
+    if not self.sort_links:
+      return range(count)
+
+    ids = self.ids
+    indexes = self.sorted_indexes
+    if indexes is not None and len(indexes) < count:
+      # entities added since (usually copies) can be appended
+      # if their ids are bigger and ascending
+      first = len(indexes)
+      last_id = ids[indexes[-1]] if first else None
+      for index in range(first, count):
+        if last_id is not None and ids[index] <= last_id:
+          indexes = None
+          break
+        last_id = ids[index]
+      else:
+        indexes.extend(range(first, count))
+    if indexes is None:
+      indexes = array('q', sorted(range(count), key=ids.__getitem__))
+    self.sorted_indexes = indexes
+    return indexes
+
+  def get_entity_ids(self):
+    """
+    Gets entity ids
+    (sorted or not, depending on sort_links flag)
+    """
+    return [self.ids[index] for index in self.get_entity_indexes()]
@@ -0,0 +1,383 @@
+"""
+Parallel building of CompactGraph links.
+
+Entities are added in the main process (they define the dense
+indexes), then links are built by a pool of worker processes in
+two passes:
+
+  1. the link arrays are split into chunks of chunk_size links;
+     every chunk's entity ids are resolved to dense indexes and the
+     links are distributed into buckets by ranges of source (and,
+     for predecessors, target) indexes
+  2. buckets of every range, concatenated in chunk order, are turned
+     into CSR rows of that range (duplicates dropped, rows sorted)
+
+The main process only concatenates arrays returned by the workers.
+Links keep their input order within every bucket, so the result is
+the same as building the graph with CompactGraph.from_records().
+
+Clones of a CompactGraph can be made by worker processes too (see
+clone_compact_graph()): successors of a cloned entity are split into
+chunks, every chunk's subgraphs are traversed by a worker, and the
+rows of the copies are built by the workers in ranges of the copies.
+"""
+import mmap
+import multiprocessing
+import os
+from array import array
+
+from graphclone.graph.models import CompactGraph
+from graphclone.graph.models import _build_csr
+
+# links resolved by a worker in one task
+DEFAULT_CHUNK_SIZE = 1 << 18
+
+# index ranges per worker (more ranges balance uneven degrees better)
+RANGES_PER_WORKER = 4
+
+# copies built by a worker in one task
+DEFAULT_COPY_CHUNK_SIZE = 1 << 15
+
+# smallest graph cloned by worker processes
+DEFAULT_MIN_ENTITIES = 1 << 15
+
+# state shared with the workers (inherited when processes are forked)
+_worker_state = {}
+
+
+def build_compact_graph(records, sort_links=False, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+  """
+  Creates a CompactGraph from (section, record) pairs (the same as
+  CompactGraph.from_records()), resolving and building links in
+  worker processes.
+
+  :param workers:
+    number of worker processes (number of CPUs by default)
+  :param chunk_size:
+    number of links resolved by a worker at once
+  """
+  graph = CompactGraph(sort_links)
+  from_ids = array('q')
+  to_ids = array('q')
+  for section, record in records:
+    if section == 'entities':
+      graph.add_entity_record(record)
+    elif section == 'links':
+      from_ids.append(record['from'])
+      to_ids.append(record['to'])
+
+  if workers is None:
+    workers = os.cpu_count() or 1
+  count = len(graph.ids)
+  if not from_ids or not count:
+    return graph
+
+  range_count = min(workers * RANGES_PER_WORKER, count)
+  bounds = [count * i // range_count for i in range(range_count + 1)]
+  chunks = [(start, min(start + chunk_size, len(from_ids)))
+            for start in range(0, len(from_ids), chunk_size)]
+
+  with _get_context().Pool(
+      workers, initializer=_init_worker,
+      initargs=(graph.index_of, graph.ids, from_ids, to_ids, range_count, graph.sort_links)) as pool:
+    # (successor buckets, predecessor buckets) of every chunk
+    chunk_buckets = pool.map(_resolve_links, chunks)
+
+    tasks = []
+    for direction in range(2):
+      for r in range(range_count):
+        sources = b''.join(buckets[direction][r][0] for buckets in chunk_buckets)
+        targets = b''.join(buckets[direction][r][1] for buckets in chunk_buckets)
+        tasks.append((bounds[r], bounds[r + 1], sources, targets))
+    del chunk_buckets
+    rows = pool.map(_build_rows, tasks)
+
+  graph.successor_offsets, graph.successor_targets = _concatenate_rows(rows[:range_count])
+  graph.predecessor_offsets, graph.predecessor_targets = _concatenate_rows(rows[range_count:])
+  return graph
+
+
+def _get_context():
+  # forked workers share the arrays instead of getting copies
+  if 'fork' in multiprocessing.get_all_start_methods():
+    return multiprocessing.get_context('fork')
+  return multiprocessing.get_context()
+
+
+def _init_worker(index_of, ids, from_ids, to_ids, range_count, sort_links):
+  _worker_state.update(
+    index_of=index_of, ids=ids, from_ids=from_ids, to_ids=to_ids,
+    range_count=range_count, sort_links=sort_links)
+
+
+def _resolve_links(chunk):
+  """
+  Resolves links of a chunk to dense indexes and returns them as
+  (successor buckets, predecessor buckets): every bucket is a pair
+  of (row indexes, linked indexes) array bytes.
+  """
+  start, end = chunk
+  get_index = _worker_state['index_of'].get
+  count = len(_worker_state['ids'])
+  range_count = _worker_state['range_count']
+  successors = [(array('q'), array('q')) for _ in range(range_count)]
+  predecessors = [(array('q'), array('q')) for _ in range(range_count)]
+
+  from_ids = _worker_state['from_ids'][start:end]
+  to_ids = _worker_state['to_ids'][start:end]
+  for from_id, to_id in zip(from_ids, to_ids):
+    source = get_index(from_id)
+    target = get_index(to_id)
+    # links to or from unknown entities are dropped
+    if source is None or target is None:
+      continue
+    bucket = successors[_get_range(source, count, range_count)]
+    bucket[0].append(source)
+    bucket[1].append(target)
+    bucket = predecessors[_get_range(target, count, range_count)]
+    bucket[0].append(target)
+    bucket[1].append(source)
+
+  return ([(rows.tobytes(), links.tobytes()) for rows, links in successors],
+          [(rows.tobytes(), links.tobytes()) for rows, links in predecessors])
+
+
+def _get_range(index, count, range_count):
+  # range r holds indexes from count*r//range_count
+  # up to count*(r+1)//range_count (excluded)
+  return ((index + 1) * range_count + count - 1) // count - 1
+
+
+def _build_rows(task):
+  """
+  Builds CSR rows of indexes start..end-1 from their links, and
+  returns offsets (relative to the range) and targets as bytes.
+  """
+  start, end, sources, targets = task
+  rows = array('q')
+  rows.frombytes(sources)
+  links = array('q')
+  links.frombytes(targets)
+  ids = _worker_state['ids']
+  sort_key = ids.__getitem__ if _worker_state['sort_links'] else None
+  offsets, row_targets = _build_csr(
+    end - start, array('q', (row - start for row in rows)), links, sort_key)
+  return offsets.tobytes(), row_targets.tobytes()
+
+
+def _concatenate_rows(rows):
+  offsets = array('q', [0])
+  targets = array('q')
+  for range_offsets, range_targets in rows:
+    shift = len(targets)
+    range_offsets = array('q', range_offsets)
+    offsets.extend(offset + shift for offset in range_offsets[1:])
+    targets.frombytes(range_targets)
+  return offsets, targets
+
+
+def clone_compact_graph(graph, entity_ids, workers=None, chunk_size=DEFAULT_COPY_CHUNK_SIZE,
+                        min_entities=DEFAULT_MIN_ENTITIES):
+  """
+  Clones entities of a CompactGraph (in place) with worker processes.
+  Copies get the same ids and links as with CompactGraph.clone_many().
+
+  Successors of every cloned entity are split into chunks, and the
+  subgraphs of every chunk are traversed by a worker (depth-first,
+  without passing through the cloned entity). The visiting order of
+  the whole clone is the chunk orders concatenated, without entities
+  an earlier chunk reached: whatever a subgraph reaches through an
+  entity an earlier one reached was reached by the earlier one too.
+  Chunks of independent subgraphs (a wide fan-out) are traversed
+  in parallel, overlapping ones are traversed again by every chunk.
+  Rows of the copies are then built by the workers in ranges of
+  chunk_size copies, and appended to the graph in order.
+
+  Workers get the graph by forking (they share its arrays, including
+  a mapped snapshot), so where processes can't be forked, for a single
+  worker or for graphs smaller than min_entities, this is the same
+  as graph.clone_many().
+
+  :param workers:
+    number of worker processes (number of CPUs by default)
+  """
+  if workers is None:
+    workers = os.cpu_count() or 1
+  count = len(graph.ids)
+  if (workers < 2 or not count or count < min_entities
+      or 'fork' not in multiprocessing.get_all_start_methods()):
+    graph.clone_many(entity_ids)
+    return
+
+  graph.build_links()
+  # original index -> copy index while a clone is copied
+  # (0 for other entities, no copy has index 0), shared with
+  # the workers since the mapping is anonymous
+  shared = mmap.mmap(-1, count * 8)
+  clone_of = memoryview(shared).cast('q')
+
+  with multiprocessing.get_context('fork').Pool(
+      workers, initializer=_init_clone_worker, initargs=(graph, clone_of)) as pool:
+    orders = {}
+    new_links = {}
+    for entity_id in entity_ids:
+      root = graph.index_of.get(entity_id)
+      if root is None:
+        continue
+      # ids can be the ones of copies made by this call, which
+      # the workers don't have (they are cloned in this process)
+      in_workers = root < count
+
+      order = orders.get(entity_id)
+      if order is None:
+        if in_workers:
+          order = _get_clone_order(graph, pool, root, workers)
+        else:
+          order = graph.get_reachable_indexes(root)
+        orders[entity_id] = order
+      root_predecessors = graph._get_root_predecessors(root, new_links)
+      new_root = len(graph.ids)
+      if in_workers:
+        _append_copies(graph, pool, order, root_predecessors, clone_of, chunk_size)
+      else:
+        graph._append_copies(order, root_predecessors)
+      new_links[new_root] = root_predecessors
+
+  clone_of.release()
+  shared.close()
+  for new_root, root_predecessors in new_links.items():
+    graph._link_to_copy(root_predecessors, new_root)
+
+
+def _init_clone_worker(graph, clone_of):
+  _worker_state.update(graph=graph, clone_of=clone_of)
+
+
+def _get_clone_order(graph, pool, root, workers):
+  """
+  Gets dense indexes graph.clone() copies for root, in the order
+  it copies them (the same as graph.get_reachable_indexes(root)).
+  """
+  successors = graph.get_successor_indexes(root)
+  if len(successors) < 2:
+    return graph.get_reachable_indexes(root)
+
+  chunk_count = min(workers * RANGES_PER_WORKER, len(successors))
+  bounds = [len(successors) * i // chunk_count for i in range(chunk_count + 1)]
+  results = pool.map(_traverse_successors, [
+    (root, bounds[i], bounds[i + 1]) for i in range(chunk_count)])
+
+  order = [root]
+  with graph.traversal_buffers.get(len(graph.ids)) as buffer:
+    stamps = buffer.stamps
+    epoch = buffer.epoch
+    stamps[root] = epoch
+    for chunk_order, depth in results:
+      for index in array('q', chunk_order):
+        if stamps[index] != epoch:
+          stamps[index] = epoch
+          order.append(index)
+      # the root is on the stack of every traversal
+      graph.max_traversal_depth = max(graph.max_traversal_depth, depth + 1)
+  return order
+
+
+def _traverse_successors(task):
+  """
+  Gets dense indexes reachable from a chunk of root successors
+  (without passing through the root) as array bytes, and the
+  depth of the deepest traversal.
+  """
+  root, start, end = task
+  graph = _worker_state['graph']
+  successors = graph.get_successor_indexes(root)[start:end]
+  order, depth = graph.get_reachable_indexes_from(successors, excluded=root)
+  return array('q', order).tobytes(), depth
+
+
+def _append_copies(graph, pool, order, root_predecessors, clone_of, chunk_size):
+  """
+  Appends copies of entities in order (root first) to graph, the
+  same way CompactGraph._append_copies() does, with rows of the
+  copies built by the workers.
+  """
+  first_index = len(graph.ids)
+  first_id = graph.next_entity_id
+  if len(order) <= chunk_size or graph.use_numpy:
+    # numpy copies faster than the workers build rows
+    graph._append_copies(order, root_predecessors)
+    return
+
+  for i, index in enumerate(order):
+    clone_of[index] = first_index + i
+  order = array('q', order)
+  root_predecessors = array('q', root_predecessors).tobytes()
+  rows = pool.map(_build_copy_rows, [
+    (order[start:start + chunk_size].tobytes(), order[0], root_predecessors,
+     first_index, first_id)
+    for start in range(0, len(order), chunk_size)])
+  for index in order:
+    clone_of[index] = 0
+
+  graph.index_of.update(zip(range(first_id, first_id + len(order)),
+                            range(first_index, first_index + len(order))))
+  graph.ids.extend(range(first_id, first_id + len(order)))
+  graph.name_refs.extend(array('q', map(graph.name_refs.__getitem__, order)))
+  graph.description_refs.extend(array('q', map(graph.description_refs.__getitem__, order)))
+  for successor_rows, predecessor_rows in rows:
+    _append_rows(graph.successor_offsets, graph.successor_targets, successor_rows)
+    _append_rows(graph.predecessor_offsets, graph.predecessor_targets, predecessor_rows)
+  graph.next_entity_id = first_id + len(order)
+
+
+def _build_copy_rows(task):
+  """
+  Builds successor and predecessor rows of copies of a range of
+  entities, and returns them as (offsets, targets) bytes (offsets
+  are relative to the range).
+  """
+  order_bytes, root, root_predecessor_bytes, first_index, first_id = task
+  graph = _worker_state['graph']
+  clone_of = _worker_state['clone_of']
+  ids = graph.ids
+  sort_links = graph.sort_links
+  order = array('q')
+  order.frombytes(order_bytes)
+
+  successor_offsets = array('q', [0])
+  successor_targets = array('q')
+  predecessor_offsets = array('q', [0])
+  predecessor_targets = array('q')
+  for index in order:
+    # copies are numbered in index order,
+    # so sorting by index is sorting by id
+    successors = [clone_of[s] for s in graph.get_successor_indexes(index)]
+    if sort_links:
+      successors.sort()
+    successor_targets.extend(successors)
+    successor_offsets.append(len(successor_targets))
+
+    predecessors = [clone_of[p] for p in graph.get_predecessor_indexes(index) if clone_of[p]]
+    if index == root:
+      root_predecessors = array('q')
+      root_predecessors.frombytes(root_predecessor_bytes)
+      predecessors.extend(root_predecessors)
+      if sort_links:
+        # copies are not in the ids array
+        predecessors.sort(key=lambda p: (
+          ids[p] if p < first_index else first_id + p - first_index))
+    elif sort_links:
+      predecessors.sort()
+    predecessor_targets.extend(predecessors)
+    predecessor_offsets.append(len(predecessor_targets))
+
+  return ((successor_offsets.tobytes(), successor_targets.tobytes()),
+          (predecessor_offsets.tobytes(), predecessor_targets.tobytes()))
+
+
+def _append_rows(offsets, targets, rows):
+  range_offsets = array('q')
+  range_offsets.frombytes(rows[0])
+  shift = len(targets)
+  offsets.extend(offset + shift for offset in range_offsets[1:])
+  targets.frombytes(rows[1])
@@ -0,0 +1,135 @@
+import sys
+import time
+from array import array
+
+
+class ClonePlan(object):
+  """
+  Entities reachable from a root entity in depth-first visiting
+  order (root first) and links between them, stored as pairs of
+  positions in that order.
+  """
+
+  def __init__(self, entities, links):
+    self.entities = entities
+    self.links = links
+
+  def __len__(self):
+    return len(self.entities)
+
+  def get_size(self):
+    """
+    Gets approximate memory used by the plan in bytes
+    (entities themselves are shared with the graph).
+    """
+    return sys.getsizeof(self.entities) + sys.getsizeof(self.links)
+
+
+class ReachabilityIndex(object):
+  """
+  Cache of clone plans of a Graph, keyed by root entity id.
+
+  The graph keeps the index up to date: adding a link from an entity
+  (or replacing an entity) drops the plans that entity is part of.
+  Links and entities added by cloning never belong to existing plans,
+  so cloning the same root again is just copying its plan.
+
+  Successor sets changed directly (not through the graph)
+  are not noticed by the index.
+  """
+
+  def __init__(self, graph):
+    self.graph = graph
+    self.plans = {}
+    # entity id -> ids of roots whose plans contain the entity
+    self.roots_by_entity = {}
+    self.build_seconds = 0.0
+    self.hits = 0
+    self.misses = 0
+    self.invalidations = 0
+
+  def __len__(self):
+    return len(self.plans)
+
+  def get_plan(self, root_entity):
+    """
+    Gets clone plan for root_entity, building it if needed.
+    """
+    plan = self.plans.get(root_entity.id)
+    if plan is not None:
+      self.hits += 1
+      return plan
+
+    self.misses += 1
+    start = time.perf_counter()
+    graph = self.graph
+    entities = graph.get_reachable_entities(root_entity)
+    position_of = dict((entity.id, i) for i, entity in enumerate(entities))
+    links = array('l')
+    for i, entity in enumerate(entities):
+      for successor in graph.get_successors_for(entity):
+        links.append(i)
+        links.append(position_of[successor.id])
+    plan = ClonePlan(entities, links)
+
+    self.plans[root_entity.id] = plan
+    for entity_id in position_of:
+      self.roots_by_entity.setdefault(entity_id, set()).add(root_entity.id)
+    self.build_seconds += time.perf_counter() - start
+    return plan
+
+  def build(self, entity_ids=None):
+    """
+    Builds plans for the given roots (for all entities by default)
+    and returns index statistics (see get_stats()).
+    """
+    if entity_ids is None:
+      entity_ids = list(self.graph.entities.keys())
+    for entity_id in entity_ids:
+      root_entity = self.graph.entities.get(entity_id)
+      if root_entity is not None:
+        self.get_plan(root_entity)
+    return self.get_stats()
+
+  def invalidate(self, entity_id):
+    """
+    Drops plans containing the entity.
+    """
+    root_ids = self.roots_by_entity.pop(entity_id, None)
+    if not root_ids:
+      return
+    for root_id in root_ids:
+      plan = self.plans.pop(root_id, None)
+      if plan is None:
+        continue
+      self.invalidations += 1
+      for entity in plan.entities:
+        roots = self.roots_by_entity.get(entity.id)
+        if roots is not None:
+          roots.discard(root_id)
+          if not roots:
+            del self.roots_by_entity[entity.id]
+
+  def clear(self):
+    self.plans.clear()
+    self.roots_by_entity.clear()
+
+  def get_stats(self):
+    """
+    Gets a dictionary with number of plans, entities and links
+    they hold, approximate memory used (in bytes), time spent
+    building plans (in seconds) and cache hits/misses.
+    """
+    memory = sys.getsizeof(self.plans) + sys.getsizeof(self.roots_by_entity)
+    memory += sum(plan.get_size() for plan in self.plans.values())
+    memory += sum(sys.getsizeof(roots) for roots in self.roots_by_entity.values())
+    return {
+      'plans': len(self.plans),
+      'entities': sum(len(plan) for plan in self.plans.values()),
+      'links': sum(len(plan.links) // 2 for plan in self.plans.values()),
+      'memory_bytes': memory,
+      'build_seconds': self.build_seconds,
+      'hits': self.hits,
+      'misses': self.misses,
+      'invalidations': self.invalidations,
+    }
@@ -0,0 +1,345 @@
+"""
+Binary snapshots of CompactGraph objects.
+
+A snapshot is a header followed by int64 arrays and a string table,
+all stored the way CompactGraph keeps them in memory, so loading one
+is mapping the file and taking views of it (nothing is parsed or
+copied, and processes loading the same snapshot share its pages).
+
+Layout (native byte order, recorded in the header flags):
+
+  header          magic, version, flags, entity count, successor
+                  link count, predecessor link count, string count,
+                  string data size, next entity id
+  ids                 int64[entities]
+  name_refs           int64[entities]
+  description_refs    int64[entities]  (-1 for no description)
+  sorted_ids          int64[entities]  (ids in ascending order)
+  sorted_indexes      int64[entities]  (dense indexes of sorted_ids)
+  successor_offsets   int64[entities + 1]
+  successor_targets   int64[successor links]
+  predecessor_offsets int64[entities + 1]
+  predecessor_targets int64[predecessor links]
+  string_offsets      int64[strings + 1]
+  string data         utf-8, string_offsets are byte offsets into it
+"""
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from itertools import chain
+
+from graphclone.graph.models import CompactGraph
+
+try:
+  import numpy
+except ImportError:
+  # only used when CompactGraph copies entities with numpy
+  numpy = None
+
+MAGIC = b'GCSNAP\x00\x00'
+VERSION = 1
+
+# magic, version, flags, then counts/sizes and next entity id
+_HEADER = struct.Struct('=8sII6q')
+
+# rows of the link arrays are sorted by entity id
+FLAG_SORTED_LINKS = 1
+# arrays are stored big-endian
+FLAG_BIG_ENDIAN = 2
+
+# strings from json can contain lone surrogates
+_STRING_ERRORS = 'surrogatepass'
+
+
+class SnapshotError(ValueError):
+  """
+  Raised for files that are not snapshots this version can load.
+  """
+
+
+def is_snapshot(file_name):
+  """
+  Checks if file_name is a snapshot (by its first bytes).
+  """
+  with open(file_name, 'rb') as f:
+    return f.read(len(MAGIC)) == MAGIC
+
+
+def write_snapshot(graph, file_name):
+  """
+  Writes CompactGraph to file_name as a snapshot.
+
+  The snapshot is written next to file_name first and then moved
+  over it, so processes that have the old snapshot loaded keep
+  their mapping of it.
+  """
+  graph.build_links()
+  ids = graph.ids
+  count = len(ids)
+
+  if graph.sort_links:
+    sorted_indexes = graph.get_entity_indexes()
+  else:
+    sorted_indexes = array('q', sorted(range(count), key=ids.__getitem__))
+  sorted_ids = array('q', (ids[index] for index in sorted_indexes))
+
+  if graph.extra_successors:
+    # overflow lists are merged into the arrays
+    successor_offsets, successor_targets = _get_csr(graph.get_successor_indexes, count)
+    predecessor_offsets, predecessor_targets = _get_csr(graph.get_predecessor_indexes, count)
+  else:
+    successor_offsets = graph.successor_offsets
+    successor_targets = graph.successor_targets
+    predecessor_offsets = graph.predecessor_offsets
+    predecessor_targets = graph.predecessor_targets
+
+  string_offsets = array('q', [0])
+  string_data = bytearray()
+  for string in graph.strings:
+    string_data += string.encode('utf-8', _STRING_ERRORS)
+    string_offsets.append(len(string_data))
+
+  flags = FLAG_SORTED_LINKS if graph.sort_links else 0
+  if sys.byteorder == 'big':
+    flags |= FLAG_BIG_ENDIAN
+
+  temp_file_name = file_name + '.tmp'
+  with open(temp_file_name, 'wb') as f:
+    f.write(_HEADER.pack(MAGIC, VERSION, flags, count, len(successor_targets),
+                         len(predecessor_targets), len(string_offsets) - 1,
+                         len(string_data), graph.next_entity_id))
+    for values in (ids, graph.name_refs, graph.description_refs,
+                   sorted_ids, sorted_indexes,
+                   successor_offsets, successor_targets,
+                   predecessor_offsets, predecessor_targets,
+                   string_offsets):
+      if isinstance(values, _SnapshotArray):
+        # a graph loaded from another snapshot
+        f.write(values.mapped_values)
+        f.write(values.added)
+      else:
+        f.write(values)
+    f.write(string_data)
+  os.replace(temp_file_name, file_name)
+
+
+def _get_csr(get_row, count):
+  offsets = array('q', [0])
+  targets = array('q')
+  for index in range(count):
+    targets.extend(get_row(index))
+    offsets.append(len(targets))
+  return offsets, targets
+
+
+def load_snapshot(file_name, sort_links=False):
+  """
+  Loads snapshot written by write_snapshot() as a CompactGraph.
+
+  Arrays and strings of the graph are read from the mapped file,
+  and entities, links and strings added to the graph are kept
+  apart from them (see _SnapshotArray), so nothing is copied
+  from the file when the graph is changed.
+
+  :param sort_links:
+    same as for CompactGraph (links are always sorted, so
+    snapshots with unsorted links can't be loaded)
+  """
+  with open(file_name, 'rb') as f:
+    try:
+      mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+      # empty file
+      raise SnapshotError('{} is not a graph snapshot'.format(file_name))
+
+  if len(mapped) < _HEADER.size or mapped[:len(MAGIC)] != MAGIC:
+    raise SnapshotError('{} is not a graph snapshot'.format(file_name))
+  (_, version, flags, count, successor_count, predecessor_count,
+   string_count, string_size, next_entity_id) = _HEADER.unpack_from(mapped)
+  if version != VERSION:
+    raise SnapshotError('unsupported snapshot version: {}'.format(version))
+  if bool(flags & FLAG_BIG_ENDIAN) != (sys.byteorder == 'big'):
+    raise SnapshotError('snapshot was written with a different byte order')
+  if not flags & FLAG_SORTED_LINKS:
+    raise SnapshotError('snapshot links are not sorted')
+
+  sizes = [count, count, count, count, count,
+           count + 1, successor_count, count + 1, predecessor_count,
+           string_count + 1]
+  data_start = _HEADER.size + 8 * sum(sizes)
+  if len(mapped) != data_start + string_size:
+    raise SnapshotError('{} is truncated or corrupted'.format(file_name))
+
+  values = memoryview(mapped)[_HEADER.size:data_start].cast('q')
+  arrays = []
+  position = 0
+  for size in sizes:
+    arrays.append(values[position:position + size])
+    position += size
+  (ids, name_refs, description_refs, sorted_ids, sorted_indexes,
+   successor_offsets, successor_targets, predecessor_offsets, predecessor_targets,
+   string_offsets) = arrays
+
+  graph = CompactGraph(sort_links)
+  graph.mapped = mapped
+  graph.next_entity_id = next_entity_id
+  graph.index_of = _SnapshotIndex(sorted_ids, sorted_indexes)
+  graph.ids = _SnapshotArray(ids)
+  graph.sorted_indexes = _SnapshotArray(sorted_indexes)
+  graph.name_refs = _SnapshotArray(name_refs)
+  graph.description_refs = _SnapshotArray(description_refs)
+  graph.strings = _SnapshotStrings(string_offsets, memoryview(mapped)[data_start:])
+  # strings are only decoded when they are used, so string_refs
+  # starts empty: a string of the snapshot that is interned
+  # gets another reference (see CompactGraph.intern())
+  graph.string_refs = {}
+  graph.successor_offsets = _SnapshotArray(successor_offsets)
+  graph.successor_targets = _SnapshotArray(successor_targets)
+  graph.predecessor_offsets = _SnapshotArray(predecessor_offsets)
+  graph.predecessor_targets = _SnapshotArray(predecessor_targets)
+  return graph
+
+
+class _SnapshotArray(object):
+  """
+  int64 array of a snapshot: values in the mapped file followed by
+  values appended since loading (kept in an array). Supports what
+  CompactGraph does with its arrays.
+
+  Values of the file are only copied when one of them is replaced.
+  """
+
+  def __init__(self, mapped_values):
+    self.mapped_values = mapped_values
+    self.mapped_count = len(mapped_values)
+    self._set_added(array('q'))
+
+  def _set_added(self, added):
+    self.added = added
+    # bound to the array itself, graphs append per entity
+    self.append = added.append
+    self.extend = added.extend
+    self.frombytes = added.frombytes
+
+  def __len__(self):
+    return self.mapped_count + len(self.added)
+
+  def __iter__(self):
+    return chain(self.mapped_values, self.added)
+
+  def __getitem__(self, index):
+    if index.__class__ is int and 0 <= index < self.mapped_count:
+      # most reads
+      return self.mapped_values[index]
+    if isinstance(index, slice):
+      start, stop, step = index.indices(len(self))
+      mapped_count = self.mapped_count
+      if step != 1:
+        return array('q', (self[i] for i in range(start, stop, step)))
+      if stop <= mapped_count:
+        return self.mapped_values[start:stop]
+      if start >= mapped_count:
+        return self.added[start - mapped_count:stop - mapped_count]
+      return array('q', self.mapped_values[start:]) + self.added[:stop - mapped_count]
+    if index < 0:
+      index += len(self)
+      if index < 0:
+        raise IndexError('array index out of range')
+    if index < self.mapped_count:
+      return self.mapped_values[index]
+    return self.added[index - self.mapped_count]
+
+  def __setitem__(self, index, value):
+    if index < 0:
+      index += len(self)
+    if 0 <= index < self.mapped_count:
+      # the mapped values are read-only
+      self._set_added(array('q', self.mapped_values) + self.added)
+      self.mapped_values = self.mapped_values[:0]
+      self.mapped_count = 0
+    self.added[index - self.mapped_count] = value
+
+  def take(self, indexes):
+    """
+    Gets values at indexes (an int64 numpy array) as a numpy array.
+    """
+    values = numpy.empty(len(indexes), dtype=numpy.int64)
+    mapped = indexes < self.mapped_count
+    if self.mapped_count:
+      values[mapped] = numpy.frombuffer(self.mapped_values, dtype=numpy.int64)[indexes[mapped]]
+    if self.added:
+      added = ~mapped
+      # the view is dropped right away, so the array can grow
+      values[added] = numpy.frombuffer(self.added, dtype=numpy.int64)[
+        indexes[added] - self.mapped_count]
+    return values
+
+
+class _SnapshotIndex(object):
+  """
+  Entity id -> dense index mapping of a snapshot, looked up by
+  binary search in its sorted ids. Entities added after loading
+  are kept in a dictionary.
+  """
+
+  def __init__(self, sorted_ids, sorted_indexes):
+    self.sorted_ids = sorted_ids
+    self.sorted_indexes = sorted_indexes
+    self.added = {}
+
+  def __len__(self):
+    return len(self.sorted_ids) + len(self.added)
+
+  def __contains__(self, entity_id):
+    return self.get(entity_id) is not None
+
+  def __getitem__(self, entity_id):
+    index = self.get(entity_id)
+    if index is None:
+      raise KeyError(entity_id)
+    return index
+
+  def __setitem__(self, entity_id, index):
+    self.added[entity_id] = index
+
+  def get(self, entity_id, default=None):
+    index = self.added.get(entity_id)
+    if index is not None:
+      return index
+    sorted_ids = self.sorted_ids
+    position = bisect_left(sorted_ids, entity_id)
+    if position < len(sorted_ids) and sorted_ids[position] == entity_id:
+      return self.sorted_indexes[position]
+    return default
+
+  def update(self, items):
+    self.added.update(items)
+
+
+class _SnapshotStrings(object):
+  """
+  String table of a snapshot, decoding strings when they are used.
+  Strings added after loading are kept in a list.
+  """
+
+  def __init__(self, offsets, data):
+    self.offsets = offsets
+    self.data = data
+    self.mapped_count = len(offsets) - 1
+    self.added = []
+
+  def __len__(self):
+    return self.mapped_count + len(self.added)
+
+  def __getitem__(self, ref):
+    if not 0 <= ref < self.mapped_count:
+      if ref < 0:
+        raise IndexError(ref)
+      return self.added[ref - self.mapped_count]
+    return str(self.data[self.offsets[ref]:self.offsets[ref + 1]], 'utf-8', _STRING_ERRORS)
+
+  def append(self, string):
+    self.added.append(string)
@@ -0,0 +1,99 @@
+from unittest import TestCase
+
+from graphclone.graph.components import find_components
+from graphclone.graph.models import CompactGraph
+from graphclone.graph.models import Graph
+from graphclone.graph.traversal import TraversalBuffer
+
+
+class TestFindComponents(TestCase):
+
+  def find_components(self, successors, roots):
+    buffer = TraversalBuffer()
+    buffer.start(len(successors))
+    return find_components(roots, successors.__getitem__, None, buffer)
+
+  def test_find_components(self):
+    # 0 -> 1 -> 2 -> 0, 2 -> 3 -> 4 -> 3
+    successors = [[1], [2], [0, 3], [4], [3]]
+    order, components, depth = self.find_components(successors, [0])
+
+    self.assertListEqual(order, [0, 1, 2, 3, 4])
+    # sinks are found first
+    self.assertListEqual(components, [[3, 4], [0, 1, 2]])
+    self.assertEqual(depth, 5)
+
+  def test_find_components_of_several_roots(self):
+    successors = [[1], [], [1, 3], [2]]
+    order, components, depth = self.find_components(successors, [0, 1, 2, 3])
+
+    self.assertListEqual(order, [0, 1, 2, 3])
+    self.assertListEqual(components, [[1], [0], [2, 3]])
+    self.assertEqual(depth, 2)
+
+  def test_find_components_of_long_chain(self):
+    # deeper than the recursion limit
+    count = 20000
+    successors = [[i + 1] for i in range(count - 1)] + [[0]]
+    order, components, depth = self.find_components(successors, [0])
+
+    self.assertEqual(len(components), 1)
+    self.assertEqual(len(components[0]), count)
+    self.assertEqual(depth, count)
+
+
+class TestGraphComponents(TestCase):
+
+  def setUp(self):
+    # 1 <-> 2 -> 3 -> 4 -> 3, 5 -> 1, 6
+    self.input_dict = {
+      'entities': [{ 'entity_id': i, 'name': 'Entity{}'.format(i) } for i in range(1, 7)],
+      'links': [
+        { 'from': 1, 'to': 2 },
+        { 'from': 2, 'to': 1 },
+        { 'from': 2, 'to': 3 },
+        { 'from': 3, 'to': 4 },
+        { 'from': 4, 'to': 3 },
+        { 'from': 5, 'to': 1 },
+      ]
+    }
+
+  def test_get_strongly_connected_components(self):
+    graph = Graph.from_dict(self.input_dict, sort_links=True)
+    components = graph.get_strongly_connected_components()
+
+    self.assertListEqual([[entity.id for entity in component] for component in components],
+                         [[6], [5], [1, 2], [3, 4]])
+
+  def test_get_strongly_connected_components_of_compact_graph(self):
+    graph = CompactGraph.from_dict(self.input_dict, sort_links=True)
+    components = graph.get_strongly_connected_components()
+
+    self.assertListEqual([[graph.ids[index] for index in component] for component in components],
+                         [[6], [5], [1, 2], [3, 4]])
+
+  def test_get_condensation(self):
+    graph = Graph.from_dict(self.input_dict, sort_links=True)
+    condensation = graph.get_condensation(graph.entities[5])
+
+    self.assertListEqual([entity.id for entity in condensation.entities], [5, 1, 2, 3, 4])
+    self.assertListEqual(condensation.components, [[0], [1, 2], [3, 4]])
+    self.assertListEqual(
+      [[entity.id for entity in component] for component in condensation.get_component_entities()],
+      [[5], [1, 2], [3, 4]])
+
+  def test_clone_by_components(self):
+    for entity_ids in ([5], [1], [2, 4, 2]):
+      expected_graph = Graph.from_dict(self.input_dict, sort_links=True)
+      expected_graph.clone_many(entity_ids)
+      graph = Graph.from_dict(self.input_dict, sort_links=True)
+      graph.copy_by_components = True
+      graph.clone_many(entity_ids)
+      self.assertEqual(graph.to_dict(), expected_graph.to_dict())
+
+    expected_graph = Graph.from_dict(self.input_dict, sort_links=True)
+    expected_graph.clone(2)
+    graph = Graph.from_dict(self.input_dict, sort_links=True)
+    graph.copy_by_components = True
+    graph.clone(2)
+    self.assertEqual(graph.to_dict(), expected_graph.to_dict())
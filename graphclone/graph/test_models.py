@@ -1,7 +1,12 @@
 from unittest import TestCase
 
+from graphclone.benchmarks.generators import cyclic
+from graphclone.benchmarks.generators import power_law
+from graphclone.graph import models
+from graphclone.graph.models import CompactGraph
 from graphclone.graph.models import Entity
 from graphclone.graph.models import Graph
+from graphclone.graph.models import OverlayGraph
 
 class AssertEntityMixin(object):
   def assert_links(self, entity, successors=None, predecessors=None):
@@ -71,6 +76,49 @@ class TestEntity(TestCase, AssertEntityMixin):
     
     self.assert_links(self.entity, predecessors=set([pred, other_pred]))
 
+  def test_get_sorted_successors_is_cached_until_successor_is_added(self):
+    succ = Entity(3, 'succ')
+    other_succ = Entity(2, 'other_succ')
+    self.entity.add_successor(succ)
+    self.entity.add_successor(other_succ)
+    sorted_successors = self.entity.get_sorted_successors()
+
+    self.assertListEqual(sorted_successors, [other_succ, succ])
+    self.assertIs(self.entity.get_sorted_successors(), sorted_successors)
+
+    # bigger ids are appended to the cached list
+    last_succ = Entity(4, 'last_succ')
+    self.entity.add_successor(last_succ)
+    self.assertIs(self.entity.get_sorted_successors(), sorted_successors)
+    self.assertListEqual(sorted_successors, [other_succ, succ, last_succ])
+
+    first_succ = Entity(1, 'first_succ')
+    self.entity.add_successor(first_succ)
+    self.assertListEqual(self.entity.get_sorted_successors(),
+                         [first_succ, other_succ, succ, last_succ])
+
+  def test_get_sorted_predecessors_is_cached_until_predecessor_is_added(self):
+    pred = Entity(3, 'pred')
+    self.entity.add_predecessor(pred)
+    sorted_predecessors = self.entity.get_sorted_predecessors()
+
+    self.assertIs(self.entity.get_sorted_predecessors(), sorted_predecessors)
+
+    other_pred = Entity(2, 'other_pred')
+    self.entity.add_predecessor(other_pred)
+    self.assertListEqual(self.entity.get_sorted_predecessors(), [other_pred, pred])
+
+  def test_entities_share_empty_links_until_they_are_added(self):
+    other = Entity(2, 'other')
+    self.assertIs(self.entity.successors, other.predecessors)
+    self.assertListEqual(list(self.entity.get_sorted_successors()), [])
+
+    self.entity.add_successor(other)
+
+    self.assertSetEqual(self.entity.successors, set([other]))
+    self.assertSetEqual(other.successors, set())
+    self.assertFalse(hasattr(self.entity, '__dict__'))
+
   def test_copy(self):
     original = Entity(1, 'entity', 'description')
 
@@ -125,6 +173,33 @@ class TestGraphAddEntity(TestCase):
 
     self.assertDictEqual(self.graph.entities, { 1 : new_entity })
 
+  def test_add_entity_sets_dense_index(self):
+    entity_1 = Entity(10, 'Entity_10')
+    entity_2 = Entity(5, 'Entity_5')
+    self.graph.add_entity(entity_1)
+    self.graph.add_entity(entity_2)
+    new_entity = Entity(10, 'new')
+    self.graph.add_entity(new_entity)
+
+    self.assertEqual(entity_2.index, 1)
+    # replacing entity takes over the index
+    self.assertEqual(new_entity.index, 0)
+    self.assertListEqual(self.graph.entities_by_index, [new_entity, entity_2])
+    self.assertEqual(self.graph.get_index_count(), 2)
+
+  def test_add_entity_updates_sorted_entity_ids(self):
+    self.graph.add_entity(Entity(3, 'Entity_3'))
+    self.graph.add_entity(Entity(1, 'Entity_1'))
+    sorted_entity_ids = self.graph.get_entity_ids()
+    self.assertListEqual(sorted_entity_ids, [1, 3])
+
+    self.graph.add_entity(Entity(4, 'Entity_4'))
+    self.assertIs(self.graph.get_entity_ids(), sorted_entity_ids)
+    self.assertListEqual(sorted_entity_ids, [1, 3, 4])
+
+    self.graph.add_entity(Entity(2, 'Entity_2'))
+    self.assertListEqual(self.graph.get_entity_ids(), [1, 2, 3, 4])
+
   def test_add_entity_sets_next_entity_id(self):
     self.assertEqual(self.graph.next_entity_id, 1)
     new_entity = Entity(1, 'Entity_1')
@@ -189,6 +264,24 @@ class TestGraphLinkEntities(TestCase, AssertEntityMixin):
     self.assert_links(self.entity_1, successors=set([self.entity_2]))
     self.assert_links(self.entity_2, predecessors=set([self.entity_1]))
 
+  def test_link_entities_without_predecessor_tracking(self):
+    graph = Graph(track_predecessors=False)
+    entity_1 = Entity(1, 'E1')
+    entity_2 = Entity(2, 'E2')
+    entity_3 = Entity(3, 'E3')
+    for entity in (entity_3, entity_1, entity_2):
+      graph.add_entity(entity)
+    graph.link_entities(entity_3, entity_2)
+    graph.link_entities(entity_1, entity_2)
+
+    self.assert_links(entity_2)
+    self.assertListEqual(graph.get_predecessors_for(entity_2), [entity_1, entity_3])
+
+    graph.enable_predecessor_tracking()
+    self.assert_links(entity_2, predecessors=set([entity_1, entity_3]))
+    graph.link_entities(entity_2, entity_1)
+    self.assert_links(entity_1, successors=set([entity_2]), predecessors=set([entity_2]))
+
 
 class TestGraphFromDict(TestCase, AssertEntityMixin):
 
@@ -414,6 +507,31 @@ class TestGraphToDict(TestCase, AssertGraphDictMixin):
       ],
     })
 
+  def test_iter_entities_and_links_of_positions(self):
+    input_dict = {
+      'entities': [
+        { 'entity_id': i, 'name': 'E{}'.format(i) } for i in (4, 2, 3, 1)
+      ],
+      'links': [
+        { 'from': 1, 'to': 2 },
+        { 'from': 2, 'to': 3 },
+        { 'from': 3, 'to': 1 },
+        { 'from': 3, 'to': 4 },
+      ]
+    }
+    for graph in (Graph.from_dict(input_dict, sort_links=True),
+                  OverlayGraph(Graph.from_dict(input_dict, sort_links=True)),
+                  CompactGraph.from_dict(input_dict, sort_links=True)):
+      self.assertListEqual([e[0] for e in graph.iter_entities(1, 3)], [2, 3])
+      self.assertListEqual(list(graph.iter_links(1, 3)), [(2, 3), (3, 1), (3, 4)])
+      self.assertListEqual(list(graph.iter_links(3)), [])
+      self.assertListEqual(list(graph.iter_entities(4, 10)), [])
+
+      # copies are after the entities they were cloned from
+      graph.clone(4)
+      self.assertListEqual([e[0] for e in graph.iter_entities(3, 10)], [4, 5])
+      self.assertListEqual(list(graph.iter_links(2)), [(3, 1), (3, 4), (3, 5)])
+
 
 class TestGraphClone(TestCase, AssertGraphDictMixin):
 
@@ -634,3 +752,719 @@ class TestGraphClone(TestCase, AssertGraphDictMixin):
         { 'from': 11, 'to': 8 },
       ]
     })
+
+  def test_graph_clone_when_graph_is_a_deep_chain(self):
+    # deeper than the default recursion limit
+    chain_length = 5000
+    graph = Graph.from_dict({
+      'entities': [
+        { 'entity_id': i, 'name': 'E{}'.format(i) }
+        for i in range(1, chain_length + 1)
+      ],
+      'links': [
+        { 'from': i, 'to': i + 1 }
+        for i in range(1, chain_length)
+      ]
+    }, sort_links=True)
+    graph.clone(1)
+
+    self.assertEqual(len(graph.entities), 2 * chain_length)
+    for i in range(1, chain_length):
+      original = graph.entities[i]
+      copy = graph.entities[chain_length + i]
+      self.assertEqual(copy.name, original.name)
+      self.assertListEqual(
+        [e.id for e in copy.successors], [chain_length + i + 1])
+
+  def test_graph_clone_without_predecessor_tracking(self):
+    input_dict = {
+      'entities': [
+        { 'entity_id': i, 'name': 'E{}'.format(i) } for i in range(1, 6)
+      ],
+      'links': [
+        { 'from': 1, 'to': 3 },
+        { 'from': 2, 'to': 3 },
+        { 'from': 3, 'to': 4 },
+        { 'from': 4, 'to': 3 },
+        { 'from': 5, 'to': 1 },
+      ]
+    }
+    graph = Graph.from_dict(input_dict, sort_links=True)
+    untracked_graph = Graph.from_dict(input_dict, sort_links=True, track_predecessors=False)
+
+    for entity_id in (3, 1):
+      graph.clone(entity_id)
+      untracked_graph.clone(entity_id)
+
+    self.assert_graph_dict(untracked_graph.to_dict(), graph.to_dict())
+
+
+class TestCompactGraph(TestCase, AssertGraphDictMixin):
+
+  def setUp(self):
+    self.maxDiff = None
+    self.input_dict = {
+      'entities': [
+        { 'entity_id': 1, 'name': 'E1' },
+        { 'entity_id': 2, 'name': 'E2', 'description': 'test' },
+        { 'entity_id': 3, 'name': 'E3' },
+        { 'entity_id': 4, 'name': 'E4' },
+        { 'entity_id': 5, 'name': 'E5' },
+        { 'entity_id': 6, 'name': 'E6' },
+      ],
+      'links': [
+        { 'from': 1, 'to': 2 },
+        { 'from': 2, 'to': 3 },
+        { 'from': 3, 'to': 4 },
+        { 'from': 4, 'to': 2 },
+        { 'from': 4, 'to': 5 },
+        { 'from': 5, 'to': 6 },
+        { 'from': 6, 'to': 4 },
+        # duplicated link and link to unknown entity are dropped
+        { 'from': 1, 'to': 2 },
+        { 'from': 1, 'to': 7 },
+      ]
+    }
+
+  def test_from_dict_interns_strings(self):
+    graph = CompactGraph.from_dict({
+      'entities': [
+        { 'entity_id': 1, 'name': 'E', 'description': 'E' },
+        { 'entity_id': 2, 'name': 'E' },
+      ]
+    })
+    self.assertListEqual(graph.strings, ['E'])
+    self.assertListEqual(list(graph.name_refs), [0, 0])
+    self.assertListEqual(list(graph.description_refs), [0, -1])
+
+  def test_from_dict_builds_adjacency(self):
+    graph = CompactGraph.from_dict(self.input_dict, sort_links=True)
+    index_of = graph.index_of
+
+    self.assertEqual(len(graph), 6)
+    self.assertListEqual(
+      list(graph.get_successor_indexes(index_of[4])),
+      [index_of[2], index_of[5]])
+    self.assertListEqual(
+      list(graph.get_predecessor_indexes(index_of[2])),
+      [index_of[1], index_of[4]])
+
+  def test_get_entity_indexes_is_extended_by_clones(self):
+    graph = CompactGraph.from_dict(self.input_dict, sort_links=True)
+    sorted_indexes = graph.get_entity_indexes()
+    graph.clone(5)
+
+    self.assertIs(graph.get_entity_indexes(), sorted_indexes)
+    self.assertListEqual([graph.ids[index] for index in sorted_indexes],
+                         sorted(graph.ids))
+
+  def test_to_dict(self):
+    graph = CompactGraph.from_dict(self.input_dict, sort_links=True)
+    expected_dict = Graph.from_dict(self.input_dict, sort_links=True).to_dict()
+
+    self.assertEqual(graph.to_dict(), expected_dict)
+
+  def test_clone_when_provided_id_doesnt_exist_in_graph(self):
+    graph = CompactGraph.from_dict(self.input_dict, sort_links=True)
+    graph.clone(10)
+    expected_dict = Graph.from_dict(self.input_dict, sort_links=True).to_dict()
+
+    self.assertEqual(graph.to_dict(), expected_dict)
+
+  def test_clone_matches_graph_clone(self):
+    graph = CompactGraph.from_dict(self.input_dict, sort_links=True)
+    graph.clone(3)
+    graph.clone(4)
+    expected_graph = Graph.from_dict(self.input_dict, sort_links=True)
+    expected_graph.clone(3)
+    expected_graph.clone(4)
+
+    self.assertEqual(graph.to_dict(), expected_graph.to_dict())
+    self.assertEqual(graph.next_entity_id, expected_graph.next_entity_id)
+
+  def test_clone_with_and_without_numpy(self):
+    if models.numpy is None:
+      self.skipTest('numpy is not installed')
+
+    graph = CompactGraph.from_dict(self.input_dict, sort_links=True)
+    graph.numpy_min_copies = 1
+    graph.clone(3)
+    graph.clone_many([4, 1])
+    expected_graph = CompactGraph.from_dict(self.input_dict, sort_links=True)
+    expected_graph.use_numpy = False
+    expected_graph.clone(3)
+    expected_graph.clone_many([4, 1])
+
+    self.assertEqual(graph.to_dict(), expected_graph.to_dict())
+    for name in ('ids', 'name_refs', 'description_refs',
+                 'successor_offsets', 'successor_targets',
+                 'predecessor_offsets', 'predecessor_targets'):
+      self.assertEqual(getattr(graph, name), getattr(expected_graph, name))
+
+
+class TestGraphFromRecords(TestCase, AssertGraphDictMixin):
+
+  def test_from_records_when_links_come_before_entities(self):
+    records = [
+      ('links', { 'from': 1, 'to': 2 }),
+      ('links', { 'from': 2, 'to': 3 }),
+      ('entities', { 'entity_id': 1, 'name': 'E1' }),
+      ('entities', { 'entity_id': 2, 'name': 'E2' }),
+      ('other', { 'entity_id': 3, 'name': 'E3' }),
+    ]
+    expected_dict = {
+      'entities': [
+        { 'entity_id': 1, 'name': 'E1' },
+        { 'entity_id': 2, 'name': 'E2' },
+      ],
+      'links': [
+        { 'from': 1, 'to': 2 },
+      ]
+    }
+
+    for graph_class in (Graph, CompactGraph):
+      graph = graph_class.from_records(iter(records), sort_links=True)
+      self.assert_graph_dict(graph.to_dict(), expected_dict)
+
+
+class TestGraphCloneMany(TestCase, AssertGraphDictMixin):
+
+  def setUp(self):
+    self.maxDiff = None
+    self.input_dict = {
+      'entities': [
+        { 'entity_id': 1, 'name': 'E1' },
+        { 'entity_id': 2, 'name': 'E2' },
+        { 'entity_id': 3, 'name': 'E3' },
+      ],
+      'links': [
+        { 'from': 1, 'to': 2 },
+        { 'from': 2, 'to': 3 },
+      ]
+    }
+
+  def test_clone_many_when_ids_dont_exist_in_graph(self):
+    graph = Graph.from_dict(self.input_dict)
+    graph.clone_many([4, 5])
+    self.assert_graph_dict(graph.to_dict(), self.input_dict)
+
+  def test_clone_many_with_single_id_is_same_as_clone(self):
+    graph = Graph.from_dict(self.input_dict)
+    graph.clone_many([2])
+    expected_graph = Graph.from_dict(self.input_dict)
+    expected_graph.clone(2)
+
+    self.assert_graph_dict(graph.to_dict(), expected_graph.to_dict())
+
+  def test_clone_many_without_predecessor_tracking(self):
+    graph = Graph.from_dict(self.input_dict, track_predecessors=False)
+    graph.clone_many([2])
+    self.assertFalse(graph.track_predecessors)
+    graph.clone_many([2, 3])
+    # one pass for all roots instead of one per root
+    self.assertTrue(graph.track_predecessors)
+
+    expected_graph = Graph.from_dict(self.input_dict)
+    expected_graph.clone_many([2])
+    expected_graph.clone_many([2, 3])
+    self.assert_graph_dict(graph.to_dict(), expected_graph.to_dict())
+
+  def test_sequential_clones_dont_depend_on_predecessor_tracking(self):
+    # copies of 2 are cloned again, 1 links to every copy
+    sequence = [[2], [4], [2, 6], [8, 3]]
+    expected_graph = Graph.from_dict(self.input_dict, track_predecessors=False)
+    for entity_ids in sequence:
+      expected_graph.clone_many(entity_ids)
+    self.assertListEqual(
+      [(link['from'], link['to']) for link in expected_graph.to_dict()['links'] if link['from'] == 1],
+      [(1, 2), (1, 4), (1, 6), (1, 8), (1, 10), (1, 12)])
+
+    graphs = [Graph.from_dict(self.input_dict),
+              Graph.from_dict(self.input_dict, track_predecessors=False),
+              CompactGraph.from_dict(self.input_dict)]
+    for i, entity_ids in enumerate(sequence):
+      if i == 2:
+        # tracking enabled after some clones
+        graphs[1].enable_predecessor_tracking()
+      for graph in graphs:
+        graph.clone_many(entity_ids)
+    for graph in graphs:
+      self.assertEqual(graph.to_dict(), expected_graph.to_dict())
+
+  def test_clone_many_clones_from_original_graph(self):
+    graph = Graph.from_dict(self.input_dict)
+    # copy of 3 made for 2 is not cloned again for 1
+    graph.clone_many([3, 2, 2])
+
+    self.assert_graph_dict(graph.to_dict(), {
+      'entities': [
+        { 'entity_id': 1, 'name': 'E1' },
+        { 'entity_id': 2, 'name': 'E2' },
+        { 'entity_id': 3, 'name': 'E3' },
+        # Cloned 3
+        { 'entity_id': 4, 'name': 'E3' },
+        # Cloned 2
+        { 'entity_id': 5, 'name': 'E2' },
+        { 'entity_id': 6, 'name': 'E3' },
+        # Cloned 2 again
+        { 'entity_id': 7, 'name': 'E2' },
+        { 'entity_id': 8, 'name': 'E3' },
+      ],
+      'links': [
+        { 'from': 1, 'to': 2 },
+        { 'from': 2, 'to': 3 },
+        { 'from': 2, 'to': 4 },
+        { 'from': 1, 'to': 5 },
+        { 'from': 5, 'to': 6 },
+        { 'from': 1, 'to': 7 },
+        { 'from': 7, 'to': 8 },
+      ]
+    })
+
+  def count_traversals(self, graph):
+    roots = []
+    get_reachable_entities = graph.get_reachable_entities
+
+    def counting_get_reachable_entities(root_entity):
+      roots.append(root_entity.id)
+      return get_reachable_entities(root_entity)
+
+    graph.get_reachable_entities = counting_get_reachable_entities
+    return roots
+
+  def test_clone_many_reuses_traversal_of_repeated_id(self):
+    graph = Graph.from_dict(self.input_dict)
+    roots = self.count_traversals(graph)
+    graph.clone_many([2, 2])
+
+    self.assertListEqual(roots, [2])
+    self.assertEqual(graph.get_entity_count(), 7)
+
+  def test_clone_many_traverses_overlapping_roots_separately(self):
+    graph = Graph.from_dict(self.input_dict)
+    roots = self.count_traversals(graph)
+    # the subgraph of 2 is part of the one of 1
+    graph.clone_many([1, 2])
+
+    self.assertListEqual(roots, [1, 2])
+    expected_graph = Graph.from_dict(self.input_dict)
+    expected_graph.clone(1)
+    expected_graph.clone(2)
+    self.assert_graph_dict(graph.to_dict(), expected_graph.to_dict())
+
+  def test_compact_graph_clone_many_matches_graph_clone_many(self):
+    graph = CompactGraph.from_dict(self.input_dict, sort_links=True)
+    graph.clone_many([3, 2, 2])
+    expected_graph = Graph.from_dict(self.input_dict, sort_links=True)
+    expected_graph.clone_many([3, 2, 2])
+
+    self.assertEqual(graph.to_dict(), expected_graph.to_dict())
+
+
+
+class TestOverlayGraph(TestCase, AssertGraphDictMixin):
+
+  def setUp(self):
+    self.maxDiff = None
+    self.input_dict = {
+      'entities': [
+        { 'entity_id': 1, 'name': 'E1' },
+        { 'entity_id': 2, 'name': 'E2' },
+        { 'entity_id': 3, 'name': 'E3' },
+      ],
+      'links': [
+        { 'from': 1, 'to': 2 },
+        { 'from': 2, 'to': 3 },
+        { 'from': 3, 'to': 2 },
+      ]
+    }
+
+  def test_clone_matches_graph_clone(self):
+    base = Graph.from_dict(self.input_dict)
+    graph = OverlayGraph(base)
+    graph.clone(2)
+    graph.clone_many([3, 1])
+    expected_graph = Graph.from_dict(self.input_dict)
+    expected_graph.clone(2)
+    expected_graph.clone_many([3, 1])
+
+    self.assertEqual(graph.to_dict(), expected_graph.to_dict())
+    self.assertEqual(graph.get_link_count(), expected_graph.get_link_count())
+
+  def test_clone_doesnt_change_base(self):
+    base = Graph.from_dict(self.input_dict)
+    graph = OverlayGraph(base)
+    graph.clone(2)
+    graph.link_entities_by_id(1, 3)
+
+    self.assert_graph_dict(base.to_dict(), self.input_dict)
+    # only the copies are stored in the overlay
+    self.assertEqual(sorted(graph.get_overlay_entities()), [4, 5])
+
+  def test_overlays_share_base(self):
+    base = Graph.from_dict(self.input_dict)
+    base.enable_reachability_index()
+    first_graph = OverlayGraph(base)
+    first_graph.clone(1)
+    second_graph = OverlayGraph(base)
+    second_graph.clone(1)
+
+    self.assertEqual(first_graph.to_dict(), second_graph.to_dict())
+
+  def test_overlay_entities_are_indexed_after_base(self):
+    base = Graph.from_dict(self.input_dict)
+    graph = OverlayGraph(base)
+    graph.clone(2)
+
+    self.assertEqual(base.get_index_count(), 3)
+    self.assertEqual(graph.get_index_count(), 5)
+    self.assertListEqual([entity.index for entity in graph.entities_by_index], [3, 4])
+
+  def test_overlay_over_overlay(self):
+    base = Graph.from_dict(self.input_dict)
+    graph = OverlayGraph(base)
+    graph.clone(2)
+    graph_dict = graph.to_dict()
+    nested_graph = OverlayGraph(graph)
+    nested_graph.clone(4)
+    expected_graph = Graph.from_dict(self.input_dict)
+    expected_graph.clone(2)
+    expected_graph.clone(4)
+
+    self.assertEqual(nested_graph.to_dict(), expected_graph.to_dict())
+    self.assertEqual(graph.to_dict(), graph_dict)
+
+  def test_clone_many_of_copy_ids_with_reachability_index(self):
+    base = Graph.from_dict(self.input_dict)
+    base.enable_reachability_index()
+    graph = OverlayGraph(base)
+    # 5 is the id of a copy made for 2
+    graph.clone_many([2, 5])
+    expected_graph = Graph.from_dict(self.input_dict)
+    expected_graph.clone_many([2, 5])
+
+    self.assertEqual(graph.to_dict(), expected_graph.to_dict())
+
+  def test_entities_can_not_be_removed(self):
+    graph = OverlayGraph(Graph.from_dict(self.input_dict))
+    with self.assertRaises(TypeError):
+      graph.remove_entity(1)
+    with self.assertRaises(TypeError):
+      graph.unlink_entities_by_id(1, 2)
+
+  def test_apply_patch(self):
+    base = Graph.from_dict(self.input_dict)
+    graph = OverlayGraph(base)
+    graph.apply_patch({
+      'entities': [{ 'entity_id': 4, 'name': 'E4' }],
+      'links': [{ 'from': 3, 'to': 4 }],
+    })
+    expected_graph = Graph.from_dict(self.input_dict)
+    expected_graph.add_entity(Entity(4, 'E4'))
+    expected_graph.link_entities_by_id(3, 4)
+    self.assertEqual(graph.to_dict(), expected_graph.to_dict())
+
+    # entities added to the overlay can be changed
+    graph.apply_patch({ 'entities': [{ 'entity_id': 4, 'name': 'E4!' }] })
+    expected_graph.entities[4].name = 'E4!'
+    self.assertEqual(graph.to_dict(), expected_graph.to_dict())
+
+    for patch in ({ 'removed_entities': [1], 'entities': [{ 'entity_id': 5, 'name': 'E5' }] },
+                  { 'removed_links': [{ 'from': 1, 'to': 2 }], 'links': [{ 'from': 4, 'to': 1 }] },
+                  { 'entities': [{ 'entity_id': 5, 'name': 'E5' },
+                                 { 'entity_id': 2, 'name': 'CHANGED' }] }):
+      with self.assertRaises(TypeError):
+        graph.apply_patch(patch)
+      # nothing is changed
+      self.assertEqual(graph.to_dict(), expected_graph.to_dict())
+    self.assertEqual(base.to_dict(), Graph.from_dict(self.input_dict).to_dict())
+
+
+class TestGraphApplyPatch(TestCase, AssertEntityMixin, AssertGraphDictMixin):
+
+  def setUp(self):
+    self.input_dict = {
+      'entities': [
+        { 'entity_id': i, 'name': 'E{}'.format(i) } for i in range(1, 5)
+      ],
+      'links': [
+        { 'from': 1, 'to': 2 },
+        { 'from': 2, 'to': 3 },
+        { 'from': 3, 'to': 4 },
+        { 'from': 4, 'to': 2 },
+      ]
+    }
+
+  def test_remove_entity(self):
+    graph = Graph.from_dict(self.input_dict, sort_links=True)
+    entity_2 = graph.entities[2]
+    entity_4 = graph.entities[4]
+    graph.get_entity_ids()
+
+    self.assertIs(graph.remove_entity(4), entity_4)
+    self.assertIsNone(graph.remove_entity(4))
+
+    self.assert_links(entity_4)
+    self.assert_links(graph.entities[3], predecessors=set([entity_2]))
+    self.assert_links(entity_2, successors=set([graph.entities[3]]),
+                      predecessors=set([graph.entities[1]]))
+    self.assertListEqual(graph.get_entity_ids(), [1, 2, 3])
+    self.assertIsNone(graph.entities_by_index[entity_4.index])
+    # the same as for a graph created without the entity
+    self.assertEqual(graph.next_entity_id, 4)
+
+  def test_unlink_entities(self):
+    graph = Graph.from_dict(self.input_dict, sort_links=True)
+    entity_2 = graph.entities[2]
+    entity_3 = graph.entities[3]
+
+    graph.unlink_entities_by_id(2, 3)
+    graph.unlink_entities_by_id(2, 3)
+
+    self.assert_links(entity_2, predecessors=set([graph.entities[1], graph.entities[4]]))
+    self.assert_links(entity_3, successors=set([graph.entities[4]]))
+
+  def test_apply_patch(self):
+    graph = Graph.from_dict(self.input_dict, sort_links=True, track_predecessors=False)
+    entity_3 = graph.entities[3]
+    graph.apply_patch({
+      'removed_links': [{ 'from': 1, 'to': 2 }, { 'from': 1, 'to': 9 }],
+      'removed_entities': [2, 9],
+      'entities': [
+        { 'entity_id': 3, 'name': 'E3', 'description': 'changed' },
+        { 'entity_id': 7, 'name': 'E7' },
+      ],
+      'links': [{ 'from': 7, 'to': 3 }, { 'from': 8, 'to': 3 }],
+    })
+
+    # changed entities keep their links
+    self.assertIs(graph.entities[3], entity_3)
+    self.assert_graph_dict(graph.to_dict(), {
+      'entities': [
+        { 'entity_id': 1, 'name': 'E1' },
+        { 'entity_id': 3, 'name': 'E3', 'description': 'changed' },
+        { 'entity_id': 4, 'name': 'E4' },
+        { 'entity_id': 7, 'name': 'E7' },
+      ],
+      'links': [
+        { 'from': 3, 'to': 4 },
+        { 'from': 7, 'to': 3 },
+      ]
+    })
+
+  def test_apply_patch_keeps_plans_of_unchanged_subgraphs(self):
+    graph = Graph.from_dict(self.input_dict, sort_links=True)
+    index = graph.enable_reachability_index()
+    index.build([1, 3])
+    graph.add_entity(Entity(5, 'E5'))
+    index.build([5])
+
+    graph.apply_patch({'links': [{ 'from': 5, 'to': 1 }]})
+    self.assertEqual(index.get_stats()['plans'], 2)
+    graph.apply_patch({'removed_links': [{ 'from': 4, 'to': 2 }]})
+    self.assertEqual(index.get_stats()['plans'], 0)
+
+
+class TestGraphBoundedClone(TestCase, AssertGraphDictMixin):
+
+  def setUp(self):
+    # 1 -> 2 -> 3 -> 4, and a shortcut 1 -> 4
+    self.input_dict = {
+      'entities': [
+        { 'entity_id': 1, 'name': 'root' },
+        { 'entity_id': 2, 'name': 'keep' },
+        { 'entity_id': 3, 'name': 'skip' },
+        { 'entity_id': 4, 'name': 'keep' },
+      ],
+      'links': [
+        { 'from': 1, 'to': 2 },
+        { 'from': 2, 'to': 3 },
+        { 'from': 3, 'to': 4 },
+        { 'from': 1, 'to': 4 },
+        { 'from': 4, 'to': 1 },
+      ]
+    }
+
+  def get_copies(self, graph):
+    return [(entity.id, entity.name, sorted(e.id for e in entity.successors))
+            for entity in graph.entities.values() if entity.id > 4]
+
+  def test_clone_with_max_depth(self):
+    graph = Graph.from_dict(self.input_dict, sort_links=True)
+    graph.clone(1, max_depth=1)
+
+    # 4 is one link away through the shortcut, 3 is two links away
+    self.assertListEqual(self.get_copies(graph), [
+      (5, 'root', [6, 7]),
+      (6, 'keep', []),
+      (7, 'keep', [5]),
+    ])
+    self.assertIn(graph.entities[5], graph.entities[4].successors)
+
+  def test_clone_with_max_depth_zero(self):
+    graph = Graph.from_dict(self.input_dict, sort_links=True)
+    graph.clone(2, max_depth=0)
+    self.assertListEqual(self.get_copies(graph), [(5, 'keep', [])])
+
+  def test_clone_with_entity_filter(self):
+    graph = Graph.from_dict(self.input_dict, sort_links=True)
+    graph.clone(1, entity_filter=lambda entity: entity.name == 'keep')
+
+    self.assertListEqual(self.get_copies(graph), [
+      (5, 'root', [6, 7]),
+      (6, 'keep', []),
+      (7, 'keep', [5]),
+    ])
+
+  def test_clone_with_max_entities(self):
+    graph = Graph.from_dict(self.input_dict, sort_links=True)
+    graph_dict = graph.to_dict()
+
+    with self.assertRaises(models.CloneSizeError):
+      graph.clone(1, max_entities=3)
+    self.assert_graph_dict(graph.to_dict(), graph_dict)
+
+    graph.clone(1, max_entities=4)
+    self.assertEqual(len(self.get_copies(graph)), 4)
+
+  def test_clone_many_with_max_entities(self):
+    graph = Graph.from_dict(self.input_dict, sort_links=True)
+    graph_dict = graph.to_dict()
+
+    with self.assertRaises(models.CloneSizeError):
+      graph.clone_many([2, 3], max_entities=6)
+    self.assert_graph_dict(graph.to_dict(), graph_dict)
+
+    graph.clone_many([2, 3], max_depth=1, max_entities=4)
+    expected_graph = Graph.from_dict(self.input_dict, sort_links=True)
+    expected_graph.clone_many([2, 3], max_depth=1)
+    self.assert_graph_dict(graph.to_dict(), expected_graph.to_dict())
+    self.assertEqual(len(self.get_copies(graph)), 4)
+
+
+class TestGraphEstimateClone(TestCase):
+
+  def setUp(self):
+    # 1 -> 2 -> 3 -> 1, 2 -> 4, and 5 -> 2
+    self.input_dict = {
+      'entities': [
+        { 'entity_id': 1, 'name': 'A' },
+        { 'entity_id': 2, 'name': 'B' },
+        { 'entity_id': 3, 'name': 'C' },
+        { 'entity_id': 4, 'name': 'D' },
+        { 'entity_id': 5, 'name': 'E' },
+      ],
+      'links': [
+        { 'from': 1, 'to': 2 },
+        { 'from': 2, 'to': 3 },
+        { 'from': 3, 'to': 1 },
+        { 'from': 2, 'to': 4 },
+        { 'from': 5, 'to': 2 },
+      ]
+    }
+
+  def assert_estimate(self, graph, entity_id, **bounds):
+    estimate = graph.estimate_clone(entity_id, **bounds)
+    entity_count = graph.get_entity_count()
+    link_count = graph.get_link_count()
+    graph.clone(entity_id, **bounds)
+
+    self.assertFalse(estimate.lower_bound)
+    self.assertEqual(estimate.entities, graph.get_entity_count() - entity_count)
+    self.assertEqual(estimate.links + estimate.predecessor_links,
+                     graph.get_link_count() - link_count)
+    return estimate
+
+  def test_estimate_clone(self):
+    graph = Graph.from_dict(self.input_dict)
+    graph_dict = graph.to_dict()
+    estimate = graph.estimate_clone(2)
+
+    self.assertDictEqual(estimate.to_dict(), {
+      'entities': 4, 'links': 4, 'predecessor_links': 2, 'lower_bound': False})
+    self.assertEqual(graph.to_dict(), graph_dict)
+    self.assertIsNone(graph.estimate_clone(6))
+
+  def test_estimate_matches_clone(self):
+    for track_predecessors in (True, False):
+      graph = Graph.from_dict(self.input_dict, sort_links=True,
+                              track_predecessors=track_predecessors)
+      self.assert_estimate(graph, 2)
+      self.assert_estimate(graph, 4)
+      self.assert_estimate(graph, 5)
+
+  def test_estimate_bounded_clone(self):
+    graph = Graph.from_dict(self.input_dict, sort_links=True)
+    estimate = self.assert_estimate(graph, 1, max_depth=1)
+    self.assertEqual(estimate.entities, 2)
+    estimate = self.assert_estimate(graph, 1, entity_filter=lambda entity: entity.name != 'C')
+    self.assertEqual(estimate.entities, 3)
+
+    with self.assertRaises(ValueError):
+      graph.estimate_clone(1, max_depth=1, sample_size=1)
+
+  def test_estimate_with_reachability_index(self):
+    graph = Graph.from_dict(self.input_dict, sort_links=True)
+    graph.enable_reachability_index()
+    self.assert_estimate(graph, 4)
+    # the plan is there now
+    self.assertEqual(len(graph.reachability_index), 1)
+    self.assert_estimate(graph, 4)
+
+  def test_estimate_in_overlay(self):
+    graph = OverlayGraph(Graph.from_dict(self.input_dict, sort_links=True))
+    graph.clone(3)
+    self.assert_estimate(graph, 2)
+    self.assert_estimate(graph, 6)
+
+  def test_sampled_estimate(self):
+    for graph_class in (Graph, CompactGraph):
+      graph = graph_class.from_dict(self.input_dict)
+      estimate = graph.estimate_clone(1, sample_size=1)
+      # only links of 1 were counted, 2 was found through them
+      self.assertDictEqual(estimate.to_dict(), {
+        'entities': 2, 'links': 1, 'predecessor_links': 1, 'lower_bound': True})
+
+      estimate = graph.estimate_clone(1, sample_size=10)
+      self.assertDictEqual(estimate.to_dict(), {
+        'entities': 4, 'links': 4, 'predecessor_links': 1, 'lower_bound': False})
+
+      for sample_size in (0, -1):
+        with self.assertRaises(ValueError):
+          graph.estimate_clone(1, sample_size=sample_size)
+
+  def test_sampled_estimate_is_lower_bound(self):
+    for generator in (power_law, cyclic):
+      records = list(generator(2000, seed=1))
+      for graph in (Graph.from_records(records), CompactGraph.from_records(records)):
+        for entity_id in (1, 1000, 2000):
+          size = graph.estimate_clone(entity_id)
+          self.assertFalse(size.lower_bound)
+          for sample_size in (1, 10, 100, 1000):
+            sampled = graph.estimate_clone(entity_id, sample_size=sample_size)
+            self.assertLessEqual(sampled.entities, size.entities)
+            self.assertLessEqual(sampled.links, size.links)
+            if not sampled.lower_bound:
+              self.assertDictEqual(sampled.to_dict(), size.to_dict())
+            self.assertEqual(sampled.predecessor_links, size.predecessor_links)
+          # counting every entity gives the exact size
+          sampled = graph.estimate_clone(entity_id, sample_size=size.entities)
+          self.assertDictEqual(sampled.to_dict(), size.to_dict())
+
+  def test_estimate_compact_graph(self):
+    graph = CompactGraph.from_dict(self.input_dict, sort_links=True)
+    self.assertDictEqual(graph.estimate_clone(2).to_dict(), {
+      'entities': 4, 'links': 4, 'predecessor_links': 2, 'lower_bound': False})
+    self.assertIsNone(graph.estimate_clone(6))
+
+    # overflow links are counted too
+    graph.clone(2)
+    graph.link_entities_by_id(4, 5)
+    graph.build_links()
+    entity_count = graph.get_entity_count()
+    link_count = graph.get_link_count()
+    estimate = graph.estimate_clone(2)
+    graph.clone(2)
+    self.assertEqual(estimate.entities, graph.get_entity_count() - entity_count)
+    self.assertEqual(estimate.links + estimate.predecessor_links,
+                     graph.get_link_count() - link_count)
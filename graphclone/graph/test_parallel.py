@@ -0,0 +1,138 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from graphclone.graph.models import CompactGraph
+from graphclone.graph.parallel import build_compact_graph
+from graphclone.graph.parallel import clone_compact_graph
+from graphclone.graph.snapshot import load_snapshot
+from graphclone.graph.snapshot import write_snapshot
+
+
+class TestBuildCompactGraph(TestCase):
+
+  def setUp(self):
+    self.records = [
+      ('links', { 'from': 4, 'to': 1 }),
+      ('entities', { 'entity_id': 4, 'name': 'E4' }),
+      ('entities', { 'entity_id': 2, 'name': 'E2', 'description': 'D2' }),
+      ('entities', { 'entity_id': 1, 'name': 'E1' }),
+      ('entities', { 'entity_id': 3, 'name': 'E3' }),
+      ('links', { 'from': 1, 'to': 2 }),
+      ('links', { 'from': 1, 'to': 3 }),
+      ('links', { 'from': 4, 'to': 2 }),
+      ('links', { 'from': 1, 'to': 2 }),
+      ('links', { 'from': 3, 'to': 1 }),
+      # unknown entity
+      ('links', { 'from': 5, 'to': 1 }),
+      ('links', { 'from': 2, 'to': 2 }),
+    ]
+
+  def assert_same_graph(self, graph, expected_graph):
+    for name in ('ids', 'name_refs', 'description_refs',
+                 'successor_offsets', 'successor_targets',
+                 'predecessor_offsets', 'predecessor_targets'):
+      self.assertEqual(getattr(graph, name), getattr(expected_graph, name), name)
+    self.assertEqual(graph.to_dict(), expected_graph.to_dict())
+
+  def test_build_compact_graph_is_same_as_from_records(self):
+    for sort_links in (False, True):
+      graph = build_compact_graph(self.records, sort_links=sort_links, workers=2, chunk_size=2)
+      expected_graph = CompactGraph.from_records(self.records, sort_links=sort_links)
+
+      self.assert_same_graph(graph, expected_graph)
+
+  def test_build_compact_graph_when_there_are_no_links(self):
+    records = [record for record in self.records if record[0] == 'entities']
+    graph = build_compact_graph(records, workers=2)
+
+    self.assert_same_graph(graph, CompactGraph.from_records(records))
+
+  def test_clone_after_build_compact_graph(self):
+    graph = build_compact_graph(self.records, sort_links=True, workers=3, chunk_size=1)
+    graph.clone(1)
+    expected_graph = CompactGraph.from_records(self.records, sort_links=True)
+    expected_graph.clone(1)
+
+    self.assertEqual(graph.to_dict(), expected_graph.to_dict())
+
+
+class TestCloneCompactGraph(TestCase):
+
+  def setUp(self):
+    # 1 has a fan-out of overlapping and independent subgraphs
+    # (5 is reachable from 2 and 3, 7 links back to 1)
+    self.input_dict = {
+      'entities': [{ 'entity_id': i, 'name': 'E{}'.format(i % 3) } for i in range(1, 11)],
+      'links': [
+        { 'from': 1, 'to': 2 },
+        { 'from': 1, 'to': 3 },
+        { 'from': 1, 'to': 4 },
+        { 'from': 1, 'to': 6 },
+        { 'from': 1, 'to': 8 },
+        { 'from': 2, 'to': 5 },
+        { 'from': 3, 'to': 5 },
+        { 'from': 5, 'to': 3 },
+        { 'from': 6, 'to': 7 },
+        { 'from': 7, 'to': 1 },
+        { 'from': 8, 'to': 9 },
+        { 'from': 9, 'to': 10 },
+        { 'from': 10, 'to': 2 },
+      ]
+    }
+
+  def assert_same_graph(self, graph, expected_graph):
+    for name in ('ids', 'name_refs', 'description_refs',
+                 'successor_offsets', 'successor_targets',
+                 'predecessor_offsets', 'predecessor_targets'):
+      self.assertEqual(list(getattr(graph, name)), list(getattr(expected_graph, name)), name)
+    self.assertEqual(graph.to_dict(), expected_graph.to_dict())
+    self.assertEqual(graph.next_entity_id, expected_graph.next_entity_id)
+
+  def test_clone_is_same_as_clone_many(self):
+    for sort_links in (False, True):
+      for use_numpy in (False, True):
+        for entity_ids in ([1], [1, 6, 1], [2, 11, 12]):
+          graph = CompactGraph.from_dict(self.input_dict, sort_links=sort_links)
+          graph.use_numpy = use_numpy
+          clone_compact_graph(graph, entity_ids, workers=2, chunk_size=2, min_entities=0)
+          expected_graph = CompactGraph.from_dict(self.input_dict, sort_links=sort_links)
+          expected_graph.clone_many(entity_ids)
+
+          self.assert_same_graph(graph, expected_graph)
+
+  def test_clone_with_extra_links(self):
+    graph = CompactGraph.from_dict(self.input_dict, sort_links=True)
+    graph.clone(4)
+    graph.link_entities_by_id(4, 9)
+    graph.use_numpy = False
+    clone_compact_graph(graph, [1, 4], workers=3, chunk_size=1, min_entities=0)
+
+    expected_graph = CompactGraph.from_dict(self.input_dict, sort_links=True)
+    expected_graph.clone(4)
+    expected_graph.link_entities_by_id(4, 9)
+    expected_graph.clone_many([1, 4])
+    self.assert_same_graph(graph, expected_graph)
+
+  def test_clone_snapshot(self):
+    directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, directory)
+    file_name = os.path.join(directory, 'graph.snapshot')
+    write_snapshot(CompactGraph.from_dict(self.input_dict, sort_links=True), file_name)
+
+    graph = load_snapshot(file_name, sort_links=True)
+    graph.use_numpy = False
+    clone_compact_graph(graph, [1], workers=2, chunk_size=2, min_entities=0)
+    expected_graph = CompactGraph.from_dict(self.input_dict, sort_links=True)
+    expected_graph.clone(1)
+
+    self.assertEqual(graph.to_dict(), expected_graph.to_dict())
+
+  def test_clone_of_small_graph_is_not_parallel(self):
+    graph = CompactGraph.from_dict(self.input_dict, sort_links=True)
+    clone_compact_graph(graph, [1], workers=2)
+    expected_graph = CompactGraph.from_dict(self.input_dict, sort_links=True)
+    expected_graph.clone(1)
+
+    self.assert_same_graph(graph, expected_graph)
@@ -0,0 +1,80 @@
+from unittest import TestCase
+
+from graphclone.graph.models import Entity
+from graphclone.graph.models import Graph
+
+
+class TestReachabilityIndex(TestCase):
+
+  def setUp(self):
+    self.input_dict = {
+      'entities': [
+        { 'entity_id': 1, 'name': 'E1' },
+        { 'entity_id': 2, 'name': 'E2' },
+        { 'entity_id': 3, 'name': 'E3' },
+        { 'entity_id': 4, 'name': 'E4' },
+      ],
+      'links': [
+        { 'from': 1, 'to': 2 },
+        { 'from': 2, 'to': 3 },
+        { 'from': 3, 'to': 2 },
+      ]
+    }
+    self.graph = Graph.from_dict(self.input_dict, sort_links=True)
+    self.index = self.graph.enable_reachability_index()
+
+  def test_get_plan(self):
+    plan = self.index.get_plan(self.graph.entities[2])
+
+    self.assertListEqual([e.id for e in plan.entities], [2, 3])
+    self.assertListEqual(list(plan.links), [0, 1, 1, 0])
+
+  def test_build(self):
+    stats = self.index.build()
+
+    self.assertEqual(stats['plans'], 4)
+    self.assertEqual(stats['entities'], 3 + 2 + 2 + 1)
+    self.assertEqual(stats['links'], 3 + 2 + 2 + 0)
+    self.assertGreater(stats['memory_bytes'], 0)
+    self.assertGreaterEqual(stats['build_seconds'], 0)
+
+  def test_clone_reuses_plan(self):
+    self.graph.clone(1)
+    self.graph.clone(1)
+
+    stats = self.index.get_stats()
+    self.assertEqual(stats['misses'], 1)
+    self.assertEqual(stats['hits'], 1)
+
+  def test_clone_matches_clone_without_index(self):
+    expected_graph = Graph.from_dict(self.input_dict, sort_links=True)
+    for graph in (self.graph, expected_graph):
+      graph.clone(2)
+      graph.clone(1)
+      graph.clone_many([2, 3])
+
+    self.assertEqual(self.graph.to_dict(), expected_graph.to_dict())
+
+  def test_link_entities_invalidates_plans_containing_entity(self):
+    self.index.build()
+
+    self.graph.link_entities_by_id(3, 4)
+
+    self.assertSetEqual(set(self.index.plans.keys()), set([4]))
+    plan = self.index.get_plan(self.graph.entities[2])
+    self.assertListEqual([e.id for e in plan.entities], [2, 3, 4])
+
+  def test_add_entity_invalidates_plans_containing_replaced_entity(self):
+    self.index.build()
+
+    self.graph.add_entity(Entity(4, 'new'))
+
+    self.assertSetEqual(set(self.index.plans.keys()), set([1, 2, 3]))
+
+  def test_clone_invalidates_plans_reaching_root_predecessors(self):
+    self.index.build()
+
+    # 3 is a predecessor of 2, so the copy becomes reachable from 1, 2 and 3
+    self.graph.clone(2)
+
+    self.assertSetEqual(set(self.index.plans.keys()), set([4]))
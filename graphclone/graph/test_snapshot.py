@@ -0,0 +1,102 @@
+import os
+import shutil
+import struct
+import tempfile
+from unittest import TestCase
+
+from graphclone.graph.models import CompactGraph
+from graphclone.graph.snapshot import SnapshotError
+from graphclone.graph.snapshot import is_snapshot
+from graphclone.graph.snapshot import load_snapshot
+from graphclone.graph.snapshot import write_snapshot
+
+
+class TestSnapshot(TestCase):
+
+  def setUp(self):
+    self.maxDiff = None
+    self.input_dict = {
+      'entities': [
+        { 'entity_id': 3, 'name': 'E3', 'description': 'Dé' },
+        { 'entity_id': 1, 'name': 'E1' },
+        { 'entity_id': 2, 'name': 'E2' },
+      ],
+      'links': [
+        { 'from': 1, 'to': 2 },
+        { 'from': 2, 'to': 3 },
+        { 'from': 3, 'to': 2 },
+      ]
+    }
+    self.directory = tempfile.mkdtemp()
+    self.file_name = os.path.join(self.directory, 'graph.snapshot')
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def write(self, graph):
+    write_snapshot(graph, self.file_name)
+    return load_snapshot(self.file_name, sort_links=graph.sort_links)
+
+  def test_load_snapshot(self):
+    graph = CompactGraph.from_dict(self.input_dict, sort_links=True)
+    snapshot_graph = self.write(graph)
+
+    self.assertTrue(is_snapshot(self.file_name))
+    self.assertIsNotNone(snapshot_graph.mapped)
+    self.assertEqual(snapshot_graph.to_dict(), graph.to_dict())
+    self.assertEqual(snapshot_graph.next_entity_id, 4)
+    self.assertEqual(snapshot_graph.index_of[3], 0)
+    self.assertFalse(snapshot_graph.has_entity(4))
+
+  def test_clone_keeps_snapshot_mapped(self):
+    for numpy_min_copies in (1, CompactGraph.numpy_min_copies):
+      graph = CompactGraph.from_dict(self.input_dict, sort_links=True)
+      snapshot_graph = self.write(graph)
+      snapshot_graph.numpy_min_copies = numpy_min_copies
+      for each in (graph, snapshot_graph):
+        each.clone_many([2, 1, 5])
+        each.add_entity(10, 'E1', 'Dé')
+        each.link_entities_by_id(10, 3)
+
+      self.assertIsNotNone(snapshot_graph.mapped)
+      self.assertEqual(snapshot_graph.ids.mapped_count, 3)
+      self.assertEqual(snapshot_graph.to_dict(), graph.to_dict())
+      # the file is not changed
+      self.assertEqual(load_snapshot(self.file_name).to_dict(),
+                       CompactGraph.from_dict(self.input_dict).to_dict())
+
+  def test_snapshot_of_cloned_snapshot_graph(self):
+    graph = CompactGraph.from_dict(self.input_dict, sort_links=True)
+    snapshot_graph = self.write(graph)
+    snapshot_graph.clone(2)
+    graph.clone(2)
+    # not written over the file the graph is mapped from
+    file_name = os.path.join(self.directory, 'cloned.snapshot')
+    write_snapshot(snapshot_graph, file_name)
+
+    self.assertEqual(load_snapshot(file_name).to_dict(), graph.to_dict())
+
+  def test_snapshot_of_cloned_graph(self):
+    graph = CompactGraph.from_dict(self.input_dict, sort_links=True)
+    # links of the root predecessors are in overflow lists
+    graph.clone(2)
+
+    self.assertEqual(self.write(graph).to_dict(), graph.to_dict())
+
+  def test_load_snapshot_with_unsorted_links(self):
+    graph = CompactGraph.from_dict(self.input_dict)
+    write_snapshot(graph, self.file_name)
+    # links of compact graphs are always sorted now, older
+    # snapshots could have been written without sorting them
+    with open(self.file_name, 'r+b') as file:
+      file.seek(12)
+      file.write(struct.pack('=I', 0))
+
+    self.assertRaises(SnapshotError, load_snapshot, self.file_name)
+
+  def test_load_snapshot_when_file_is_not_a_snapshot(self):
+    with open(self.file_name, 'w') as file:
+      file.write('{"entities": [], "links": []}')
+
+    self.assertFalse(is_snapshot(self.file_name))
+    self.assertRaises(SnapshotError, load_snapshot, self.file_name)
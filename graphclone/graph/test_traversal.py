@@ -0,0 +1,68 @@
+from unittest import TestCase
+
+from graphclone.graph.models import Graph
+from graphclone.graph.traversal import TraversalBuffer
+from graphclone.graph.traversal import TraversalBufferPool
+
+
+class TestTraversalBuffer(TestCase):
+
+  def test_start_grows_buffer(self):
+    buffer = TraversalBuffer()
+    self.assertEqual(buffer.start(10), 1)
+    self.assertGreaterEqual(len(buffer), 10)
+    self.assertGreaterEqual(len(buffer.positions), 10)
+
+    buffer.stamps[3] = buffer.epoch
+    self.assertEqual(buffer.start(5), 2)
+    self.assertNotEqual(buffer.stamps[3], buffer.epoch)
+
+  def test_start_when_epoch_wraps(self):
+    buffer = TraversalBuffer()
+    buffer.start(4)
+    buffer.epoch = TraversalBuffer.max_epoch - 1
+    buffer.start(4)
+    buffer.stamps[2] = buffer.epoch
+    buffer.start(4)
+
+    self.assertEqual(buffer.epoch, 1)
+    self.assertListEqual(list(buffer.stamps), [0] * len(buffer))
+
+
+class TestTraversalBufferPool(TestCase):
+
+  def test_get_reuses_buffers(self):
+    pool = TraversalBufferPool()
+    with pool.get(3) as buffer:
+      pass
+    with pool.get(3) as other_buffer:
+      pass
+
+    self.assertIs(buffer, other_buffer)
+    self.assertEqual(pool.created, 1)
+
+  def test_get_when_buffer_is_in_use(self):
+    pool = TraversalBufferPool()
+    with pool.get(3) as buffer:
+      with pool.get(3) as other_buffer:
+        self.assertIsNot(buffer, other_buffer)
+
+    self.assertEqual(pool.created, 2)
+    self.assertEqual(len(pool.free_buffers), 2)
+
+  def test_graph_clones_reuse_buffer(self):
+    graph = Graph.from_dict({
+      'entities': [
+        { 'entity_id': 1, 'name': 'E1' },
+        { 'entity_id': 2, 'name': 'E2' },
+      ],
+      'links': [
+        { 'from': 1, 'to': 2 },
+        { 'from': 2, 'to': 1 },
+      ]
+    })
+    for _ in range(3):
+      graph.clone(1)
+    graph.clone_many([1, 2])
+
+    self.assertEqual(graph.traversal_buffers.created, 1)
@@ -0,0 +1,72 @@
+import threading
+from array import array
+from contextlib import contextmanager
+
+
+class TraversalBuffer(object):
+  """
+  Visited marks and positions of entities (by dense index),
+  reused by traversals instead of being allocated for every one.
+
+  An entity is visited in the current traversal when its stamp
+  equals epoch, so starting a traversal only increments epoch.
+  Positions are only meaningful for visited entities.
+  """
+
+  # stamps are unsigned 32-bit integers
+  max_epoch = (1 << 32) - 1
+
+  def __init__(self):
+    self.epoch = 0
+    self.stamps = array('I')
+    self.positions = array('q')
+
+  def __len__(self):
+    return len(self.stamps)
+
+  def start(self, size):
+    """
+    Starts a traversal of entities with indexes below size,
+    growing the arrays if needed. Returns the new epoch.
+    """
+    if len(self.stamps) < size:
+      # graphs grow with every clone, grow ahead of them
+      grow = max(size - len(self.stamps), len(self.stamps) // 2)
+      self.stamps.frombytes(bytes(self.stamps.itemsize * grow))
+      self.positions.frombytes(bytes(self.positions.itemsize * grow))
+    if self.epoch == self.max_epoch:
+      self.stamps = array('I', bytes(self.stamps.itemsize * len(self.stamps)))
+      self.epoch = 0
+    self.epoch += 1
+    return self.epoch
+
+
+class TraversalBufferPool(object):
+  """
+  Pool of TraversalBuffer objects of a graph. Concurrent traversals
+  (e.g. in clone server threads) get separate buffers.
+  """
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.free_buffers = []
+    self.created = 0
+
+  @contextmanager
+  def get(self, size):
+    """
+    Context manager giving a started buffer for entities with
+    indexes below size, returned to the pool at exit.
+    """
+    with self.lock:
+      if self.free_buffers:
+        buffer = self.free_buffers.pop()
+      else:
+        buffer = TraversalBuffer()
+        self.created += 1
+    try:
+      buffer.start(size)
+      yield buffer
+    finally:
+      with self.lock:
+        self.free_buffers.append(buffer)
@@ -1,21 +1,317 @@
+import io
+import itertools
 import json
+import re
+from contextlib import nullcontext
 
+from graphclone.utils.formats import DEFAULT_FORMAT
+from graphclone.utils.formats import get_format
+from graphclone.utils.formats import read_records
 from graphclone.utils.parser import from_json_file
+from graphclone.utils.writer import write_json
+from graphclone.utils.writer import write_json_parallel
+from graphclone.graph.models import CloneSizeError
+from graphclone.graph.models import CompactGraph
 from graphclone.graph.models import Graph
+from graphclone.graph.parallel import build_compact_graph
+from graphclone.graph.parallel import clone_compact_graph
+from graphclone.graph.snapshot import is_snapshot
+from graphclone.graph.snapshot import load_snapshot
 
 
-def process(input_file, entity_id, sort_keys_and_objects=False):
+def _get_entity_filter(name_pattern, description_pattern):
+  """
+  Gets function checking if an entity's name and description match
+  the given regular expressions (None if no expression is given).
+  """
+  if name_pattern is None and description_pattern is None:
+    return None
+  name_regex = re.compile(name_pattern) if name_pattern is not None else None
+  description_regex = re.compile(description_pattern) if description_pattern is not None else None
+
+  def entity_filter(entity):
+    return (_matches(name_regex, entity.name)
+            and _matches(description_regex, entity.description))
+  return entity_filter
+
+
+def _matches(regex, value):
+  # values other than strings (e.g. no description) never match
+  return regex is None or (isinstance(value, str) and regex.search(value) is not None)
+
+
+class InputOptions(object):
+  """
+  How input of process() is read.
+  """
+
+  def __init__(self, input_format=None, extra_input_files=(), stream_input=False,
+               json_backend=None, patch_files=()):
+    """
+    :param input_format:
+      name of the input format (see graphclone.utils.formats),
+      by default chosen by the extension of every input file
+    :param extra_input_files:
+      more input files whose entities and links are added to the
+      same graph (e.g. edge lists to go with a file of entities)
+    :param stream_input:
+      if set to True, input is parsed incrementally and records are
+      added to the graph as they are read (the whole parsed json
+      is never kept in memory)
+    :param json_backend:
+      name of the json backend parsing json input that isn't streamed
+      (see graphclone.utils.json_backends), the fastest one installed
+      by default; output is the same with every backend
+    :param patch_files:
+      json files with changes of the input (see Graph.apply_patch()),
+      applied in order before cloning, so the output is the same as
+      for the changed input; the input file can be a snapshot of the
+      unchanged input, but it's rebuilt into a Graph then (every
+      entity and link is copied out of the mapped arrays, which
+      can take longer than building the graph from json)
+    """
+    self.input_format = input_format
+    self.extra_input_files = extra_input_files
+    self.stream_input = stream_input
+    self.json_backend = json_backend
+    self.patch_files = patch_files
+
+
+class CloneBounds(object):
+  """
+  Bounds of the clones made by process() (see Graph.clone()).
+  Bounds are only supported by Graph, so a snapshot input is
+  rebuilt into one, the same as with patch files.
+  """
+
+  def __init__(self, max_depth=None, max_entities=None, name_pattern=None,
+               description_pattern=None):
+    """
+    :param max_depth, max_entities:
+      bounds of the clone (see Graph.get_bounded_entities());
+      CloneSizeError is raised for clones bigger than max_entities
+    :param name_pattern, description_pattern:
+      regular expressions; entities whose name (description) doesn't
+      match are not cloned, and not traversed through
+    """
+    self.max_depth = max_depth
+    self.max_entities = max_entities
+    self.entity_filter = _get_entity_filter(name_pattern, description_pattern)
+
+  def get_clone_options(self):
+    """
+    Gets keyword arguments of Graph.clone() for the bounds
+    (empty when there are none, compact graphs don't take them).
+    """
+    if self.max_depth is None and self.max_entities is None and self.entity_filter is None:
+      return {}
+    return dict(max_depth=self.max_depth, max_entities=self.max_entities,
+                entity_filter=self.entity_filter)
+
+
+class OutputOptions(object):
+  """
+  How output of process() is written.
+  """
+
+  def __init__(self, output_format=DEFAULT_FORMAT, output_file=None):
+    """
+    :param output_format:
+      name of the output format; output of binary formats is
+      returned as bytes (and written to binary output_file)
+    :param output_file:
+      if set, output is written to this file-like object in chunks
+      as it is encoded (instead of building and returning the whole
+      string), and process() returns None
+    """
+    self.output_format = output_format
+    self.output_file = output_file
+
+
+def process(input_file, entity_id, sort_keys_and_objects=False, compact=False, workers=1,
+            input_options=None, bounds=None, output_options=None, dry_run=False,
+            sample_size=None, stats=None):
   """
   Function that processes input and returns string to be written 
-  in stdout.
+  in stdout (or writes it to the output file).
   
   :param input_file: 
-    input file
+    input file (json, or a snapshot written by
+    python -m graphclone snapshot, which is always
+    loaded as a CompactGraph)
   :param entity_id: 
-    root entity id to start cloning from
+    root entity id to start cloning from, or a list of ids
+    to clone in one pass (see Graph.clone_many())
   :param sort_keys_and_objects: 
     if set to True, enables sorting of keys and objects in output json
+  :param compact:
+    if set to True, the graph is kept in a CompactGraph
+    (array-backed, uses less memory) instead of a Graph
+  :param workers:
+    if bigger than 1, links are resolved and built by this many
+    worker processes (see graphclone.graph.parallel); the graph
+    is then always a CompactGraph and the input is streamed.
+    Clones are made by the workers (see
+    graphclone.graph.parallel.clone_compact_graph()), and json
+    output is encoded by them too (see
+    graphclone.utils.writer.write_json_parallel())
+  :param input_options:
+    InputOptions (formats, more input files, patches, ...)
+  :param bounds:
+    CloneBounds, clones are not bounded by default
+  :param output_options:
+    OutputOptions (format and file of the output)
+  :param dry_run:
+    if set to True, nothing is cloned: the output is json with
+    the number of entities and links every clone would add, and
+    their totals (see get_clone_sizes() and Graph.estimate_clone());
+    the output format is not used
+  :param sample_size:
+    with dry_run, counting stops after links of sample_size entities
+    of every clone have been counted, the counts are then only
+    lower bounds (see Graph.estimate_clone())
+  :param stats:
+    if set to a graphclone.utils.stats.Stats object, time and memory
+    of every stage (parse, build or snapshot load, clone, serialize) are recorded in
+    it, together with entity/link counts, number of cloned entities
+    and maximum traversal depth
+  """
+  def stage(name):
+    return stats.stage(name) if stats is not None else nullcontext()
+
+  input_options = input_options if input_options is not None else InputOptions()
+  bounds = bounds if bounds is not None else CloneBounds()
+  output_options = output_options if output_options is not None else OutputOptions()
+  input_format = input_options.input_format
+  extra_input_files = input_options.extra_input_files
+  patch_files = input_options.patch_files
+  output_file = output_options.output_file
+
+  graph_class = CompactGraph if compact else Graph
+  several_ids = isinstance(entity_id, (list, tuple))
+  entity_ids = entity_id if several_ids else [entity_id]
+  # a single root has its predecessors looked up by going through
+  # the graph once, instead of them being kept for every entity
+  # (several roots would need a pass each, see Graph.clone_many())
+  build_options = {} if compact or len(entity_ids) != 1 else {'track_predecessors': False}
+  input_files = [input_file] + list(extra_input_files)
+  clone_options = bounds.get_clone_options()
+  if patch_files and (compact or workers > 1):
+    raise ValueError('patches can not be applied to compact graphs')
+  if clone_options and (compact or workers > 1):
+    raise ValueError('compact graphs can only be cloned without bounds')
+  if is_snapshot(input_file):
+    if extra_input_files:
+      raise ValueError('snapshots can not be combined with other input files')
+    with stage('load'):
+      graph = load_snapshot(input_file, sort_links=sort_keys_and_objects)
+      # CompactGraph can't remove links or clone with bounds, so
+      # the whole snapshot is copied into a Graph (a full rebuild)
+      if patch_files or clone_options:
+        graph = Graph.from_graph(graph, sort_links=sort_keys_and_objects, **build_options)
+  elif (input_options.stream_input or extra_input_files or workers > 1
+        or get_format(input_format, input_file).name != DEFAULT_FORMAT):
+    # records are parsed while the graph is built
+    records = itertools.chain.from_iterable(
+      read_records(file_name, input_format) for file_name in input_files)
+    with stage('build'):
+      if workers > 1:
+        graph = build_compact_graph(records, sort_links=sort_keys_and_objects, workers=workers)
+      else:
+        graph = graph_class.from_records(
+          records, sort_links=sort_keys_and_objects, **build_options)
+  else:
+    with stage('parse'):
+      json_dict = from_json_file(input_file, input_options.json_backend)
+    with stage('build'):
+      graph = graph_class.from_dict(
+        json_dict, sort_links=sort_keys_and_objects, **build_options)
+    del json_dict
+
+  if patch_files:
+    with stage('patch'):
+      for patch_file in patch_files:
+        graph.apply_patch(from_json_file(patch_file, input_options.json_backend))
+
+  if stats is not None:
+    stats.set('entities', graph.get_entity_count())
+    stats.set('links', graph.get_link_count())
+
+  if dry_run:
+    with stage('count'):
+      count_options = dict(clone_options)
+      max_entities = count_options.pop('max_entities', None)
+      if sample_size is not None:
+        count_options['sample_size'] = sample_size
+      sizes = get_clone_sizes(graph, entity_ids, max_entities, **count_options)
+      output = json.dumps(sizes, indent=4, sort_keys=sort_keys_and_objects)
+    if output_file is not None:
+      output_file.write(output)
+      return None
+    return output
+
+  with stage('clone'):
+    if workers > 1:
+      # traversed (and copied) in worker processes, the copies are the same
+      clone_compact_graph(graph, entity_ids, workers=workers)
+    elif several_ids:
+      graph.clone_many(entity_ids, **clone_options)
+    else:
+      graph.clone(entity_id, **clone_options)
+
+  if stats is not None:
+    stats.set('cloned_entities', graph.get_entity_count() - stats.counters['entities'])
+    stats.set('max_traversal_depth', graph.max_traversal_depth)
+
+  with stage('serialize'):
+    if output_options.output_format != DEFAULT_FORMAT:
+      output_format = get_format(output_options.output_format)
+      if output_file is not None:
+        output_format.write(graph, output_file, sort_keys=sort_keys_and_objects)
+        return None
+      output = io.BytesIO() if output_format.binary else io.StringIO()
+      output_format.write(graph, output, sort_keys=sort_keys_and_objects)
+      return output.getvalue()
+    if workers > 1:
+      # encoded in worker processes, the text is the same
+      output = output_file if output_file is not None else io.StringIO()
+      write_json_parallel(graph, output, sort_keys=sort_keys_and_objects, workers=workers)
+      return None if output_file is not None else output.getvalue()
+    if output_file is not None:
+      write_json(graph, output_file, sort_keys=sort_keys_and_objects)
+      return None
+    return json.dumps(graph.to_dict(), indent=4, sort_keys=sort_keys_and_objects)
+
+
+def get_clone_sizes(graph, entity_ids, max_entities=None, **options):
+  """
+  Gets dictionary with sizes of the clones of entity_ids (in
+  order, see process()) counted with graph.estimate_clone(), and
+  their totals. Options are passed to estimate_clone().
+
+  :param max_entities:
+    CloneSizeError is raised if the clones would copy more
+    entities than this, the same as when cloning (sampled counts
+    are lower bounds, so they are checked too)
   """
-  graph = Graph.from_dict(from_json_file(input_file), sort_links=sort_keys_and_objects)
-  graph.clone(entity_id)
-  return json.dumps(graph.to_dict(), indent=4, sort_keys=sort_keys_and_objects)
\ No newline at end of file
+  sizes = {}
+  clones = []
+  for entity_id in entity_ids:
+    # clones are made from the graph as it was,
+    # so repeated ids are counted again
+    if entity_id not in sizes:
+      sizes[entity_id] = graph.estimate_clone(entity_id, **options)
+    size = sizes[entity_id]
+    if size is not None:
+      clones.append(dict(entity_id=entity_id, **size.to_dict()))
+
+  total = {
+    'entities': sum(clone['entities'] for clone in clones),
+    'links': sum(clone['links'] for clone in clones),
+    'predecessor_links': sum(clone['predecessor_links'] for clone in clones),
+    'lower_bound': any(clone['lower_bound'] for clone in clones),
+  }
+  if max_entities is not None and total['entities'] > max_entities:
+    raise CloneSizeError('clones would copy more than {} entities'.format(max_entities))
+  total['clones'] = clones
+  return total
@@ -0,0 +1,231 @@
+"""
+Long-running clone service.
+
+Graphs are loaded once and kept in memory; clone requests are served
+against them without changing them. The protocol is newline-delimited
+json over a Unix socket or TCP: every request is one json object on a
+line, answered by one json object on a line.
+
+Requests:
+
+  {"op": "clone", "graph": "name", "entity_ids": [5, 7], "sort_keys": true}
+    -> {"ok": true, "output": "<same text as execute.py prints>"}
+  {"op": "graphs"}
+    -> {"ok": true, "graphs": {"name": {"entities": 4, "links": 4}}}
+  {"op": "patch", "graph": "name", "patch": {"removed_entities": [3], ...}}
+    -> {"ok": true, "entities": 3, "links": 2}
+
+"op" defaults to "clone", and "entity_id" can be given instead of
+"entity_ids". Failed requests are answered with
+{"ok": false, "error": "..."}.
+
+Patches (see Graph.apply_patch()) change the loaded graph; they
+wait for clones in progress, and clones wait for them. With the
+reachability index, only traversals of subgraphs a patch changed
+are done again.
+"""
+import asyncio
+import io
+import json
+import threading
+
+from graphclone.graph.models import Graph, OverlayGraph
+from graphclone.graph.snapshot import is_snapshot
+from graphclone.graph.snapshot import load_snapshot
+from graphclone.utils.parser import from_json_file
+from graphclone.utils.writer import write_json
+
+# longest request line accepted by the server
+_LINE_LIMIT = 1 << 24
+
+
+class RequestError(ValueError):
+  """
+  Raised for requests that can't be served.
+  """
+
+
+class _ReadWriteLock(object):
+  """
+  Lock held by any number of readers or by one writer.
+  Writers waiting for the lock keep new readers out.
+  """
+
+  def __init__(self):
+    self.condition = threading.Condition()
+    self.readers = 0
+    self.writing = False
+    self.waiting_writers = 0
+
+  def acquire_read(self):
+    with self.condition:
+      while self.writing or self.waiting_writers:
+        self.condition.wait()
+      self.readers += 1
+
+  def release_read(self):
+    with self.condition:
+      self.readers -= 1
+      if not self.readers:
+        self.condition.notify_all()
+
+  def acquire_write(self):
+    with self.condition:
+      self.waiting_writers += 1
+      while self.writing or self.readers:
+        self.condition.wait()
+      self.waiting_writers -= 1
+      self.writing = True
+
+  def release_write(self):
+    with self.condition:
+      self.writing = False
+      self.condition.notify_all()
+
+
+class CloneServer(object):
+  """
+  Serves clone requests against graphs loaded once.
+  """
+
+  def __init__(self, graphs=None):
+    """
+    :param graphs:
+      dictionary of name -> Graph; the graphs must only be
+      changed through the server (see patch())
+    """
+    self.graphs = dict(graphs or {})
+    # clones read the graphs, patches change them
+    self.lock = _ReadWriteLock()
+
+  def load(self, name, input_file, reachability_index=False):
+    """
+    Loads graph from input_file (json or a snapshot)
+    and serves it as name.
+
+    :param reachability_index:
+      if set to True, the graph caches what clones traverse
+      (see Graph.enable_reachability_index())
+    """
+    if is_snapshot(input_file):
+      graph = Graph.from_graph(load_snapshot(input_file), sort_links=True)
+    else:
+      graph = Graph.from_dict(from_json_file(input_file), sort_links=True)
+    if reachability_index:
+      graph.enable_reachability_index()
+    self.graphs[name] = graph
+    return graph
+
+  def handle_request(self, request):
+    """
+    Serves a request (a decoded json object) and returns
+    the response (a json-serializable dictionary).
+    """
+    try:
+      if not isinstance(request, dict):
+        raise RequestError('request has to be a json object')
+      op = request.get('op', 'clone')
+      if op == 'clone':
+        return {'ok': True, 'output': self.clone(request)}
+      if op == 'patch':
+        return dict(self.patch(request), ok=True)
+      if op == 'graphs':
+        self.lock.acquire_read()
+        try:
+          return {'ok': True, 'graphs': dict(
+            (name, {'entities': graph.get_entity_count(), 'links': graph.get_link_count()})
+            for name, graph in self.graphs.items())}
+        finally:
+          self.lock.release_read()
+      raise RequestError('unknown op: {}'.format(op))
+    except (TypeError, ValueError) as e:
+      # RequestError, or values of unexpected types in the request
+      return {'ok': False, 'error': str(e)}
+    except KeyError as e:
+      # records of a patch without required keys
+      return {'ok': False, 'error': 'missing key: {}'.format(e)}
+
+  def clone(self, request):
+    """
+    Clones the requested entities on top of the requested graph
+    and returns the output, same as process() would.
+    """
+    graph = self.graphs.get(request.get('graph'))
+    if graph is None:
+      raise RequestError('unknown graph: {}'.format(request.get('graph')))
+    entity_ids = request.get('entity_ids')
+    if entity_ids is None:
+      entity_ids = [request.get('entity_id')]
+    if not isinstance(entity_ids, list):
+      raise RequestError('entity_ids has to be a list')
+
+    # the clones only go to the overlay, so concurrent
+    # requests can share the graph
+    self.lock.acquire_read()
+    try:
+      view = OverlayGraph(graph)
+      view.clone_many(entity_ids)
+      output = io.StringIO()
+      write_json(view, output, sort_keys=bool(request.get('sort_keys')))
+    finally:
+      self.lock.release_read()
+    return output.getvalue()
+
+  def patch(self, request):
+    """
+    Applies the requested patch to the requested graph and
+    returns its new numbers of entities and links.
+    """
+    graph = self.graphs.get(request.get('graph'))
+    if graph is None:
+      raise RequestError('unknown graph: {}'.format(request.get('graph')))
+    patch = request.get('patch')
+    if not isinstance(patch, dict):
+      raise RequestError('patch has to be a json object')
+
+    self.lock.acquire_write()
+    try:
+      graph.apply_patch(patch)
+    finally:
+      self.lock.release_write()
+    return {'entities': graph.get_entity_count(), 'links': graph.get_link_count()}
+
+  async def handle_connection(self, reader, writer):
+    """
+    Serves requests of a connection until it's closed.
+    Requests are handled in executor threads, so slow
+    clones don't block other connections.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+      while True:
+        line = await reader.readline()
+        if not line:
+          break
+        if not line.strip():
+          continue
+        try:
+          request = json.loads(line)
+        except ValueError as e:
+          response = {'ok': False, 'error': 'invalid json: {}'.format(e)}
+        else:
+          response = await loop.run_in_executor(None, self.handle_request, request)
+        writer.write(json.dumps(response).encode() + b'\n')
+        await writer.drain()
+    finally:
+      writer.close()
+
+  async def serve(self, socket_path=None, host='127.0.0.1', port=None):
+    """
+    Serves requests on a Unix socket (socket_path) or TCP (host, port)
+    until cancelled.
+    """
+    if socket_path is not None:
+      server = await asyncio.start_unix_server(
+        self.handle_connection, path=socket_path, limit=_LINE_LIMIT)
+    else:
+      server = await asyncio.start_server(
+        self.handle_connection, host=host, port=port, limit=_LINE_LIMIT)
+    async with server:
+      await server.serve_forever()
+
@@ -1,7 +1,24 @@
+import io
+import json
 import os
+import shutil
+import subprocess
+import sys
+import tempfile
 from unittest import TestCase
 
+from graphclone.graph.models import CloneSizeError
+from graphclone.graph.models import CompactGraph
+from graphclone.graph.models import Graph
+from graphclone.graph.snapshot import write_snapshot
+
+from graphclone.main import CloneBounds
+from graphclone.main import InputOptions
+from graphclone.main import OutputOptions
 from graphclone.main import process
+from graphclone.utils.json_backends import BACKENDS
+from graphclone.utils.parser import from_json_file
+from graphclone.utils.stats import Stats
 
 current_dir = os.path.dirname(__file__)
 
@@ -14,3 +31,220 @@ class TestProcess(TestCase):
     with open(os.path.join(current_dir, 'fixtures/output.json')) as file:
       expected_output = file.read()
       self.assertEqual(expected_output.replace(' ', ''), output_string.replace(' ', ''))
+
+  def test_process_with_compact_graph(self):
+    file_name = os.path.join(current_dir, 'fixtures/input.json')
+    output_string = process(file_name, 5, sort_keys_and_objects=True, compact=True)
+
+    with open(os.path.join(current_dir, 'fixtures/output.json')) as file:
+      expected_output = file.read()
+      self.assertEqual(expected_output, output_string)
+
+  def test_process_with_streamed_input(self):
+    file_name = os.path.join(current_dir, 'fixtures/input.json')
+    output_string = process(file_name, 5, sort_keys_and_objects=True,
+                            input_options=InputOptions(stream_input=True))
+
+    with open(os.path.join(current_dir, 'fixtures/output.json')) as file:
+      expected_output = file.read()
+      self.assertEqual(expected_output, output_string)
+
+  def test_process_with_snapshot(self):
+    directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, directory)
+    file_name = os.path.join(directory, 'input.snapshot')
+    graph = CompactGraph.from_dict(
+      from_json_file(os.path.join(current_dir, 'fixtures/input.json')), sort_links=True)
+    write_snapshot(graph, file_name)
+    output_string = process(file_name, 5, sort_keys_and_objects=True)
+
+    with open(os.path.join(current_dir, 'fixtures/output.json')) as file:
+      expected_output = file.read()
+      self.assertEqual(expected_output, output_string)
+
+  def test_process_with_csv_input_files(self):
+    file_name = os.path.join(current_dir, 'utils/fixtures/entities.csv')
+    links_file_name = os.path.join(current_dir, 'utils/fixtures/links.csv')
+    output_string = process(file_name, 5, sort_keys_and_objects=True,
+                            input_options=InputOptions(extra_input_files=[links_file_name]))
+
+    with open(os.path.join(current_dir, 'fixtures/output.json')) as file:
+      expected_output = file.read()
+      self.assertEqual(expected_output, output_string)
+
+  def test_process_with_output_format(self):
+    file_name = os.path.join(current_dir, 'fixtures/input.json')
+    output_string = process(file_name, 5, sort_keys_and_objects=True,
+                            output_options=OutputOptions(output_format='jsonl'))
+    expected_dict = json.loads(process(file_name, 5, sort_keys_and_objects=True))
+
+    self.assertEqual([json.loads(line) for line in output_string.splitlines()],
+                     expected_dict['entities'] + expected_dict['links'])
+
+  def test_process_with_patch(self):
+    file_name = os.path.join(current_dir, 'fixtures/input.json')
+    patch_file = os.path.join(current_dir, 'fixtures/patch.json')
+    patched_file = os.path.join(current_dir, 'fixtures/patched_input.json')
+
+    for entity_id in (3, 5, 7, 11, 13):
+      self.assertEqual(
+        process(file_name, entity_id, sort_keys_and_objects=True,
+                input_options=InputOptions(patch_files=[patch_file])),
+        process(patched_file, entity_id, sort_keys_and_objects=True))
+
+    with self.assertRaises(ValueError):
+      process(file_name, 5, compact=True, input_options=InputOptions(patch_files=[patch_file]))
+
+  def test_process_with_snapshot_and_patch(self):
+    directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, directory)
+    file_name = os.path.join(directory, 'input.snapshot')
+    graph = CompactGraph.from_dict(
+      from_json_file(os.path.join(current_dir, 'fixtures/input.json')), sort_links=True)
+    write_snapshot(graph, file_name)
+    patch_files = [os.path.join(current_dir, 'fixtures/patch.json')]
+    output_string = process(file_name, 5, sort_keys_and_objects=True,
+                            input_options=InputOptions(patch_files=patch_files))
+
+    self.assertEqual(output_string, process(
+      os.path.join(current_dir, 'fixtures/patched_input.json'), 5, sort_keys_and_objects=True))
+
+  def test_process_with_bounds(self):
+    file_name = os.path.join(current_dir, 'fixtures/input.json')
+    bounds = CloneBounds(max_depth=1, name_pattern='Entity[AB]')
+    output_dict = json.loads(process(file_name, 3, bounds=bounds))
+    self.assertListEqual(
+      [entity['entity_id'] for entity in output_dict['entities']], [3, 5, 7, 11, 12, 13])
+
+    bounds = CloneBounds(description_pattern='entity C')
+    output_dict = json.loads(process(file_name, 3, bounds=bounds))
+    self.assertListEqual(
+      [entity['entity_id'] for entity in output_dict['entities']], [3, 5, 7, 11, 12, 13])
+
+    with self.assertRaises(CloneSizeError):
+      process(file_name, [3], bounds=CloneBounds(max_entities=3))
+    with self.assertRaises(ValueError):
+      process(file_name, 3, compact=True, bounds=CloneBounds(max_depth=1))
+
+  def test_process_dry_run(self):
+    file_name = os.path.join(current_dir, 'fixtures/input.json')
+    output_dict = json.loads(process(file_name, [3, 5, 3], dry_run=True))
+    self.assertDictEqual(output_dict, {
+      'entities': 11, 'links': 10, 'predecessor_links': 1, 'lower_bound': False,
+      'clones': [
+        { 'entity_id': 3, 'entities': 4, 'links': 4, 'predecessor_links': 0, 'lower_bound': False },
+        { 'entity_id': 5, 'entities': 3, 'links': 2, 'predecessor_links': 1, 'lower_bound': False },
+        { 'entity_id': 3, 'entities': 4, 'links': 4, 'predecessor_links': 0, 'lower_bound': False },
+      ]
+    })
+
+    output_dict = json.loads(process(file_name, 3, compact=True, dry_run=True, sample_size=1))
+    self.assertTrue(output_dict['lower_bound'])
+    self.assertLess(output_dict['entities'], 4)
+    # sampled counts are lower bounds, so going over max_entities fails too
+    with self.assertRaises(CloneSizeError):
+      process(file_name, 3, dry_run=True, sample_size=2, bounds=CloneBounds(max_entities=1))
+
+    root_dir = os.path.dirname(current_dir)
+    result = subprocess.run(
+      [sys.executable, os.path.join(root_dir, 'execute.py'), file_name, '3',
+       '--dry-run', '--sample', '0'],
+      cwd=root_dir, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    self.assertEqual(result.returncode, 2)
+    self.assertIn(b'0 is not a positive number', result.stderr)
+
+    output_dict = json.loads(process(file_name, 3, dry_run=True, bounds=CloneBounds(max_depth=1)))
+    self.assertEqual(output_dict['entities'], 3)
+    with self.assertRaises(CloneSizeError):
+      process(file_name, 3, dry_run=True, bounds=CloneBounds(max_entities=3))
+
+  def test_process_with_workers(self):
+    file_name = os.path.join(current_dir, 'fixtures/input.json')
+    output_string = process(file_name, 5, sort_keys_and_objects=True, workers=2)
+
+    with open(os.path.join(current_dir, 'fixtures/output.json')) as file:
+      expected_output = file.read()
+      self.assertEqual(expected_output, output_string)
+
+  def test_process_with_every_json_backend(self):
+    file_name = os.path.join(current_dir, 'fixtures/input.json')
+    with open(os.path.join(current_dir, 'fixtures/output.json')) as file:
+      expected_output = file.read()
+
+    for backend in BACKENDS:
+      output_string = process(file_name, 5, sort_keys_and_objects=True,
+                              input_options=InputOptions(json_backend=backend))
+      self.assertEqual(expected_output, output_string)
+
+  def test_process_with_output_file(self):
+    file_name = os.path.join(current_dir, 'fixtures/input.json')
+    output_file = io.StringIO()
+    output_string = process(file_name, 5, sort_keys_and_objects=True,
+                            output_options=OutputOptions(output_file=output_file))
+
+    self.assertIsNone(output_string)
+    with open(os.path.join(current_dir, 'fixtures/output.json')) as file:
+      expected_output = file.read()
+      self.assertEqual(expected_output, output_file.getvalue())
+
+  def test_process_with_multiple_ids(self):
+    file_name = os.path.join(current_dir, 'fixtures/input.json')
+    output_string = process(file_name, [5, 7], sort_keys_and_objects=True)
+    output_dict = json.loads(output_string)
+
+    # 4 entities in input, 3 copies for 5 and 2 for 7
+    self.assertEqual(len(output_dict['entities']), 4 + 3 + 2)
+
+  def test_process_with_many_ids(self):
+    file_name = os.path.join(current_dir, 'fixtures/input.json')
+    entity_ids = [5, 3, 7, 5, 11, 3]
+    output_string = process(file_name, entity_ids, sort_keys_and_objects=True)
+
+    graph = Graph.from_dict(from_json_file(file_name), sort_links=True)
+    graph.clone_many(entity_ids)
+    self.assertEqual(output_string, json.dumps(graph.to_dict(), indent=4, sort_keys=True))
+
+  def test_execute_gives_same_output_for_every_graph(self):
+    directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, directory)
+    file_name = os.path.join(directory, 'input.json')
+    # ids and links in descending order
+    with open(file_name, 'w') as file:
+      json.dump({
+        'entities': [
+          { 'entity_id': 9, 'name': 'A' },
+          { 'entity_id': 5, 'name': 'C' },
+          { 'entity_id': 2, 'name': 'B' },
+        ],
+        'links': [
+          { 'from': 9, 'to': 5 },
+          { 'from': 9, 'to': 2 },
+        ]
+      }, file)
+
+    root_dir = os.path.dirname(current_dir)
+    outputs = [subprocess.check_output(
+      [sys.executable, os.path.join(root_dir, 'execute.py'), file_name, '9'] + options,
+      cwd=root_dir) for options in ([], ['--compact'], ['--workers', '2'])]
+
+    self.assertEqual(outputs[1], outputs[0])
+    self.assertEqual(outputs[2], outputs[0])
+    entities = json.loads(outputs[0])['entities']
+    # the copy of 2 comes before the copy of 5
+    self.assertEqual(entities[-2], { 'entity_id': 11, 'name': 'B' })
+
+  def test_process_with_stats(self):
+    file_name = os.path.join(current_dir, 'fixtures/input.json')
+    stats = Stats(trace_memory=False)
+    output_string = process(file_name, 5, sort_keys_and_objects=True, stats=stats)
+
+    with open(os.path.join(current_dir, 'fixtures/output.json')) as file:
+      self.assertEqual(file.read(), output_string)
+    self.assertListEqual(
+      list(stats.stages.keys()), ['parse', 'build', 'clone', 'serialize'])
+    self.assertDictEqual(stats.counters, {
+      'entities': 4,
+      'links': 4,
+      'cloned_entities': 3,
+      'max_traversal_depth': 3,
+    })
@@ -0,0 +1,99 @@
+import asyncio
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+from graphclone.main import process
+from graphclone.server import CloneServer
+
+current_dir = os.path.dirname(__file__)
+
+
+class TestCloneServer(TestCase):
+
+  def setUp(self):
+    self.input_file = os.path.join(current_dir, 'fixtures/input.json')
+    self.server = CloneServer()
+    self.graph = self.server.load('input', self.input_file)
+
+  def test_clone(self):
+    response = self.server.handle_request({
+      'graph': 'input', 'entity_id': 5, 'sort_keys': True})
+
+    with open(os.path.join(current_dir, 'fixtures/output.json')) as file:
+      self.assertDictEqual(response, {'ok': True, 'output': file.read()})
+
+  def test_clone_does_not_change_the_graph(self):
+    graph_dict = self.graph.to_dict()
+
+    for entity_ids in ([5], [3, 7]):
+      response = self.server.handle_request({
+        'graph': 'input', 'entity_ids': entity_ids})
+      self.assertEqual(
+        response['output'], process(self.input_file, entity_ids))
+
+    self.assertDictEqual(self.graph.to_dict(), graph_dict)
+
+  def test_clone_with_reachability_index(self):
+    self.server.load('indexed', self.input_file, reachability_index=True)
+    for _ in range(2):
+      response = self.server.handle_request({
+        'graph': 'indexed', 'entity_ids': [5, 3]})
+      self.assertEqual(response['output'], process(self.input_file, [5, 3]))
+
+  def test_graphs(self):
+    response = self.server.handle_request({'op': 'graphs'})
+
+    self.assertDictEqual(response, {
+      'ok': True, 'graphs': {'input': {'entities': 4, 'links': 4}}})
+
+  def test_patch(self):
+    self.server.load('indexed', self.input_file, reachability_index=True)
+    patched_file = os.path.join(current_dir, 'fixtures/patched_input.json')
+    with open(os.path.join(current_dir, 'fixtures/patch.json')) as file:
+      patch = json.load(file)
+
+    for name in ('input', 'indexed'):
+      self.server.handle_request({'graph': name, 'entity_ids': [5, 3]})
+      response = self.server.handle_request({'op': 'patch', 'graph': name, 'patch': patch})
+      self.assertDictEqual(response, {'ok': True, 'entities': 4, 'links': 4})
+      for entity_ids in ([5, 3], [13]):
+        response = self.server.handle_request({'graph': name, 'entity_ids': entity_ids})
+        self.assertEqual(response['output'], process(patched_file, entity_ids))
+
+  def test_invalid_patch_requests(self):
+    for request in ({'op': 'patch', 'graph': 'unknown', 'patch': {}},
+                    {'op': 'patch', 'graph': 'input', 'patch': []},
+                    {'op': 'patch', 'graph': 'input', 'patch': {'entities': [{'name': 'E'}]}}):
+      response = self.server.handle_request(request)
+      self.assertFalse(response['ok'])
+      self.assertIn('error', response)
+
+  def test_invalid_requests(self):
+    for request in ([], {'op': 'drop'}, {'graph': 'unknown', 'entity_id': 5},
+                    {'graph': 'input', 'entity_ids': 5}):
+      response = self.server.handle_request(request)
+      self.assertFalse(response['ok'])
+      self.assertIn('error', response)
+
+  def test_serve_on_unix_socket(self):
+    async def run(socket_path):
+      serving = asyncio.ensure_future(self.server.serve(socket_path=socket_path))
+      while not os.path.exists(socket_path):
+        await asyncio.sleep(0.01)
+      reader, writer = await asyncio.open_unix_connection(socket_path)
+      responses = []
+      for line in (b'{"op": "graphs"}\n', b'not json\n'):
+        writer.write(line)
+        await writer.drain()
+        responses.append(json.loads(await reader.readline()))
+      writer.close()
+      serving.cancel()
+      return responses
+
+    with tempfile.TemporaryDirectory() as directory:
+      responses = asyncio.run(run(os.path.join(directory, 'server.sock')))
+
+    self.assertTrue(responses[0]['ok'])
+    self.assertFalse(responses[1]['ok'])
@@ -0,0 +1,244 @@
+"""
+Registry of input/output formats.
+
+Every format reads a file as (section, record) pairs, the way
+graphclone.utils.parser.iter_json_records() does (so graphs are built
+from them with Graph.from_records() directly), and writes graphs
+providing iter_entities() and iter_links().
+
+Formats:
+
+  json     the input format (see Readme.md)
+  jsonl    one entity or link object per line (links are the objects
+           with "from" and "to", entities the ones with "entity_id")
+  csv      sections of rows, every one starting with a header row:
+           entity_id,name,description for entities and from,to for
+           links; sections are separated by empty lines, so node and
+           edge lists can also be given as separate files (empty
+           descriptions are read as no description)
+  msgpack  same structure as json, MessagePack encoded (needs the
+           msgpack package)
+"""
+import csv
+import json
+import os
+
+from graphclone.utils.parser import DEFAULT_CHUNK_SIZE
+from graphclone.utils.parser import iter_json_records
+from graphclone.utils.writer import write_json
+
+try:
+  import msgpack
+except ImportError:
+  # msgpack format is not available
+  msgpack = None
+
+
+class Format(object):
+  """
+  Input/output format.
+  """
+
+  def __init__(self, name, extensions, read_records, write, binary=False):
+    """
+    :param extensions:
+      file name extensions (with the dot) the format is used for
+    :param read_records:
+      function taking a file name and yielding (section, record) pairs
+    :param write:
+      function taking a graph, a file object and sort_keys flag,
+      writing the graph to the file
+    :param binary:
+      if set to True, files of the format are opened in binary mode
+    """
+    self.name = name
+    self.extensions = extensions
+    self.read_records = read_records
+    self.write = write
+    self.binary = binary
+
+
+# format name -> Format
+FORMATS = {}
+
+DEFAULT_FORMAT = 'json'
+
+
+def register_format(format):
+  """
+  Registers format (replacing the one with the same name).
+  """
+  FORMATS[format.name] = format
+  return format
+
+
+def get_format(name=None, file_name=None):
+  """
+  Gets format by name or, if name is not given, by extension
+  of file_name (json for unknown extensions).
+  """
+  if name is None:
+    extension = os.path.splitext(file_name or '')[1].lower()
+    for format in FORMATS.values():
+      if extension in format.extensions:
+        return format
+    name = DEFAULT_FORMAT
+  format = FORMATS.get(name)
+  if format is None:
+    raise ValueError('unknown format: {}'.format(name))
+  return format
+
+
+def read_records(file_name, format_name=None):
+  """
+  Yields (section, record) pairs of file_name, read in the
+  given format (or the one matching the file extension).
+  """
+  return get_format(format_name, file_name).read_records(file_name)
+
+
+def _iter_entity_fields(graph, sort_keys):
+  for entity_id, name, description in graph.iter_entities():
+    fields = [
+      ('entity_id', entity_id),
+      ('name', name),
+    ]
+    if description is not None:
+      fields.append(('description', description))
+    if sort_keys:
+      fields.sort()
+    yield fields
+
+
+def read_jsonl_records(file_name):
+  decoder = json.JSONDecoder()
+  with open(file_name) as file:
+    for line_number, line in enumerate(file, 1):
+      if not line.strip():
+        continue
+      record = decoder.decode(line)
+      if isinstance(record, dict) and 'entity_id' in record:
+        yield 'entities', record
+      elif isinstance(record, dict) and 'from' in record and 'to' in record:
+        yield 'links', record
+      else:
+        raise ValueError('line {}: expecting an entity or a link'.format(line_number))
+
+
+def write_jsonl(graph, file, sort_keys=False):
+  entity_lines = (json.dumps(dict(fields), sort_keys=sort_keys) + '\n'
+                  for fields in _iter_entity_fields(graph, sort_keys))
+  link_lines = (json.dumps({'from': from_id, 'to': to_id}) + '\n'
+                for from_id, to_id in graph.iter_links())
+  _write_chunks(file, entity_lines, '')
+  _write_chunks(file, link_lines, '')
+
+
+def _write_chunks(file, parts, empty, chunk_size=DEFAULT_CHUNK_SIZE):
+  """
+  Writes encoded parts (strings or bytes, the type of empty)
+  to file in chunks of roughly chunk_size.
+  """
+  chunk = []
+  chunk_length = 0
+  for part in parts:
+    chunk.append(part)
+    chunk_length += len(part)
+    if chunk_length >= chunk_size:
+      file.write(empty.join(chunk))
+      chunk = []
+      chunk_length = 0
+  file.write(empty.join(chunk))
+
+
+def _get_csv_section(header, line_number):
+  if 'entity_id' in header:
+    return 'entities'
+  if 'from' in header and 'to' in header:
+    return 'links'
+  raise ValueError('line {}: expecting entity_id or from,to columns'.format(line_number))
+
+
+def read_csv_records(file_name):
+  with open(file_name, newline='') as file:
+    reader = csv.reader(file)
+    header = None
+    for row in reader:
+      if not row:
+        # next row is the header of another section
+        header = None
+        continue
+      if header is None:
+        header = [column.strip() for column in row]
+        section = _get_csv_section(header, reader.line_num)
+        continue
+
+      record = dict(zip(header, row))
+      if section == 'entities':
+        record['entity_id'] = int(record['entity_id'])
+        if not record.get('description'):
+          record.pop('description', None)
+      else:
+        record['from'] = int(record['from'])
+        record['to'] = int(record['to'])
+      yield section, record
+
+
+def write_csv(graph, file, sort_keys=False):
+  writer = csv.writer(file, lineterminator='\n')
+  writer.writerow(['entity_id', 'name', 'description'])
+  writer.writerows(
+    (entity_id, name, '' if description is None else description)
+    for entity_id, name, description in graph.iter_entities())
+  writer.writerow([])
+  writer.writerow(['from', 'to'])
+  writer.writerows(graph.iter_links())
+
+
+def read_msgpack_records(file_name, sections=('entities', 'links')):
+  if msgpack is None:
+    raise ImportError('msgpack format needs the msgpack package')
+  with open(file_name, 'rb') as file:
+    # items are unpacked one by one, as with iter_json_records()
+    unpacker = msgpack.Unpacker(file, raw=False, strict_map_key=False)
+    # offset of the file where unpacker started
+    start = 0
+    for _ in range(unpacker.read_map_header()):
+      key = unpacker.unpack()
+      if key not in sections:
+        unpacker.skip()
+        continue
+      offset = start + unpacker.tell()
+      try:
+        count = unpacker.read_array_header()
+      except (msgpack.UnpackValueError, ValueError):
+        # values of sections that are not arrays (e.g. nil) are
+        # skipped; the pure python unpacker doesn't put back what
+        # the failed header read, so unpacking restarts at the value
+        file.seek(offset)
+        start = offset
+        unpacker = msgpack.Unpacker(file, raw=False, strict_map_key=False)
+        unpacker.skip()
+        continue
+      for _ in range(count):
+        yield key, unpacker.unpack()
+
+
+def write_msgpack(graph, file, sort_keys=False):
+  if msgpack is None:
+    raise ImportError('msgpack format needs the msgpack package')
+  packer = msgpack.Packer()
+  file.write(packer.pack_map_header(2) + packer.pack('entities')
+             + packer.pack_array_header(graph.get_entity_count()))
+  _write_chunks(file, (packer.pack(dict(fields))
+                       for fields in _iter_entity_fields(graph, sort_keys)), b'')
+  file.write(packer.pack('links') + packer.pack_array_header(graph.get_link_count()))
+  _write_chunks(file, (packer.pack({'from': from_id, 'to': to_id})
+                       for from_id, to_id in graph.iter_links()), b'')
+
+
+register_format(Format('json', ('.json',), iter_json_records, write_json))
+register_format(Format('jsonl', ('.jsonl', '.ndjson'), read_jsonl_records, write_jsonl))
+register_format(Format('csv', ('.csv',), read_csv_records, write_csv))
+register_format(Format('msgpack', ('.msgpack', '.mpk'), read_msgpack_records, write_msgpack,
+                       binary=True))
@@ -0,0 +1,117 @@
+"""
+JSON backends used to parse whole input files (see from_json_file()).
+
+orjson and ujson parse faster than the json module; the first one
+installed is used by default, json otherwise. They are wrapped to
+read the same values as json.loads(): documents orjson or ujson
+reject (NaN, Infinity, lone surrogates, ...) are parsed again with
+json.loads() (which raises its usual errors for invalid json), and
+documents with integers orjson would read as floats (beyond 64 bits)
+are parsed with json.loads() right away. ujson accepts some invalid
+json that json.loads() rejects (e.g. leading zeros).
+
+Output is always encoded with the json module: neither backend
+writes the indent=4, ASCII-only text of json.dumps() byte for byte
+(orjson has no indent=4, ujson formats floats differently).
+"""
+import json
+
+try:
+  import orjson
+except ImportError:
+  # orjson backend is not available
+  orjson = None
+
+try:
+  import ujson
+except ImportError:
+  # ujson backend is not available
+  ujson = None
+
+# backends tried (in this order) when none is chosen
+AUTO_BACKEND = 'auto'
+PREFERRED_BACKENDS = ('orjson', 'ujson', 'json')
+
+# all digits map to 0, so integers of 19 or more digits (the
+# ones that may not fit in 64 bits) are found by a substring search
+_DIGITS_TO_ZERO = bytes.maketrans(b'123456789', b'000000000')
+_LONG_NUMBER = b'0' * 19
+# bytes translated at once (documents are not copied whole)
+_SCAN_CHUNK_SIZE = 1 << 18
+
+
+class JsonBackend(object):
+  """
+  JSON parser.
+  """
+
+  def __init__(self, name, loads, binary):
+    """
+    :param loads:
+      function parsing a json document (str or bytes)
+    :param binary:
+      if set to True, files are read as bytes for the backend
+      (otherwise as text)
+    """
+    self.name = name
+    self.loads = loads
+    self.binary = binary
+
+
+def _orjson_loads(data):
+  if isinstance(data, str):
+    encoded = data.encode('utf-8', 'surrogatepass')
+  else:
+    encoded = data
+  if not _has_long_number(encoded):
+    try:
+      return orjson.loads(encoded)
+    except orjson.JSONDecodeError:
+      pass
+  return json.loads(data)
+
+
+def _has_long_number(encoded):
+  # chunks overlap, so numbers across their ends are found too
+  overlap = len(_LONG_NUMBER) - 1
+  for start in range(0, len(encoded), _SCAN_CHUNK_SIZE):
+    chunk = encoded[max(start - overlap, 0):start + _SCAN_CHUNK_SIZE]
+    if _LONG_NUMBER in chunk.translate(_DIGITS_TO_ZERO):
+      return True
+  return False
+
+
+def _ujson_loads(data):
+  try:
+    return ujson.loads(data)
+  except ValueError:
+    return json.loads(data)
+
+
+# backend name -> JsonBackend, for installed backends
+BACKENDS = {
+  'json': JsonBackend('json', json.loads, binary=False),
+}
+if orjson is not None:
+  BACKENDS['orjson'] = JsonBackend('orjson', _orjson_loads, binary=True)
+if ujson is not None:
+  BACKENDS['ujson'] = JsonBackend('ujson', _ujson_loads, binary=True)
+
+BACKEND_NAMES = (AUTO_BACKEND,) + PREFERRED_BACKENDS
+
+
+def get_backend(name=None):
+  """
+  Gets backend by name, or the first installed one of
+  PREFERRED_BACKENDS if name is None or 'auto'.
+  """
+  if name is None or name == AUTO_BACKEND:
+    for name in PREFERRED_BACKENDS:
+      if name in BACKENDS:
+        return BACKENDS[name]
+  backend = BACKENDS.get(name)
+  if backend is None:
+    if name in PREFERRED_BACKENDS:
+      raise ImportError('{} json backend needs the {} package'.format(name, name))
+    raise ValueError('unknown json backend: {}'.format(name))
+  return backend
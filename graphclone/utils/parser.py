@@ -1,8 +1,176 @@
 import json
+import re
 
-def from_json_file(file_name):
-  """ Reads and parses the file as json. """
-  with open(file_name) as file:
+from graphclone.utils.json_backends import get_backend
+
+# size of chunks read by iter_json_records()
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_ITEM_SEPARATOR = re.compile(r'[ \t\n\r]*([,\]])[ \t\n\r]*')
+# characters a number can continue with
+_NUMBER_TAIL = re.compile(r'[0-9.eE+\-]*')
+
+
+def from_json_file(file_name, backend=None):
+  """
+  Reads and parses the file as json.
+
+  :param backend:
+    name of the json backend parsing the file (see
+    graphclone.utils.json_backends), the fastest one
+    installed by default
+  """
+  backend = get_backend(backend)
+  with open(file_name, 'rb' if backend.binary else 'r') as file:
     json_string = file.read()
   
-  return json.loads(json_string)
+  return backend.loads(json_string)
+
+
+def iter_json_records(file_name, sections=('entities', 'links'), chunk_size=DEFAULT_CHUNK_SIZE):
+  """
+  Reads the file as json incrementally and yields (section, record)
+  pairs for items of the top-level arrays named in sections.
+
+  Only one record (and one chunk of the file) is kept in memory at
+  a time. Other top-level values are parsed and skipped.
+
+  :param file_name:
+    file containing a json object
+  :param sections:
+    keys of the top-level arrays whose items should be yielded
+  :param chunk_size:
+    number of characters read from the file at once
+  """
+  with open(file_name) as file:
+    reader = _JsonChunkReader(file, chunk_size)
+    reader.expect('{')
+    if reader.peek() == '}':
+      reader.expect('}')
+    else:
+      while True:
+        key = reader.decode()
+        if not isinstance(key, str):
+          raise ValueError('Expecting property name: {!r}'.format(key))
+        reader.expect(':')
+
+        if key in sections and reader.peek() == '[':
+          reader.expect('[')
+          for record in reader.iter_array():
+            yield key, record
+        else:
+          reader.decode()
+
+        if reader.expect(',}') == '}':
+          break
+
+    if reader.peek() != '':
+      raise ValueError('Extra data after json object')
+
+
+class _JsonChunkReader(object):
+  """
+  Decodes json values one by one from a file read in chunks.
+  """
+
+  def __init__(self, file, chunk_size):
+    self.file = file
+    self.chunk_size = chunk_size
+    self.decoder = json.JSONDecoder()
+    self.buffer = ''
+    self.position = 0
+    self.eof = False
+
+  def read_chunk(self, size):
+    """
+    Drops the consumed part of the buffer and appends
+    the next chunk to it. Returns False at the end of file.
+    """
+    chunk = self.file.read(size)
+    if not chunk:
+      self.eof = True
+      return False
+    self.buffer = self.buffer[self.position:] + chunk
+    self.position = 0
+    return True
+
+  def peek(self):
+    """
+    Skips whitespace and returns the next character
+    ('' at the end of file).
+    """
+    while True:
+      position = _WHITESPACE.match(self.buffer, self.position).end()
+      self.position = position
+      if position < len(self.buffer):
+        return self.buffer[position]
+      if not self.read_chunk(self.chunk_size):
+        return ''
+
+  def expect(self, chars):
+    """
+    Consumes the next character, which has to be one of chars.
+    """
+    char = self.peek()
+    if not char or char not in chars:
+      raise ValueError('Expecting one of {!r}, got {!r}'.format(chars, char))
+    self.position += 1
+    return char
+
+  def iter_array(self):
+    """
+    Decodes items of an array whose '[' has already been consumed,
+    consuming the closing ']' as well.
+    """
+    if self.peek() == ']':
+      self.position += 1
+      return
+
+    raw_decode = self.decoder.raw_decode
+    while True:
+      # fast path: item and separator are both in the buffer
+      buffer = self.buffer
+      try:
+        value, end = raw_decode(buffer, _WHITESPACE.match(buffer, self.position).end())
+      except ValueError:
+        match = None
+      else:
+        match = _ITEM_SEPARATOR.match(buffer, end)
+        if match is not None and match.end() == len(buffer):
+          match = None
+
+      if match is None:
+        value = self.decode()
+        separator = self.expect(',]')
+      else:
+        self.position = match.end()
+        separator = match.group(1)
+
+      yield value
+      if separator == ']':
+        return
+
+  def decode(self):
+    """
+    Decodes the next json value.
+    """
+    self.peek()
+    size = self.chunk_size
+    while True:
+      try:
+        value, end = self.decoder.raw_decode(self.buffer, self.position)
+      except ValueError:
+        # the value may continue in the next chunk
+        if not self.read_chunk(size):
+          raise
+      else:
+        # a number followed by nothing but number characters up to
+        # the end of the buffer (e.g. "12" of "12.5e3") may continue
+        # in the next chunk
+        buffer = self.buffer
+        if _NUMBER_TAIL.match(buffer, end).end() < len(buffer) or not self.read_chunk(size):
+          self.position = end
+          return value
+      # read bigger chunks for values spanning many of them
+      size *= 2
@@ -0,0 +1,68 @@
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+class Stats(object):
+  """
+  Collects wall time and memory of the stages of a run,
+  together with named counters.
+
+  Memory is measured with tracemalloc (started by the first stage
+  if it isn't running yet, and stopped by close()): for every stage
+  'allocated_bytes' is the memory the stage left allocated and
+  'peak_bytes' the most it had allocated at once.
+  """
+
+  def __init__(self, trace_memory=True):
+    self.trace_memory = trace_memory
+    self.stages = {}
+    self.counters = {}
+    self._started_tracing = False
+
+  @contextmanager
+  def stage(self, name):
+    """
+    Context manager measuring the code it wraps as stage name.
+    """
+    if self.trace_memory and not tracemalloc.is_tracing():
+      tracemalloc.start()
+      self._started_tracing = True
+    if self.trace_memory:
+      tracemalloc.reset_peak()
+      memory_before = tracemalloc.get_traced_memory()[0]
+
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      stage = {'seconds': time.perf_counter() - start}
+      if self.trace_memory:
+        memory_after, peak = tracemalloc.get_traced_memory()
+        stage['allocated_bytes'] = memory_after - memory_before
+        stage['peak_bytes'] = peak - memory_before
+      self.stages[name] = stage
+
+  def set(self, name, value):
+    self.counters[name] = value
+
+  def close(self):
+    """
+    Stops tracemalloc if it was started by this object.
+    """
+    if self._started_tracing:
+      tracemalloc.stop()
+      self._started_tracing = False
+
+  def to_dict(self):
+    return {
+      'stages': self.stages,
+      'counters': self.counters,
+      'total_seconds': sum(stage['seconds'] for stage in self.stages.values()),
+    }
+
+  def write(self, file):
+    """ Writes stats to file as json. """
+    json.dump(self.to_dict(), file, indent=2)
+    file.write('\n')
@@ -0,0 +1,104 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from unittest import skipIf
+
+from graphclone.graph.models import Graph
+from graphclone.utils import formats
+from graphclone.utils.formats import get_format
+from graphclone.utils.formats import read_records
+from graphclone.utils.parser import from_json_file
+
+current_dir = os.path.dirname(__file__)
+
+class TestFormats(TestCase):
+
+  def setUp(self):
+    self.maxDiff = None
+    self.input_file = os.path.join(current_dir, '../fixtures/input.json')
+    self.graph = Graph.from_dict(from_json_file(self.input_file), sort_links=True)
+
+  def read_graph(self, *file_names):
+    records = []
+    for file_name in file_names:
+      records.extend(read_records(os.path.join(current_dir, file_name)))
+    return Graph.from_records(records, sort_links=True)
+
+  def write_and_read(self, format_name):
+    directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, directory)
+    file_name = os.path.join(directory, 'graph')
+    format = get_format(format_name)
+    with open(file_name, 'wb' if format.binary else 'w') as file:
+      format.write(self.graph, file)
+    return Graph.from_records(read_records(file_name, format_name), sort_links=True)
+
+  def test_get_format(self):
+    self.assertEqual(get_format(file_name='graph.CSV').name, 'csv')
+    self.assertEqual(get_format(file_name='graph.ndjson').name, 'jsonl')
+    self.assertEqual(get_format(file_name='graph').name, 'json')
+    self.assertEqual(get_format('csv', 'graph.json').name, 'csv')
+    self.assertRaises(ValueError, get_format, 'xml')
+
+  def test_read_jsonl(self):
+    graph = self.read_graph('fixtures/input.jsonl')
+    self.assertEqual(graph.to_dict(), self.graph.to_dict())
+
+  def test_read_jsonl_when_line_is_not_a_record(self):
+    directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, directory)
+    file_name = os.path.join(directory, 'graph.jsonl')
+    with open(file_name, 'w') as file:
+      file.write('{"entity_id": 1, "name": "E1"}\n[1, 2]\n')
+
+    with self.assertRaises(ValueError):
+      list(read_records(file_name))
+
+  def test_read_csv_node_and_edge_files(self):
+    graph = self.read_graph('fixtures/entities.csv', 'fixtures/links.csv')
+    self.assertEqual(graph.to_dict(), self.graph.to_dict())
+
+  def test_write_and_read_jsonl(self):
+    self.assertEqual(self.write_and_read('jsonl').to_dict(), self.graph.to_dict())
+
+  def test_write_and_read_csv(self):
+    self.assertEqual(self.write_and_read('csv').to_dict(), self.graph.to_dict())
+
+  @skipIf(formats.msgpack is None, 'msgpack is not installed')
+  def test_write_and_read_msgpack(self):
+    self.assertEqual(self.write_and_read('msgpack').to_dict(), self.graph.to_dict())
+
+  @skipIf(formats.msgpack is None, 'msgpack is not installed')
+  def test_read_msgpack_when_section_is_not_an_array(self):
+    directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, directory)
+    document = {'links': None, 'entities': [{'entity_id': 1, 'name': 'E1'}], 'count': [1]}
+    for format_name, write in (('json', json.dump),
+                               ('msgpack', lambda value, file: file.write(formats.msgpack.packb(value)))):
+      file_name = os.path.join(directory, 'graph.' + format_name)
+      with open(file_name, 'wb' if format_name == 'msgpack' else 'w') as file:
+        write(document, file)
+
+      self.assertListEqual(list(read_records(file_name)), [('entities', {'entity_id': 1, 'name': 'E1'})])
+
+  @skipIf(formats.msgpack is None, 'msgpack is not installed')
+  def test_read_msgpack_after_several_sections_that_are_not_arrays(self):
+    directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, directory)
+    file_name = os.path.join(directory, 'graph.msgpack')
+    with open(file_name, 'wb') as file:
+      file.write(formats.msgpack.packb({'a': None, 'b': {'c': [1]}, 'd': 'text' * 1000, 'e': [1, 2]}))
+
+    records = formats.read_msgpack_records(file_name, sections=('a', 'b', 'd', 'e'))
+    self.assertListEqual(list(records), [('e', 1), ('e', 2)])
+
+  def test_write_jsonl(self):
+    output = io.StringIO()
+    formats.write_jsonl(self.graph, output, sort_keys=True)
+    lines = output.getvalue().splitlines()
+
+    self.assertEqual(lines[2], '{"description": "More details about entity C", "entity_id": 7, "name": "EntityC"}')
+    self.assertEqual(lines[4], '{"from": 3, "to": 5}')
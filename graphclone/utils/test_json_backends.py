@@ -0,0 +1,49 @@
+import json
+from unittest import TestCase
+
+from graphclone.utils import json_backends
+from graphclone.utils.json_backends import BACKENDS
+from graphclone.utils.json_backends import get_backend
+
+
+class TestJsonBackends(TestCase):
+
+  def test_backends_read_the_same_values_as_json(self):
+    documents = [
+      '{"entities": [{"entity_id": 1, "name": "E\\u00e9 \\"q\\"", "description": [1.5, null]}]}',
+      '[9223372036854775807, 18446744073709551616, -18446744073709551616, 12345678901234567890]',
+      '[NaN, Infinity, -Infinity, 1e400]',
+      '["\\ud800", "\\ud83d\\ude00"]',
+      '{"a": 1, "a": 2}',
+      '[]',
+    ]
+    for backend in BACKENDS.values():
+      for document in documents:
+        for data in (document, document.encode()):
+          self.assertEqual(repr(backend.loads(data)), repr(json.loads(document)),
+                           (backend.name, document))
+
+  def test_long_numbers_are_found_across_scanned_chunks(self):
+    # the shortest number that is checked
+    number = b'9' * 19
+    size = json_backends._SCAN_CHUNK_SIZE
+    for offset in (0, 1, len(number) - 1, len(number)):
+      encoded = b' ' * (size - offset) + number
+      self.assertTrue(json_backends._has_long_number(encoded))
+      self.assertFalse(json_backends._has_long_number(encoded[:-1]))
+      self.assertFalse(json_backends._has_long_number(encoded.replace(b'99', b' 9', 1)))
+
+  def test_backends_raise_value_error_for_invalid_json(self):
+    for backend in BACKENDS.values():
+      for document in ('{"a": 1', '[1,]', '[1] x', ''):
+        with self.assertRaises(ValueError):
+          backend.loads(document)
+
+  def test_get_backend(self):
+    self.assertIs(get_backend('json'), BACKENDS['json'])
+    self.assertIn(get_backend().name, BACKENDS)
+    self.assertIs(get_backend('auto'), get_backend())
+    if json_backends.orjson is not None:
+      self.assertEqual(get_backend().name, 'orjson')
+    with self.assertRaises(ValueError):
+      get_backend('simplejson')
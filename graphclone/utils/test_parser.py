@@ -1,7 +1,10 @@
 import os
 from unittest import TestCase
 
+from graphclone.utils.json_backends import BACKENDS
+from graphclone.utils.parser import DEFAULT_CHUNK_SIZE
 from graphclone.utils.parser import from_json_file
+from graphclone.utils.parser import iter_json_records
 
 current_dir = os.path.dirname(__file__)
 
@@ -21,3 +24,59 @@ class TestFromJsonFile(TestCase):
     json_file = os.path.join(current_dir, 'fixtures/valid.json')
     json_dict = from_json_file(json_file)
     self.assertTrue(json_dict['isValid'])
+
+  def test_from_json_file_with_every_backend(self):
+    json_file = os.path.join(current_dir, '../fixtures/input.json')
+    json_dict = from_json_file(json_file, 'json')
+    for backend in BACKENDS:
+      self.assertEqual(from_json_file(json_file, backend), json_dict)
+      with self.assertRaises(ValueError):
+        from_json_file(os.path.join(current_dir, 'fixtures/invalid.json'), backend)
+
+
+class TestIterJsonRecords(TestCase):
+
+  def setUp(self):
+    self.input_file = os.path.join(current_dir, '../fixtures/input.json')
+
+  def test_iter_json_records_when_file_does_not_exist(self):
+    json_file = os.path.join(current_dir, 'fixtures/doesnt_exist.json')
+    with self.assertRaises(IOError):
+      list(iter_json_records(json_file))
+
+  def test_iter_json_records_when_json_is_not_valid(self):
+    json_file = os.path.join(current_dir, 'fixtures/invalid.json')
+    with self.assertRaises(ValueError):
+      list(iter_json_records(json_file))
+
+  def test_iter_json_records_when_json_has_no_sections(self):
+    json_file = os.path.join(current_dir, 'fixtures/valid.json')
+    self.assertListEqual(list(iter_json_records(json_file)), [])
+
+  def test_iter_json_records_yields_all_records(self):
+    json_dict = from_json_file(self.input_file)
+    expected_records = (
+      [('entities', e) for e in json_dict['entities']] +
+      [('links', l) for l in json_dict['links']])
+
+    # small chunks split records and numbers between reads
+    for chunk_size in (1, 3, 7, DEFAULT_CHUNK_SIZE):
+      records = list(iter_json_records(self.input_file, chunk_size=chunk_size))
+      self.assertListEqual(records, expected_records)
+
+  def test_iter_json_records_with_numbers_split_between_chunks(self):
+    # numbers with fractions and exponents, in and out of sections
+    json_file = os.path.join(current_dir, 'fixtures/numbers.json')
+    json_dict = from_json_file(json_file)
+    expected_records = (
+      [('entities', e) for e in json_dict['entities']] +
+      [('links', l) for l in json_dict['links']])
+
+    for chunk_size in range(1, 33):
+      records = list(iter_json_records(json_file, chunk_size=chunk_size))
+      self.assertListEqual(records, expected_records, chunk_size)
+
+  def test_iter_json_records_only_yields_requested_sections(self):
+    records = list(iter_json_records(self.input_file, sections=('links',)))
+    self.assertTrue(records)
+    self.assertTrue(all(section == 'links' for section, _ in records))
@@ -0,0 +1,50 @@
+import io
+import json
+import tracemalloc
+from unittest import TestCase
+
+from graphclone.utils.stats import Stats
+
+
+class TestStats(TestCase):
+
+  def test_stage_records_time_and_memory(self):
+    stats = Stats()
+    with stats.stage('allocate'):
+      data = [0] * 100000
+    stats.close()
+
+    stage = stats.stages['allocate']
+    self.assertGreaterEqual(stage['seconds'], 0)
+    self.assertGreaterEqual(stage['allocated_bytes'], 100000 * 8)
+    self.assertGreaterEqual(stage['peak_bytes'], stage['allocated_bytes'])
+    self.assertFalse(tracemalloc.is_tracing())
+
+  def test_stage_without_memory_tracing(self):
+    stats = Stats(trace_memory=False)
+    with stats.stage('nothing'):
+      pass
+
+    self.assertListEqual(list(stats.stages['nothing'].keys()), ['seconds'])
+    self.assertFalse(tracemalloc.is_tracing())
+
+  def test_stage_is_recorded_when_it_raises(self):
+    stats = Stats(trace_memory=False)
+    with self.assertRaises(ValueError):
+      with stats.stage('failing'):
+        raise ValueError()
+
+    self.assertIn('failing', stats.stages)
+
+  def test_write(self):
+    stats = Stats(trace_memory=False)
+    with stats.stage('first'):
+      pass
+    stats.set('entities', 3)
+    file = io.StringIO()
+
+    stats.write(file)
+
+    stats_dict = json.loads(file.getvalue())
+    self.assertListEqual(list(stats_dict['stages'].keys()), ['first'])
+    self.assertDictEqual(stats_dict['counters'], {'entities': 3})
@@ -0,0 +1,88 @@
+import io
+import json
+from unittest import TestCase
+
+from graphclone.graph.models import CompactGraph
+from graphclone.graph.models import Graph
+from graphclone.utils.writer import write_json
+from graphclone.utils.writer import write_json_parallel
+
+
+class TestWriteJson(TestCase):
+
+  def setUp(self):
+    self.graph_dict = {
+      'entities': [
+        { 'entity_id': 1, 'name': 'E1' },
+        { 'entity_id': 2, 'name': 'Eé2 "quoted"', 'description': 'line\nbreak' },
+        { 'entity_id': 3, 'name': 'E3', 'description': { 'b': [1, 2], 'a': None } },
+      ],
+      'links': [
+        { 'from': 1, 'to': 2 },
+        { 'from': 2, 'to': 3 },
+        { 'from': 3, 'to': 1 },
+      ]
+    }
+
+  def assert_same_as_json_dumps(self, graph, sort_keys, chunk_size=1 << 16):
+    output = io.StringIO()
+    write_json(graph, output, sort_keys=sort_keys, chunk_size=chunk_size)
+    self.assertEqual(
+      output.getvalue(),
+      json.dumps(graph.to_dict(), indent=4, sort_keys=sort_keys))
+
+  def test_write_json_when_graph_is_empty(self):
+    self.assert_same_as_json_dumps(Graph(), sort_keys=False)
+    self.assert_same_as_json_dumps(Graph(), sort_keys=True)
+
+  def test_write_json_when_graph_has_no_links(self):
+    graph = Graph.from_dict({ 'entities': self.graph_dict['entities'] })
+    self.assert_same_as_json_dumps(graph, sort_keys=True)
+
+  def test_write_json(self):
+    graph = Graph.from_dict(self.graph_dict)
+    self.assert_same_as_json_dumps(graph, sort_keys=False)
+    self.assert_same_as_json_dumps(graph, sort_keys=True)
+
+  def test_write_json_in_small_chunks(self):
+    graph = Graph.from_dict(self.graph_dict)
+    self.assert_same_as_json_dumps(graph, sort_keys=True, chunk_size=1)
+
+
+class TestWriteJsonParallel(TestCase):
+
+  def setUp(self):
+    self.graph_dict = {
+      'entities': [
+        { 'entity_id': i, 'name': 'E{}'.format(i), 'description': 'é' * (i % 3) }
+        for i in range(10, 0, -1)
+      ],
+      'links': [
+        { 'from': 1, 'to': 2 },
+        { 'from': 1, 'to': 5 },
+        { 'from': 5, 'to': 1 },
+        { 'from': 9, 'to': 3 },
+      ]
+    }
+
+  def assert_same_as_write_json(self, graph, sort_keys, shard_size=1):
+    output = io.StringIO()
+    write_json_parallel(graph, output, sort_keys=sort_keys, workers=2, shard_size=shard_size)
+    expected_output = io.StringIO()
+    write_json(graph, expected_output, sort_keys=sort_keys)
+    self.assertEqual(output.getvalue(), expected_output.getvalue())
+
+  def test_write_json_parallel_when_graph_is_empty(self):
+    self.assert_same_as_write_json(Graph(), sort_keys=True)
+
+  def test_write_json_parallel(self):
+    for sort_links in (False, True):
+      graph = Graph.from_dict(self.graph_dict, sort_links)
+      graph.clone(1)
+      for shard_size in (1, 3, 100):
+        self.assert_same_as_write_json(graph, sort_keys=sort_links, shard_size=shard_size)
+
+  def test_write_json_parallel_when_graph_is_compact(self):
+    graph = CompactGraph.from_dict(self.graph_dict, sort_links=True)
+    graph.clone(5)
+    self.assert_same_as_write_json(graph, sort_keys=True, shard_size=4)
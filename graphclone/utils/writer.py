@@ -0,0 +1,169 @@
+import json
+import multiprocessing
+import os
+import sys
+from json.encoder import encode_basestring_ascii
+
+# approximate size of chunks written by write_json()
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+# entities encoded by a worker at once in write_json_parallel()
+DEFAULT_SHARD_SIZE = 1 << 15
+
+# state shared with the workers (inherited when processes are forked)
+_worker_state = {}
+
+_ENTITY_START = '\n        {\n            '
+_RECORD_END = '\n        }'
+_KEY_SEPARATOR = ',\n            '
+
+
+def write_json(graph, file=None, sort_keys=False, chunk_size=DEFAULT_CHUNK_SIZE):
+  """
+  Writes graph to file as json, producing the same text as
+  json.dumps(graph.to_dict(), indent=4, sort_keys=sort_keys)
+  without building the dictionary or the whole string.
+
+  Text is written in chunks of roughly chunk_size characters
+  as entities and links are encoded.
+
+  :param graph:
+    graph providing iter_entities() and iter_links()
+  :param file:
+    file-like object to write to (stdout by default)
+  :param sort_keys:
+    if set to True, keys of objects are sorted
+  """
+  _write_document(file, _iter_entity_texts(graph.iter_entities(), sort_keys),
+                  _iter_link_texts(graph.iter_links(), sort_keys), chunk_size)
+
+
+def write_json_parallel(graph, file=None, sort_keys=False, workers=None,
+                        shard_size=DEFAULT_SHARD_SIZE, chunk_size=DEFAULT_CHUNK_SIZE):
+  """
+  Writes the same text as write_json(), encoding it in worker
+  processes: entities (in output order) are split into shards of
+  shard_size, workers encode entities and links of every shard,
+  and the encoded shards are written in order.
+
+  Workers get the graph by forking, so where processes can't be
+  forked (or for a single worker) the graph is written by
+  write_json().
+
+  :param workers:
+    number of worker processes (number of CPUs by default)
+  :param shard_size:
+    number of entities encoded by a worker at once
+  """
+  if workers is None:
+    workers = os.cpu_count() or 1
+  count = graph.get_entity_count()
+  if workers < 2 or count <= shard_size or 'fork' not in multiprocessing.get_all_start_methods():
+    write_json(graph, file, sort_keys, chunk_size)
+    return
+
+  # sorted ids and other caches are built before forking,
+  # so workers share them instead of each building them
+  for _ in graph.iter_entities(0, 0):
+    pass
+
+  shards = [(start, min(start + shard_size, count)) for start in range(0, count, shard_size)]
+  with multiprocessing.get_context('fork').Pool(
+      workers, initializer=_init_worker, initargs=(graph, sort_keys)) as pool:
+    # imap keeps the order of shards and lets the first ones
+    # be written while the others are encoded
+    entity_texts = pool.imap(_encode_entity_shard, shards)
+    link_texts = pool.imap(_encode_link_shard, shards)
+    _write_document(file, (text for text in entity_texts if text),
+                    (text for text in link_texts if text), chunk_size)
+
+
+def _init_worker(graph, sort_keys):
+  _worker_state.update(graph=graph, sort_keys=sort_keys)
+
+
+def _encode_entity_shard(shard):
+  """
+  Encodes entities of a shard, separated the way write_json() separates them.
+  """
+  return ','.join(_iter_entity_texts(
+    _worker_state['graph'].iter_entities(*shard), _worker_state['sort_keys']))
+
+
+def _encode_link_shard(shard):
+  """
+  Encodes links of a shard, separated the way write_json() separates them.
+  """
+  return ','.join(_iter_link_texts(
+    _worker_state['graph'].iter_links(*shard), _worker_state['sort_keys']))
+
+
+def _write_document(file, entity_texts, link_texts, chunk_size):
+  """
+  Writes the document around encoded entities and links (separating
+  them with commas) in chunks of roughly chunk_size characters.
+  """
+  if file is None:
+    file = sys.stdout
+
+  chunk = ['{\n    "entities": [']
+  chunk_length = 0
+  separator = ''
+  for text in entity_texts:
+    chunk.append(separator)
+    chunk.append(text)
+    separator = ','
+    chunk_length += len(text)
+    if chunk_length >= chunk_size:
+      file.write(''.join(chunk))
+      chunk = []
+      chunk_length = 0
+
+  chunk.append('\n    ],\n    "links": [' if separator else '],\n    "links": [')
+  separator = ''
+  for text in link_texts:
+    chunk.append(separator)
+    chunk.append(text)
+    separator = ','
+    chunk_length += len(text)
+    if chunk_length >= chunk_size:
+      file.write(''.join(chunk))
+      chunk = []
+      chunk_length = 0
+
+  chunk.append('\n    ]\n}' if separator else ']\n}')
+  file.write(''.join(chunk))
+
+
+def _iter_entity_texts(entities, sort_keys):
+  for entity_id, name, description in entities:
+    fields = [
+      ('entity_id', entity_id),
+      ('name', name),
+    ]
+    if description is not None:
+      fields.append(('description', description))
+    if sort_keys:
+      fields.sort()
+
+    yield _ENTITY_START + _KEY_SEPARATOR.join(
+      '"{}": {}'.format(key, _encode(value, sort_keys)) for key, value in fields
+    ) + _RECORD_END
+
+
+def _iter_link_texts(links, sort_keys):
+  for from_id, to_id in links:
+    yield '\n        {{\n            "from": {},\n            "to": {}\n        }}'.format(
+      _encode(from_id, sort_keys), _encode(to_id, sort_keys))
+
+
+def _encode(value, sort_keys):
+  """
+  Encodes a value found at the third level of indentation
+  the same way json.dumps(..., indent=4) would.
+  """
+  if isinstance(value, str):
+    return encode_basestring_ascii(value)
+  if isinstance(value, int) and not isinstance(value, bool):
+    return int.__repr__(value)
+  return json.dumps(value, indent=4, sort_keys=sort_keys).replace('\n', '\n            ')